@@ -0,0 +1,51 @@
+"""add_jobs_table
+
+Revision ID: 3c1f9a7e5d21
+Revises: 227a03e2787e
+Create Date: 2026-10-17 09:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f9a7e5d21'
+down_revision: Union[str, Sequence[str], None] = '227a03e2787e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('jobs',
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('job_type', sa.String(length=50), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('progress', sa.Float(), nullable=True),
+        sa.Column('progress_message', sa.String(length=255), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('max_attempts', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_status_created_at', 'jobs', ['status', 'created_at'], unique=False)
+    op.create_index('ix_jobs_user_id_created_at', 'jobs', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_jobs_user_id_created_at', table_name='jobs')
+    op.drop_index('ix_jobs_status_created_at', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,71 @@
+"""add_qa_post_counters
+
+Revision ID: 4acbabee76b7
+Revises: 3c1f9a7e5d21
+Create Date: 2026-10-17 14:36:08.502117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4acbabee76b7'
+down_revision: Union[str, Sequence[str], None] = '3c1f9a7e5d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('qa_posts', sa.Column('upvotes', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('qa_posts', sa.Column('downvotes', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('qa_posts', sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+    # SQLite cannot add a column with a non-constant default, so the default is added after the backfill
+    op.add_column('qa_posts', sa.Column('last_activity_at', sa.DateTime(timezone=True), nullable=True))
+
+    # Backfill the counters from existing votes and replies
+    op.execute("""
+        UPDATE qa_posts SET
+            upvotes = (SELECT COUNT(*) FROM qa_votes
+                       WHERE qa_votes.post_id = qa_posts.id AND qa_votes.vote_type = 'up'),
+            downvotes = (SELECT COUNT(*) FROM qa_votes
+                         WHERE qa_votes.post_id = qa_posts.id AND qa_votes.vote_type = 'down'),
+            reply_count = (SELECT COUNT(*) FROM qa_posts AS replies
+                           WHERE replies.parent_post_id = qa_posts.id),
+            last_activity_at = COALESCE(
+                (SELECT MAX(replies.created_at) FROM qa_posts AS replies
+                 WHERE replies.parent_post_id = qa_posts.id),
+                qa_posts.created_at
+            )
+    """)
+
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('qa_posts', 'last_activity_at', server_default=sa.func.now())
+
+    op.create_index(
+        'ix_qa_posts_course_id_score', 'qa_posts',
+        ['course_id', sa.text('is_pinned DESC'), sa.text('(upvotes - downvotes) DESC')],
+        unique=False,
+        postgresql_where=sa.text('parent_post_id IS NULL'),
+        sqlite_where=sa.text('parent_post_id IS NULL')
+    )
+    op.create_index(
+        'ix_qa_posts_course_id_last_activity_at', 'qa_posts',
+        ['course_id', sa.text('is_pinned DESC'), sa.text('last_activity_at DESC')],
+        unique=False,
+        postgresql_where=sa.text('parent_post_id IS NULL'),
+        sqlite_where=sa.text('parent_post_id IS NULL')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_qa_posts_course_id_last_activity_at', table_name='qa_posts')
+    op.drop_index('ix_qa_posts_course_id_score', table_name='qa_posts')
+    op.drop_column('qa_posts', 'last_activity_at')
+    op.drop_column('qa_posts', 'reply_count')
+    op.drop_column('qa_posts', 'downvotes')
+    op.drop_column('qa_posts', 'upvotes')
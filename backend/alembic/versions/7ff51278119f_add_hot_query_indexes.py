@@ -0,0 +1,48 @@
+"""add_hot_query_indexes
+
+Revision ID: 7ff51278119f
+Revises: 4acbabee76b7
+Create Date: 2026-10-17 18:42:15.306914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7ff51278119f'
+down_revision: Union[str, Sequence[str], None] = '4acbabee76b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, partial index predicate per dialect)
+INDEXES = [
+    ('ix_enrollments_user_id_course_id_status', 'enrollments', ['user_id', 'course_id', 'status'], None),
+    ('ix_enrollments_course_id_status', 'enrollments', ['course_id', 'status'], None),
+    ('ix_learning_time_tracking_active_user_id_session_id', 'learning_time_tracking', ['user_id', 'session_id'],
+     {'postgresql_where': sa.text('is_active'), 'sqlite_where': sa.text('is_active = 1')}),
+    ('ix_learning_time_tracking_user_id_course_id', 'learning_time_tracking', ['user_id', 'course_id'], None),
+    ('ix_notifications_user_id_is_read_created_at', 'notifications', ['user_id', 'is_read', 'created_at'], None),
+    ('ix_analytics_events_event_type_created_at', 'analytics_events', ['event_type', 'created_at'], None),
+    ('ix_messages_parent_message_id', 'messages', ['parent_message_id'],
+     {'postgresql_where': sa.text('parent_message_id IS NOT NULL'),
+      'sqlite_where': sa.text('parent_message_id IS NOT NULL')}),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Build the indexes without blocking writes to these tables on Postgres;
+    # CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, **(where or {}))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,30 @@
+"""add_notification_email_attempts
+
+Revision ID: a9d35e2c6f18
+Revises: e6b4a1f07c93
+Create Date: 2026-10-18 00:21:47.530912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d35e2c6f18'
+down_revision: Union[str, Sequence[str], None] = 'e6b4a1f07c93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Notification emails that keep failing are given up after settings.email_max_attempts
+    op.add_column('notifications', sa.Column('email_attempts', sa.Integer(), server_default='0',
+                                             nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('notifications', 'email_attempts')
@@ -0,0 +1,48 @@
+"""add_analytics_rollup_indexes
+
+Revision ID: b5d2e8c41f07
+Revises: 7ff51278119f
+Create Date: 2026-10-17 20:05:41.118263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2e8c41f07'
+down_revision: Union[str, Sequence[str], None] = '7ff51278119f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, unique)
+INDEXES = [
+    # The rollup job writes one row per course or user and day
+    ('ix_course_analytics_course_id_date', 'course_analytics', ['course_id', 'date'], True),
+    ('ix_user_engagement_metrics_user_id_date', 'user_engagement_metrics', ['user_id', 'date'], True),
+    # Daily aggregation reads one day of each activity table
+    ('ix_users_created_at', 'users', ['created_at'], False),
+    ('ix_enrollments_created_at', 'enrollments', ['created_at'], False),
+    ('ix_enrollments_completed_at', 'enrollments', [sa.text('coalesce(updated_at, created_at)')], False),
+    ('ix_learning_sessions_started_at', 'learning_sessions', ['started_at'], False),
+    ('ix_assessment_attempts_started_at', 'assessment_attempts', ['started_at'], False),
+    ('ix_notifications_created_at', 'notifications', ['created_at'], False),
+    ('ix_analytics_events_created_at', 'analytics_events', ['created_at'], False),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # As in 7ff51278119f, build the indexes without blocking writes on Postgres
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,37 @@
+"""add_notification_email_pending
+
+Revision ID: d81c3f5a9e24
+Revises: b5d2e8c41f07
+Create Date: 2026-10-17 22:41:19.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81c3f5a9e24'
+down_revision: Union[str, Sequence[str], None] = 'b5d2e8c41f07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Notification emails now wait in the table for the digest job instead of in process memory
+    op.add_column('notifications', sa.Column('email_pending', sa.Boolean(), server_default=sa.false(),
+                                             nullable=False))
+    op.create_index(
+        'ix_notifications_email_pending', 'notifications', ['user_id'],
+        unique=False,
+        postgresql_where=sa.text('email_pending'),
+        sqlite_where=sa.text('email_pending = 1')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_notifications_email_pending', table_name='notifications')
+    op.drop_column('notifications', 'email_pending')
@@ -0,0 +1,36 @@
+"""add_jobs_periodic_pending_index
+
+Revision ID: e6b4a1f07c93
+Revises: d81c3f5a9e24
+Create Date: 2026-10-17 23:58:06.271448
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b4a1f07c93'
+down_revision: Union[str, Sequence[str], None] = 'd81c3f5a9e24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Workers racing to schedule a periodic job conflict on this index instead of both enqueuing it
+    op.add_column('jobs', sa.Column('periodic', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index(
+        'uq_jobs_periodic_pending', 'jobs', ['job_type'],
+        unique=True,
+        postgresql_where=sa.text("periodic AND status IN ('queued', 'running')"),
+        sqlite_where=sa.text("periodic = 1 AND status IN ('queued', 'running')")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_jobs_periodic_pending', table_name='jobs')
+    op.drop_column('jobs', 'periodic')
@@ -18,37 +18,24 @@ from ..models.analytics import (
 )
 from ..models.course import Course
 from ..models.learning import Enrollment, LearningSession, AssessmentAttempt
+from ..services.analytics_rollup import course_days, platform_days, platform_totals, utc_today
+from ..services.metrics_query import MetricsQuery
+from ..services.job_queue import enqueue_job, job_to_dict
 
 router = APIRouter(tags=["Analytics & Reporting"])
 
 
 # Helper functions for data aggregation
 def get_date_range(days: int = 30) -> tuple[date, date]:
-    """Get date range for analytics queries."""
-    end_date = date.today()
+    """Get date range for analytics queries (UTC days, as rolled up)."""
+    end_date = utc_today()
     start_date = end_date - timedelta(days=days)
     return start_date, end_date
 
 
-def calculate_user_retention_rate(db: Session, start_date: date, end_date: date) -> float:
-    """Calculate user retention rate for the given period."""
-    # Get users who registered before the start date
-    total_users = db.query(User).filter(
-        User.created_at < start_date,
-        User.is_active == True
-    ).count()
-    
-    if total_users == 0:
-        return 0.0
-    
-    # Get users who were active during the period
-    active_users = db.query(User).filter(
-        User.created_at < start_date,
-        User.is_active == True,
-        User.updated_at >= start_date
-    ).count()
-    
-    return (active_users / total_users) * 100 if total_users > 0 else 0.0
+def calculate_user_retention_rate(existing_users: int, retained_users: int) -> float:
+    """Share of active users registered before the period who were active during it."""
+    return (retained_users / existing_users) * 100 if existing_users > 0 else 0.0
 
 
 # Platform Overview Metrics
@@ -68,62 +55,31 @@ async def get_platform_overview(
     start_date, end_date = get_date_range(days)
     
     # User metrics
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(
-        User.is_active == True,
-        User.updated_at >= start_date
-    ).count()
-    new_registrations = db.query(User).filter(
-        User.created_at >= start_date
-    ).count()
-    retention_rate = calculate_user_retention_rate(db, start_date, end_date)
+    users = (
+        MetricsQuery(db, User)
+        .count("total")
+        .count("active", User.is_active == True, User.updated_at >= start_date)
+        .count("new_registrations", User.created_at >= start_date)
+        .count("existing", User.is_active == True, User.created_at < start_date)
+        .count("retained", User.is_active == True, User.created_at < start_date, User.updated_at >= start_date)
+        .one()
+    )
+    retention_rate = calculate_user_retention_rate(users["existing"], users["retained"])
     
     # Course metrics
-    total_courses = db.query(Course).count()
-    active_courses = db.query(Course).filter(
-        Course.is_active == True,
-        Course.status == "published"
-    ).count()
-    
-    # Enrollment metrics
-    total_enrollments = db.query(Enrollment).filter(
-        Enrollment.created_at >= start_date
-    ).count()
-    
-    completed_enrollments = db.query(Enrollment).filter(
-        Enrollment.status == "completed",
-        Enrollment.updated_at >= start_date
-    ).count()
-    
-    # Learning metrics
-    total_learning_hours = db.query(func.sum(LearningSession.duration_minutes)).filter(
-        LearningSession.created_at >= start_date
-    ).scalar() or 0
-    total_learning_hours = total_learning_hours / 60  # Convert to hours
-    
-    # Assessment metrics
-    total_assessments = db.query(AssessmentAttempt).filter(
-        AssessmentAttempt.created_at >= start_date
-    ).count()
-    
-    passed_assessments = db.query(AssessmentAttempt).filter(
-        AssessmentAttempt.passed == True,
-        AssessmentAttempt.created_at >= start_date
-    ).count()
+    courses = (
+        MetricsQuery(db, Course)
+        .count("total")
+        .count("active", Course.is_active == True, Course.status == "published")
+        .one()
+    )
     
+    # Period activity from the daily rollups, with today computed live
+    period = platform_totals(db, start_date, end_date + timedelta(days=1))
+    total_assessments = period["assessment_attempts"]
+    passed_assessments = period["assessments_passed"]
     pass_rate = (passed_assessments / total_assessments * 100) if total_assessments > 0 else 0
     
-    # Engagement metrics
-    total_messages = db.query(AnalyticsEvent).filter(
-        AnalyticsEvent.event_type == "message_sent",
-        AnalyticsEvent.created_at >= start_date
-    ).count()
-    
-    total_qa_posts = db.query(AnalyticsEvent).filter(
-        AnalyticsEvent.event_type == "qa_post_created",
-        AnalyticsEvent.created_at >= start_date
-    ).count()
-    
     return {
         "period": {
             "start_date": start_date.isoformat(),
@@ -131,26 +87,26 @@ async def get_platform_overview(
             "days": days
         },
         "users": {
-            "total": total_users,
-            "active": active_users,
-            "new_registrations": new_registrations,
+            "total": users["total"],
+            "active": users["active"],
+            "new_registrations": users["new_registrations"],
             "retention_rate": round(retention_rate, 2)
         },
         "courses": {
-            "total": total_courses,
-            "active": active_courses,
-            "enrollments": total_enrollments,
-            "completions": completed_enrollments
+            "total": courses["total"],
+            "active": courses["active"],
+            "enrollments": period["course_enrollments"],
+            "completions": period["course_completions"]
         },
         "learning": {
-            "total_hours": round(total_learning_hours, 2),
+            "total_hours": round(period["total_learning_hours"], 2),
             "assessments_attempted": total_assessments,
             "assessments_passed": passed_assessments,
             "pass_rate": round(pass_rate, 2)
         },
         "engagement": {
-            "messages_sent": total_messages,
-            "qa_posts_created": total_qa_posts
+            "messages_sent": period["total_messages_sent"],
+            "qa_posts_created": period["qa_posts_created"]
         }
     }
 
@@ -172,45 +128,55 @@ async def get_course_analytics(
     
     start_date, end_date = get_date_range(days)
     
-    query = db.query(Course).options(joinedload(Course.enrollments))
-    
+    query = db.query(Course)
     if course_id:
         query = query.filter(Course.id == course_id)
-    
     courses = query.all()
     
+    # Current enrollment totals per course
+    enrollment_query = (
+        MetricsQuery(db, Enrollment)
+        .count("total")
+        .count("completed", Enrollment.status == "completed")
+        .group_by(Enrollment.course_id)
+    )
+    if course_id:
+        enrollment_query = enrollment_query.filter(Enrollment.course_id == course_id)
+    enrollment_totals = enrollment_query.all()
+    
+    # Period activity per course from the daily rollups, with today computed live
+    no_activity = {"new_enrollments": 0, "sessions": 0, "minutes": 0.0, "attempts": 0, "passed": 0, "score": 0.0}
+    activity = {}
+    for (activity_course_id, _), day in course_days(db, start_date, end_date + timedelta(days=1), course_id).items():
+        totals = activity.setdefault(activity_course_id, dict(no_activity))
+        totals["new_enrollments"] += day["new_enrollments"]
+        totals["sessions"] += day["total_views"]
+        totals["minutes"] += day["average_time_spent"] * day["total_views"]
+        totals["attempts"] += day["total_assessments"]
+        totals["passed"] += day["passed_assessments"]
+        totals["score"] += day["average_score"] * day["total_assessments"]
+    
+    # Distinct learners over the period cannot be summed from daily counts
+    learner_query = (
+        MetricsQuery(db, LearningSession)
+        .count_distinct("learners", LearningSession.user_id)
+        .filter(LearningSession.started_at >= start_date)
+        .group_by(LearningSession.course_id)
+    )
+    if course_id:
+        learner_query = learner_query.filter(LearningSession.course_id == course_id)
+    unique_learners = learner_query.all()
+    
     course_analytics = []
     for course in courses:
-        # Enrollment metrics
-        total_enrollments = len(course.enrollments)
-        recent_enrollments = len([
-            e for e in course.enrollments 
-            if e.created_at.date() >= start_date
-        ])
-        completions = len([
-            e for e in course.enrollments 
-            if e.status == "completed"
-        ])
+        enrollment_counts = enrollment_totals.get(course.id, enrollment_query.zero())
+        total_enrollments, completions = enrollment_counts["total"], enrollment_counts["completed"]
         completion_rate = (completions / total_enrollments * 100) if total_enrollments > 0 else 0
-        
-        # Learning sessions for this course
-        learning_sessions = db.query(LearningSession).join(Enrollment).filter(
-            Enrollment.course_id == course.id,
-            LearningSession.created_at >= start_date
-        ).all()
-        
-        total_learning_time = sum(session.duration_minutes for session in learning_sessions) / 60
-        unique_learners = len(set(session.user_id for session in learning_sessions))
-        
-        # Assessment attempts for this course
-        assessment_attempts = db.query(AssessmentAttempt).join(Enrollment).filter(
-            Enrollment.course_id == course.id,
-            AssessmentAttempt.created_at >= start_date
-        ).all()
-        
-        total_attempts = len(assessment_attempts)
-        passed_attempts = len([a for a in assessment_attempts if a.passed])
-        avg_score = sum(a.score for a in assessment_attempts) / total_attempts if total_attempts > 0 else 0
+        totals = activity.get(course.id, no_activity)
+        total_learning_time = totals["minutes"] / 60
+        total_attempts = totals["attempts"]
+        passed_attempts = totals["passed"]
+        avg_score = totals["score"] / total_attempts if total_attempts > 0 else 0
         
         course_analytics.append({
             "course_id": course.id,
@@ -220,14 +186,14 @@ async def get_course_analytics(
             "status": course.status,
             "enrollments": {
                 "total": total_enrollments,
-                "recent": recent_enrollments,
+                "recent": totals["new_enrollments"],
                 "completions": completions,
                 "completion_rate": round(completion_rate, 2)
             },
             "learning": {
                 "total_hours": round(total_learning_time, 2),
-                "unique_learners": unique_learners,
-                "average_session_duration": round(total_learning_time / len(learning_sessions), 2) if learning_sessions else 0
+                "unique_learners": unique_learners.get(course.id, learner_query.zero())["learners"],
+                "average_session_duration": round(total_learning_time / totals["sessions"], 2) if totals["sessions"] else 0
             },
             "assessments": {
                 "total_attempts": total_attempts,
@@ -270,40 +236,47 @@ async def get_user_engagement_analytics(
     
     users = query.all()
     
+    # Period activity per user, one query per table
+    session_query = (
+        MetricsQuery(db, LearningSession)
+        .count("count")
+        .sum("minutes", LearningSession.duration_minutes)
+        .filter(LearningSession.started_at >= start_date)
+        .group_by(LearningSession.user_id)
+    )
+    attempt_query = (
+        MetricsQuery(db, AssessmentAttempt)
+        .count("count")
+        .count("passed", AssessmentAttempt.passed == True)
+        .avg("score", AssessmentAttempt.score)
+        .filter(AssessmentAttempt.started_at >= start_date)
+        .group_by(AssessmentAttempt.user_id)
+    )
+    enrollment_query = (
+        MetricsQuery(db, Enrollment)
+        .count("count")
+        .count("completed", Enrollment.status == "completed")
+        .filter(Enrollment.created_at >= start_date)
+        .group_by(Enrollment.user_id)
+    )
+    login_query = (
+        MetricsQuery(db, AnalyticsEvent)
+        .count("count")
+        .filter(AnalyticsEvent.event_type == "login", AnalyticsEvent.created_at >= start_date)
+        .group_by(AnalyticsEvent.user_id)
+    )
+    sessions = session_query.all()
+    attempts = attempt_query.all()
+    enrollments = enrollment_query.all()
+    logins = login_query.all()
+    
     engagement_data = []
     for user in users:
-        # Learning sessions
-        learning_sessions = db.query(LearningSession).filter(
-            LearningSession.user_id == user.id,
-            LearningSession.created_at >= start_date
-        ).all()
-        
-        total_learning_time = sum(session.duration_minutes for session in learning_sessions) / 60
-        session_count = len(learning_sessions)
-        
-        # Assessment attempts
-        assessment_attempts = db.query(AssessmentAttempt).filter(
-            AssessmentAttempt.user_id == user.id,
-            AssessmentAttempt.created_at >= start_date
-        ).all()
-        
-        passed_assessments = len([a for a in assessment_attempts if a.passed])
-        avg_score = sum(a.score for a in assessment_attempts) / len(assessment_attempts) if assessment_attempts else 0
-        
-        # Enrollments
-        enrollments = db.query(Enrollment).filter(
-            Enrollment.user_id == user.id,
-            Enrollment.created_at >= start_date
-        ).all()
-        
-        completed_courses = len([e for e in enrollments if e.status == "completed"])
-        
-        # Analytics events for engagement
-        login_events = db.query(AnalyticsEvent).filter(
-            AnalyticsEvent.user_id == user.id,
-            AnalyticsEvent.event_type == "login",
-            AnalyticsEvent.created_at >= start_date
-        ).count()
+        user_sessions = sessions.get(user.id, session_query.zero())
+        user_attempts = attempts.get(user.id, attempt_query.zero())
+        user_enrollments = enrollments.get(user.id, enrollment_query.zero())
+        total_learning_time = user_sessions["minutes"] / 60
+        avg_score = float(user_attempts["score"] or 0)
         
         engagement_data.append({
             "user_id": user.id,
@@ -311,13 +284,13 @@ async def get_user_engagement_analytics(
             "role": user.role,
             "is_active": user.is_active,
             "engagement": {
-                "login_count": login_events,
+                "login_count": logins.get(user.id, login_query.zero())["count"],
                 "learning_hours": round(total_learning_time, 2),
-                "session_count": session_count,
-                "courses_enrolled": len(enrollments),
-                "courses_completed": completed_courses,
-                "assessments_attempted": len(assessment_attempts),
-                "assessments_passed": passed_assessments,
+                "session_count": user_sessions["count"],
+                "courses_enrolled": user_enrollments["count"],
+                "courses_completed": user_enrollments["completed"],
+                "assessments_attempted": user_attempts["count"],
+                "assessments_passed": user_attempts["passed"],
                 "average_score": round(avg_score, 2)
             }
         })
@@ -333,6 +306,14 @@ async def get_user_engagement_analytics(
 
 
 # Time Series Data
+TIMESERIES_METRICS = {
+    "users": "new_registrations",
+    "enrollments": "course_enrollments",
+    "completions": "course_completions",
+    "learning_hours": "total_learning_hours"
+}
+
+
 @router.get("/timeseries")
 async def get_timeseries_data(
     metric: str = Query(..., description="Metric to retrieve: users, enrollments, completions, learning_hours"),
@@ -350,85 +331,37 @@ async def get_timeseries_data(
     
     start_date, end_date = get_date_range(days)
     
-    # Determine date grouping based on granularity
+    # Determine the period each day is grouped into (weeks start on Monday)
     if granularity == "daily":
-        date_format = "%Y-%m-%d"
-        date_trunc = "day"
+        bucket = lambda day: day
     elif granularity == "weekly":
-        date_format = "%Y-%U"  # Year-Week
-        date_trunc = "week"
+        bucket = lambda day: day - timedelta(days=day.weekday())
     elif granularity == "monthly":
-        date_format = "%Y-%m"
-        date_trunc = "month"
+        bucket = lambda day: day.replace(day=1)
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid granularity. Use: daily, weekly, monthly"
         )
     
-    timeseries_data = []
-    
-    if metric == "users":
-        # New user registrations over time
-        result = db.query(
-            func.date_trunc(date_trunc, User.created_at).label('date'),
-            func.count(User.id).label('count')
-        ).filter(
-            User.created_at >= start_date
-        ).group_by(
-            func.date_trunc(date_trunc, User.created_at)
-        ).order_by('date').all()
-        
-        timeseries_data = [{"date": row.date.isoformat(), "value": row.count} for row in result]
-    
-    elif metric == "enrollments":
-        # Course enrollments over time
-        result = db.query(
-            func.date_trunc(date_trunc, Enrollment.created_at).label('date'),
-            func.count(Enrollment.id).label('count')
-        ).filter(
-            Enrollment.created_at >= start_date
-        ).group_by(
-            func.date_trunc(date_trunc, Enrollment.created_at)
-        ).order_by('date').all()
-        
-        timeseries_data = [{"date": row.date.isoformat(), "value": row.count} for row in result]
-    
-    elif metric == "completions":
-        # Course completions over time
-        result = db.query(
-            func.date_trunc(date_trunc, Enrollment.updated_at).label('date'),
-            func.count(Enrollment.id).label('count')
-        ).filter(
-            Enrollment.status == "completed",
-            Enrollment.updated_at >= start_date
-        ).group_by(
-            func.date_trunc(date_trunc, Enrollment.updated_at)
-        ).order_by('date').all()
-        
-        timeseries_data = [{"date": row.date.isoformat(), "value": row.count} for row in result]
-    
-    elif metric == "learning_hours":
-        # Learning hours over time
-        result = db.query(
-            func.date_trunc(date_trunc, LearningSession.created_at).label('date'),
-            func.sum(LearningSession.duration_minutes).label('total_minutes')
-        ).filter(
-            LearningSession.created_at >= start_date
-        ).group_by(
-            func.date_trunc(date_trunc, LearningSession.created_at)
-        ).order_by('date').all()
-        
-        timeseries_data = [
-            {"date": row.date.isoformat(), "value": round(row.total_minutes / 60, 2)} 
-            for row in result
-        ]
-    
-    else:
+    if metric not in TIMESERIES_METRICS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid metric. Use: users, enrollments, completions, learning_hours"
         )
+    field = TIMESERIES_METRICS[metric]
+    
+    # Daily values from the rollups, with today computed live; days without rows count as zero
+    daily = platform_days(db, start_date, end_date + timedelta(days=1))
+    totals = {}
+    for offset in range(days + 1):
+        day = start_date + timedelta(days=offset)
+        totals[bucket(day)] = totals.get(bucket(day), 0) + (daily[day][field] if day in daily else 0)
+    
+    timeseries_data = [
+        {"date": period.isoformat(), "value": round(value, 2) if metric == "learning_hours" else value}
+        for period, value in sorted(totals.items())
+    ]
     
     return {
         "metric": metric,
@@ -442,6 +375,23 @@ async def get_timeseries_data(
     }
 
 
+# Rollup refresh
+@router.post("/rollup", status_code=status.HTTP_202_ACCEPTED)
+async def refresh_analytics_rollup(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue an analytics rollup now instead of waiting for the schedule."""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    
+    job = enqueue_job(db, "rollup_analytics", {}, user_id=current_user.id)
+    return job_to_dict(job)
+
+
 # Export functionality
 @router.get("/export")
 async def export_analytics_data(
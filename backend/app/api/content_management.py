@@ -3,6 +3,7 @@ Course Content Management API
 Handles RAG-based content generation, document processing, and content management
 """
 
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
@@ -14,7 +15,9 @@ from ..models.user import User
 from ..models.course import Course, CourseFileContent, CourseContent, CourseModule
 from ..models.ai import ContentGeneration
 # from ..services.rag_service import RAGService  # Temporarily disabled
+from ..services.simple_rag_service import SimpleRAGService
 from ..services.pdf_processor import PDFProcessor, CourseAccessManager
+from ..services.job_queue import enqueue_job
 
 router = APIRouter()
 
@@ -38,10 +41,10 @@ class ContentGenerationResponse(BaseModel):
 class DocumentProcessRequest(BaseModel):
     content_id: int
 
-class DocumentProcessResponse(BaseModel):
+class JobAcceptedResponse(BaseModel):
     status: str
-    document_id: str
-    chunks_created: int
+    job_id: str
+    status_url: str
     message: str
 
 class ContentSearchRequest(BaseModel):
@@ -84,39 +87,95 @@ class ModuleContentResponse(BaseModel):
 
 
 # Document Processing Endpoints
-@router.post("/documents/{content_id}/process", response_model=DocumentProcessResponse)
+@router.post("/documents/{content_id}/process", response_model=JobAcceptedResponse,
+             status_code=status.HTTP_202_ACCEPTED)
 async def process_document(
     content_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Process uploaded document and create embeddings for RAG"""
+    """Queue an uploaded document for processing and embedding for RAG"""
     if current_user.role not in ["instructor", "admin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only instructors can process documents"
         )
     
+    document = db.query(CourseFileContent).filter(
+        CourseFileContent.id == content_id,
+        CourseFileContent.instructor_id == current_user.id
+    ).first()
+    
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found or access denied"
+        )
+    
     try:
-        # RAG service temporarily disabled
-        # rag_service = RAGService(db)
-        # result = rag_service.process_uploaded_document(content_id, current_user.id)
-        
-        # if "error" in result:
-        #     raise HTTPException(status_code=400, detail=result["error"])
-        
-        # return DocumentProcessResponse(**result)
-        return DocumentProcessResponse(
-            status="success",
-            document_id=f"doc_{content_id}",
-            chunks_created=0,
-            message="Document processing temporarily disabled - RAG service not available"
+        job = enqueue_job(
+            db, "process_document",
+            {"content_id": content_id, "instructor_id": current_user.id},
+            user_id=current_user.id
+        )
+        return JobAcceptedResponse(
+            status="accepted",
+            job_id=job.id,
+            status_url=f"/api/jobs/{job.id}",
+            message="Document queued for processing"
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.delete("/documents/{content_id}")
+async def deactivate_document(
+    content_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Deactivate a document and drop its embeddings from the vector store"""
+    if current_user.role not in ["instructor", "admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only instructors can deactivate documents"
+        )
+    
+    try:
+        query = db.query(CourseFileContent).filter(CourseFileContent.id == content_id)
+        if current_user.role != "admin":
+            query = query.filter(CourseFileContent.instructor_id == current_user.id)
+        document = query.first()
+        
+        if not document:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found or access denied"
+            )
+        
+        document.is_active = False
+        db.commit()
+        
+        # Rewriting the vector store shards blocks; keep it off the event loop
+        chunks_removed = await asyncio.to_thread(
+            SimpleRAGService(db).remove_document, content_id, document.course_id
+        )
+        
+        return {
+            "status": "success",
+            "document_id": f"doc_{content_id}",
+            "chunks_removed": chunks_removed,
+            "message": "Document deactivated"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/documents/upload", response_model=CourseContentResponse)
 async def upload_document(
     course_id: int = Form(...),
@@ -240,14 +299,15 @@ async def get_course_documents(
 
 
 # Content Generation Endpoints
-@router.post("/courses/{course_id}/generate-content", response_model=ContentGenerationResponse)
+@router.post("/courses/{course_id}/generate-content", response_model=JobAcceptedResponse,
+             status_code=status.HTTP_202_ACCEPTED)
 async def generate_course_content(
     course_id: int,
     request: ContentGenerationRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Generate course content using RAG and AI"""
+    """Queue course content generation using RAG and AI"""
     if current_user.role not in ["instructor", "admin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -267,20 +327,29 @@ async def generate_course_content(
                 detail="Course not found or access denied"
             )
         
-        # RAG service temporarily disabled
-        # rag_service = RAGService(db)
-        # result = rag_service.generate_course_content(...)
-        
-        # Mock response for now
-        return ContentGenerationResponse(
-            status="success",
-            content="RAG content generation temporarily disabled. Please install AI dependencies to enable this feature.",
-            content_type=request.content_type,
-            generation_id=0,
-            sources_used=0,
-            model_used="disabled"
+        # The result is saved as a ContentGeneration and returned with the job
+        job = enqueue_job(
+            db, "generate_content",
+            {
+                "course_id": course_id,
+                "instructor_id": current_user.id,
+                "content_type": request.content_type,
+                "title": request.title,
+                "description": request.description,
+                "additional_instructions": request.additional_instructions,
+                "use_rag": request.use_rag
+            },
+            user_id=current_user.id
+        )
+        return JobAcceptedResponse(
+            status="accepted",
+            job_id=job.id,
+            status_url=f"/api/jobs/{job.id}",
+            message="Content generation queued"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -414,8 +483,8 @@ async def search_course_content(
                     detail="Access denied"
                 )
         
-        # Search using RAG
-        rag_service = RAGService(db)
+        # Search using RAG (course shard only)
+        rag_service = SimpleRAGService(db)
         results = rag_service.search_course_content(
             course_id=course_id,
             query=request.query,
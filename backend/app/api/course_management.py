@@ -3,13 +3,14 @@ Course Management API Endpoints
 Handles PDF upload, access control, and course management
 """
 
+import asyncio
 from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from datetime import datetime
 
-from ..core.database import get_db
+from ..core.database import get_db, SessionLocal
 from ..core.auth import get_current_user
 from ..models.user import User, UserProfile
 from ..models.course import Course, CourseFileContent
@@ -17,6 +18,9 @@ from ..models.learning import Enrollment
 from ..services.pdf_processor import PDFProcessor, CourseAccessManager, LearningTimeTracker
 from ..services.ai_content_generator import AIContentGenerator
 from ..services.knowledge_test_generator import KnowledgeTestGenerator, LearningAnalytics
+from ..services.simple_rag_service import SimpleRAGService
+from ..services.job_queue import enqueue_job
+from ..services.generation_stream import sse_response, stream_generation
 from ..models.course import CourseModule, CourseContent
 from ..schemas.course import CourseCreate, CourseResponse, CourseFileContentResponse, AccessGrantRequest
 from pydantic import BaseModel
@@ -30,6 +34,7 @@ class ContentTweakRequest(BaseModel):
     title: str
     description: str
     additional_instructions: str = ""
+    stream: bool = False  # Send the generated text as server-sent events
 
 
 @router.post("/upload-pdf")
@@ -465,6 +470,7 @@ async def delete_course(
 
         # Delete related content files
         content_files = db.query(CourseFileContent).filter(CourseFileContent.course_id == course_id).all()
+        document_ids = [content.id for content in content_files]
         for content in content_files:
             db.delete(content)
 
@@ -477,6 +483,11 @@ async def delete_course(
         db.delete(course)
         db.commit()
 
+        # Drop the deleted documents' embeddings from the vector store, off the event loop
+        rag_service = SimpleRAGService(db)
+        for document_id in document_ids:
+            await asyncio.to_thread(rag_service.remove_document, document_id, course_id)
+
         return {"message": f"Course '{course.title}' deleted successfully"}
 
     except Exception as e:
@@ -484,7 +495,7 @@ async def delete_course(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/{course_id}/content/{content_id}/create-test")
+@router.post("/{course_id}/content/{content_id}/create-test", status_code=202)
 async def create_knowledge_test(
     course_id: int,
     content_id: int,
@@ -494,25 +505,30 @@ async def create_knowledge_test(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Create AI-powered knowledge test from uploaded content (instructor only)"""
+    """Queue an AI-powered knowledge test from uploaded content (instructor only)"""
     if current_user.role not in ["instructor", "admin"]:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     try:
-        generator = KnowledgeTestGenerator()
-        result = await generator.generate_knowledge_test(
-            course_id=course_id,
-            content_id=content_id,
-            question_count=question_count,
-            passing_score=passing_score,
-            time_limit=time_limit,
-            db=db
+        # Generation runs in a background job; the test is in the job result
+        job = enqueue_job(
+            db, "create_test",
+            {
+                "course_id": course_id,
+                "content_id": content_id,
+                "question_count": question_count,
+                "passing_score": passing_score,
+                "time_limit": time_limit
+            },
+            user_id=current_user.id
         )
         
-        if result["status"] == "error":
-            raise HTTPException(status_code=400, detail=result["message"])
-        
-        return result
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "status_url": f"/api/jobs/{job.id}",
+            "message": "Knowledge test generation queued"
+        }
         
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -592,7 +608,11 @@ async def tweak_course_content(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Tweak uploaded content to generate learning materials, lesson plans, or tests"""
+    """Tweak uploaded content to generate learning materials, lesson plans, or tests.
+
+    With stream set, the generated text is sent as server-sent events and the
+    new content entry is created when the stream completes.
+    """
     if current_user.role not in ["instructor", "admin"]:
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
@@ -610,61 +630,71 @@ async def tweak_course_content(
         # Generate content using AI
         ai_generator = AIContentGenerator()
         
-        # Process the original content for AI generation
-        original_text = ai_generator.process_content_for_ai(original_content)
+        # Process the original content for AI generation (PDF parsing runs off the event loop)
+        original_text = await asyncio.to_thread(ai_generator.process_content_for_ai, original_content)
         
         # Generate new content based on the tweak request
         if request.content_type == "learning_material":
-            ai_result = ai_generator.generate_learning_material(
+            ai_result = await ai_generator.generate_learning_material(
                 original_text, 
                 request.title, 
                 request.description,
-                request.additional_instructions
+                request.additional_instructions,
+                stream=request.stream
             )
         elif request.content_type == "lesson_plan":
-            ai_result = ai_generator.generate_lesson_plan(
+            ai_result = await ai_generator.generate_lesson_plan(
                 original_text, 
                 request.title, 
                 request.description,
-                request.additional_instructions
+                request.additional_instructions,
+                stream=request.stream
             )
         elif request.content_type == "test":
-            ai_result = ai_generator.generate_knowledge_test(
+            ai_result = await ai_generator.generate_knowledge_test(
                 original_text, 
                 request.title, 
                 request.description,
-                request.additional_instructions
+                request.additional_instructions,
+                stream=request.stream
             )
         else:
             raise HTTPException(status_code=400, detail="Invalid content type")
         
+        original_fields = {
+            "file_path": original_content.file_path,
+            "file_size": original_content.file_size,
+            "page_count": original_content.page_count,
+            "file_metadata": original_content.file_metadata
+        }
+        
+        if request.stream:
+            instructor_id = current_user.id
+            
+            def save(content: str) -> dict:
+                # The stream outlives the request's session
+                session = SessionLocal()
+                try:
+                    new_content = _save_tweaked_content(
+                        session, course_id, content_id, instructor_id, request, original_fields,
+                        {**ai_result, "content": content, "status": "success"}
+                    )
+                    return {"content_id": new_content.id, "title": new_content.title}
+                finally:
+                    session.close()
+            
+            start = {
+                "content_type": request.content_type,
+                "source_title": original_content.title,
+                "ai_model": ai_result.get("ai_model", "unknown")
+            }
+            return sse_response(stream_generation(ai_result["chunks"], start, save))
+        
         # Create new content entry
-        new_content = CourseFileContent(
-            course_id=course_id,
-            instructor_id=current_user.id,
-            title=request.title,
-            description=request.description,
-            content_type=request.content_type,
-            file_path=original_content.file_path,  # Reference original file
-            file_size=original_content.file_size,
-            page_count=original_content.page_count,
-            file_metadata={
-                **(original_content.file_metadata or {}),
-                "tweaked_from": content_id,
-                "tweak_type": request.content_type,
-                "additional_instructions": request.additional_instructions,
-                "generated_at": datetime.now().isoformat(),
-                "ai_generated_content": ai_result.get("content", ""),
-                "ai_model": ai_result.get("ai_model", "unknown"),
-                "generation_status": ai_result.get("status", "unknown")
-            },
-            is_active=True
+        new_content = _save_tweaked_content(
+            db, course_id, content_id, current_user.id, request, original_fields, ai_result
         )
         
-        db.add(new_content)
-        db.commit()
-        db.refresh(new_content)
-        
         return {
             "content_id": new_content.id,
             "title": new_content.title,
@@ -680,6 +710,38 @@ async def tweak_course_content(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def _save_tweaked_content(db: Session, course_id: int, content_id: int, instructor_id: int,
+                          request: ContentTweakRequest, original_fields: Dict[str, Any],
+                          ai_result: Dict[str, Any]) -> CourseFileContent:
+    """Create the content entry for a tweak, referencing the original file"""
+    new_content = CourseFileContent(
+        course_id=course_id,
+        instructor_id=instructor_id,
+        title=request.title,
+        description=request.description,
+        content_type=request.content_type,
+        file_path=original_fields["file_path"],  # Reference original file
+        file_size=original_fields["file_size"],
+        page_count=original_fields["page_count"],
+        file_metadata={
+            **(original_fields["file_metadata"] or {}),
+            "tweaked_from": content_id,
+            "tweak_type": request.content_type,
+            "additional_instructions": request.additional_instructions,
+            "generated_at": datetime.now().isoformat(),
+            "ai_generated_content": ai_result.get("content", ""),
+            "ai_model": ai_result.get("ai_model", "unknown"),
+            "generation_status": ai_result.get("status", "unknown")
+        },
+        is_active=True
+    )
+    
+    db.add(new_content)
+    db.commit()
+    db.refresh(new_content)
+    return new_content
+
+
 @router.get("/{course_id}/content/{content_id}/generated-content")
 async def get_generated_content(
     course_id: int,
@@ -8,20 +8,27 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 import json
 import os
+import asyncio
 from pathlib import Path
 
-from ..core.database import get_db
+from ..core.database import get_db, SessionLocal
 from ..api.auth import get_current_user
 from ..services.simple_ai_generator import SimpleAIContentGenerator
 from ..services.simple_rag_service import SimpleRAGService
+from ..services.llm_cache import get_response_cache
+from ..services.job_queue import enqueue_job
+from ..services.llm_client import get_llm_client
+from ..services.generation_stream import sse_response, stream_generation
 from ..models.course import Course, CourseFileContent
 from ..models.ai import ContentGeneration
 from ..core.config import settings
 
 router = APIRouter()
 
+GENERATED_CONTENT_TYPES = ("learning_material", "lesson_plan", "knowledge_test")
 
-@router.post("/upload-document")
+
+@router.post("/upload-document", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
     course_id: int = Form(...),
     title: str = Form(...),
@@ -30,7 +37,7 @@ async def upload_document(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Upload and process a document for AI content generation"""
+    """Upload a document and queue it for processing for AI content generation"""
     
     # Verify instructor access
     if current_user.role != "instructor":
@@ -80,18 +87,20 @@ async def upload_document(
         db.commit()
         db.refresh(course_file)
         
-        # Process document with RAG
-        rag_service = SimpleRAGService(db)
-        process_result = rag_service.process_uploaded_document(
-            course_file.id, current_user.id
+        # Extraction and embedding run in a background job
+        job = enqueue_job(
+            db, "process_document",
+            {"content_id": course_file.id, "instructor_id": current_user.id},
+            user_id=current_user.id
         )
         
         return {
-            "status": "success",
+            "status": "accepted",
             "file_id": course_file.id,
             "file_path": str(file_path),
-            "processing_result": process_result,
-            "message": "Document uploaded and processed successfully"
+            "job_id": job.id,
+            "status_url": f"/api/jobs/{job.id}",
+            "message": "Document uploaded and queued for processing"
         }
         
     except Exception as e:
@@ -110,10 +119,15 @@ async def generate_content(
     description: str = Form(...),
     additional_instructions: str = Form(""),
     use_rag: bool = Form(True),
+    stream: bool = Form(False),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Generate AI content for a course"""
+    """Generate AI content for a course.
+
+    With stream=true the content is sent as server-sent events while it is
+    generated and saved for review when the stream completes.
+    """
     
     # Verify instructor access
     if current_user.role != "instructor":
@@ -134,6 +148,11 @@ async def generate_content(
             detail="Course not found or access denied"
         )
     
+    if stream:
+        return await _stream_content(
+            db, course_id, current_user.id, content_type, title, description, additional_instructions, use_rag
+        )
+    
     try:
         if use_rag:
             # Use RAG service for content generation
@@ -164,21 +183,21 @@ async def generate_content(
             ])
             
             if content_type == "learning_material":
-                result = generator.generate_learning_material(
+                result = await generator.generate_learning_material(
                     original_content=combined_content,
                     title=title,
                     description=description,
                     additional_instructions=additional_instructions
                 )
             elif content_type == "lesson_plan":
-                result = generator.generate_lesson_plan(
+                result = await generator.generate_lesson_plan(
                     original_content=combined_content,
                     title=title,
                     description=description,
                     additional_instructions=additional_instructions
                 )
             elif content_type == "knowledge_test":
-                result = generator.generate_knowledge_test(
+                result = await generator.generate_knowledge_test(
                     original_content=combined_content,
                     title=title,
                     description=description,
@@ -224,6 +243,76 @@ async def generate_content(
         )
 
 
+async def _stream_content(db: Session, course_id: int, instructor_id: int, content_type: str,
+                          title: str, description: str, additional_instructions: str, use_rag: bool):
+    """SSE response for generate-content; the ContentGeneration row is saved when the stream ends"""
+    start = {"content_type": content_type, "model": settings.ai_model}
+    
+    if use_rag:
+        rag_service = SimpleRAGService(db)
+        prepared = await asyncio.to_thread(
+            rag_service.prepare_course_content,
+            course_id, instructor_id, content_type, title, description, additional_instructions
+        )
+        if "error" in prepared:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=prepared["error"])
+        
+        if prepared["mock_content"] is not None:
+            async def mock_chunks():
+                yield prepared["mock_content"]
+            chunks = mock_chunks()
+        else:
+            chunks = get_llm_client().stream_messages(
+                prepared["messages"], content_type=content_type, max_tokens=settings.ai_max_tokens,
+                namespace=prepared["namespace"]
+            )
+        start.update(sources_used=prepared["sources_used"], context=prepared["context"])
+    else:
+        if content_type not in GENERATED_CONTENT_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid content type. Must be: learning_material, lesson_plan, or knowledge_test"
+            )
+        
+        course_files = db.query(CourseFileContent).filter(
+            CourseFileContent.course_id == course_id,
+            CourseFileContent.is_active == True
+        ).all()
+        combined_content = "\n\n".join([
+            f"{file.title}: {file.description}" 
+            for file in course_files
+        ])
+        
+        generator = SimpleAIContentGenerator()
+        if content_type == "learning_material":
+            result = await generator.generate_learning_material(
+                combined_content, title, description, additional_instructions, stream=True
+            )
+        elif content_type == "lesson_plan":
+            result = await generator.generate_lesson_plan(
+                combined_content, title, description, additional_instructions, stream=True
+            )
+        else:
+            result = await generator.generate_knowledge_test(
+                combined_content, title, description, additional_instructions,
+                question_count=settings.default_question_count, stream=True
+            )
+        chunks = result["chunks"]
+    
+    def save(content: str) -> dict:
+        # The request's session may be closed by now; the stream outlives the handler
+        session = SessionLocal()
+        try:
+            generation = SimpleRAGService(session).save_generation(
+                course_id, content_type, content, settings.ai_model
+            )
+            return {"generation_id": generation.id, "characters": len(content)}
+        finally:
+            session.close()
+    
+    return sse_response(stream_generation(chunks, start, save))
+
+
 @router.get("/content-generations")
 async def get_content_generations(
     course_id: Optional[int] = None,
@@ -510,3 +599,26 @@ async def get_course_documents(
             detail=f"Error retrieving course documents: {str(e)}"
         )
 
+
+
+@router.get("/response-cache/stats")
+async def get_response_cache_stats(
+    current_user = Depends(get_current_user)
+):
+    """AI response cache hit rates and generation time saved, per content type"""
+    
+    if current_user.role not in ["instructor", "admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only instructors can view AI cache statistics"
+        )
+    
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False, "content_types": {}}
+    
+    return {
+        "enabled": True,
+        "semantic": settings.llm_cache_semantic,
+        "content_types": await asyncio.to_thread(cache.stats)
+    }
@@ -0,0 +1,47 @@
+"""
+Background job status API.
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from ..core.database import get_db
+from ..api.auth import get_current_user
+from ..models.jobs import Job
+from ..services.job_queue import job_to_dict
+
+router = APIRouter()
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Get the status, progress and result of a background job"""
+    job = db.query(Job).filter(Job.id == job_id).first()
+    
+    if not job or (current_user.role != "admin" and job.user_id != current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    return job_to_dict(job)
+
+
+@router.get("/")
+async def list_jobs(
+    job_status: Optional[str] = None,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """List the current user's most recent background jobs"""
+    query = db.query(Job).filter(Job.user_id == current_user.id)
+    if job_status:
+        query = query.filter(Job.status == job_status)
+    
+    jobs = query.order_by(Job.created_at.desc()).limit(min(limit, 100)).all()
+    return {"jobs": [job_to_dict(job) for job in jobs]}
@@ -15,6 +15,7 @@ from ..api.auth import get_current_user
 from ..models.course import Course
 from ..models.learning import Enrollment, LearningSession, AssessmentAttempt
 from ..models.user import User
+from ..services.metrics_query import MetricsQuery
 
 router = APIRouter()
 
@@ -58,16 +59,15 @@ async def get_learning_analytics(
         start_date = now - timedelta(days=30)
     
     # Get basic statistics
-    total_courses = db.query(Enrollment).filter(
-        Enrollment.user_id == current_user.id
-    ).count()
-    
-    completed_courses = db.query(Enrollment).filter(
-        and_(
-            Enrollment.user_id == current_user.id,
-            Enrollment.status == "completed"
-        )
-    ).count()
+    enrollment_counts = (
+        MetricsQuery(db, Enrollment)
+        .count("total")
+        .count("completed", Enrollment.status == "completed")
+        .filter(Enrollment.user_id == current_user.id)
+        .one()
+    )
+    total_courses = enrollment_counts["total"]
+    completed_courses = enrollment_counts["completed"]
     
     # Calculate overall progress
     enrollments = db.query(Enrollment).filter(
@@ -321,16 +321,15 @@ async def get_progress_summary(
         )
     
     # Get basic stats
-    total_courses = db.query(Enrollment).filter(
-        Enrollment.user_id == current_user.id
-    ).count()
-    
-    completed_courses = db.query(Enrollment).filter(
-        and_(
-            Enrollment.user_id == current_user.id,
-            Enrollment.status == "completed"
-        )
-    ).count()
+    enrollment_counts = (
+        MetricsQuery(db, Enrollment)
+        .count("total")
+        .count("completed", Enrollment.status == "completed")
+        .filter(Enrollment.user_id == current_user.id)
+        .one()
+    )
+    total_courses = enrollment_counts["total"]
+    completed_courses = enrollment_counts["completed"]
     
     # Get this week's learning time
     week_start = datetime.utcnow() - timedelta(days=7)
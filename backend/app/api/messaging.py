@@ -3,22 +3,22 @@ Messaging and Q&A API endpoints.
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, desc, asc, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, or_, desc, asc, func, insert, select, update
 from typing import List, Optional
 from datetime import datetime, timedelta
-import asyncio
 import json
 
-from ..core.database import get_db
-from ..core.auth import get_current_user
+from ..core.database import get_async_db
+from ..core.auth import get_current_user_async
+from ..services.notification_broker import get_notification_broker
 from ..models.user import User
 from ..models.messaging import Message, QAPost, QAVote, Notification, MessageThread
 from ..schemas.auth import UserResponse
 from ..schemas.messaging import (
     MessageCreate, MessageUpdate, MessageResponse, MessageSearch,
     QAPostCreate, QAPostUpdate, QAPostResponse, QASearch,
-    QAVoteCreate, QAVoteResponse,
+    QAVoteCreate, QAVoteResponse, QAPostSort,
     NotificationResponse, NotificationUpdate,
     MessageThreadCreate, MessageThreadResponse,
     MessagingSummary, QASummary,
@@ -27,14 +27,24 @@ from ..schemas.messaging import (
 
 router = APIRouter(tags=["Messaging & Q&A"])
 
+# Endpoints use an AsyncSession so database I/O does not block the event
+# loop that also serves the notification streams.
+
+
+# Notification types mapped to user notification preference keys
+NOTIFICATION_PREFERENCE_KEYS = {
+    "message": "messages",
+    "qa_reply": "qa_replies",
+    "course_update": "course_updates",
+    "test_result": "test_results",
+    "system": "system"
+}
 
-# Global dictionary to store active SSE connections
-active_connections: dict = {}
 
 # Helper function to create notifications
-def create_notification(
-    db: Session,
-    user_id: int,
+async def create_notifications(
+    db: AsyncSession,
+    user_ids: List[int],
     title: str,
     content: str,
     notification_type: str,
@@ -42,117 +52,111 @@ def create_notification(
     related_entity_id: Optional[int] = None,
     course_id: Optional[int] = None,
     send_email: bool = True
-) -> Notification:
-    """Create a new notification and send real-time update."""
-    notification = Notification(
-        user_id=user_id,
-        title=title,
-        content=content,
-        notification_type=notification_type,
-        related_entity_type=related_entity_type,
-        related_entity_id=related_entity_id,
-        course_id=course_id
-    )
-    
-    db.add(notification)
-    db.commit()
-    db.refresh(notification)
+) -> List[Notification]:
+    """Create the same notification for many users.
+    
+    Rows are inserted in one statement and real-time updates are published
+    in one pass. Recipients' email preferences are loaded in one query;
+    rows for those who want an email are flagged email_pending and sent in
+    their next digest by the send_notification_digests job.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return []
+    
+    email_user_ids = set()
+    if send_email:
+        pref_key = NOTIFICATION_PREFERENCE_KEYS.get(notification_type, "system")
+        recipients = (await db.execute(
+            select(User.id, User.email, User.notification_preferences).where(
+                User.id.in_(user_ids),
+                User.email_notifications == True
+            )
+        )).all()
+        email_user_ids = {
+            user_id for user_id, email, preferences in recipients
+            if email and (preferences or {}).get(pref_key, True)  # Default to True if not set
+        }
     
-    # Send real-time notification if user is connected
-    if user_id in active_connections:
-        try:
-            notification_data = {
-                "id": notification.id,
-                "title": notification.title,
-                "content": notification.content,
-                "notification_type": notification.notification_type,
-                "is_read": notification.is_read,
-                "created_at": notification.created_at.isoformat(),
-                "course_id": notification.course_id
+    notifications = (await db.scalars(
+        insert(Notification).returning(Notification),
+        [
+            {
+                "user_id": user_id,
+                "title": title,
+                "content": content,
+                "notification_type": notification_type,
+                "related_entity_type": related_entity_type,
+                "related_entity_id": related_entity_id,
+                "course_id": course_id,
+                "email_pending": user_id in email_user_ids
             }
-            active_connections[user_id].put_nowait(notification_data)
-        except:
-            # Remove disconnected client
-            active_connections.pop(user_id, None)
+            for user_id in user_ids
+        ]
+    )).all()
+    
+    events = [
+        (notification.user_id, {
+            "id": notification.id,
+            "title": notification.title,
+            "content": notification.content,
+            "notification_type": notification.notification_type,
+            "is_read": notification.is_read,
+            "created_at": notification.created_at.isoformat() if notification.created_at else None,
+            "course_id": notification.course_id
+        })
+        for notification in notifications
+    ]
+    await db.commit()
     
-    # Send email notification if enabled and user preferences allow
-    if send_email:
-        try:
-            from ..core.email import email_service
-            from ..models.course import Course
-            
-            # Get user and check preferences
-            user = db.query(User).filter(User.id == user_id).first()
-            if user and user.email and user.email_notifications:
-                # Check specific notification type preference
-                preferences = user.notification_preferences or {}
-                notification_key = notification_type.replace("_", "_")
-                
-                # Map notification types to preference keys
-                type_mapping = {
-                    "message": "messages",
-                    "qa_reply": "qa_replies", 
-                    "course_update": "course_updates",
-                    "test_result": "test_results",
-                    "system": "system"
-                }
-                
-                pref_key = type_mapping.get(notification_type, "system")
-                if not preferences.get(pref_key, True):  # Default to True if not set
-                    return notification
-                
-                # Get course title if applicable
-                course_title = None
-                if course_id:
-                    course = db.query(Course).filter(Course.id == course_id).first()
-                    if course:
-                        course_title = course.title
-                
-                # Create action URL based on notification type
-                action_url = None
-                if notification_type == "message":
-                    action_url = f"http://localhost:3000/messaging"
-                elif notification_type == "qa_reply":
-                    action_url = f"http://localhost:3000/courses/{course_id}/qa" if course_id else "http://localhost:3000/qa"
-                elif notification_type == "course_update":
-                    action_url = f"http://localhost:3000/courses/{course_id}" if course_id else "http://localhost:3000/courses"
-                
-                # Send email notification
-                email_service.send_notification_email(
-                    to_email=user.email,
-                    notification_type=notification_type,
-                    title=title,
-                    content=content,
-                    course_title=course_title,
-                    action_url=action_url
-                )
-        except Exception as e:
-            print(f"Failed to send email notification: {str(e)}")
-    
-    return notification
+    # Send real-time notifications to the users' open streams, on any worker
+    try:
+        broker = get_notification_broker()
+        # Pending notifications about the same entity collapse into the latest one
+        merge_key = f"{notification_type}:{related_entity_type}:{related_entity_id}" if related_entity_id else None
+        for user_id, notification_data in events:
+            broker.publish(user_id, notification_data, merge_key)
+    except Exception as e:
+        print(f"Failed to send real-time notifications: {str(e)}")
+    
+    return notifications
+
+
+async def create_notification(
+    db: AsyncSession,
+    user_id: int,
+    title: str,
+    content: str,
+    notification_type: str,
+    related_entity_type: Optional[str] = None,
+    related_entity_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    send_email: bool = True
+) -> Notification:
+    """Create a new notification and send real-time update."""
+    return (await create_notifications(
+        db, [user_id], title, content, notification_type,
+        related_entity_type, related_entity_id, course_id, send_email
+    ))[0]
 
 # Helper function to get relevant recipients
-def get_relevant_recipients(current_user: User, course_id: Optional[int], db: Session) -> List[User]:
+async def get_relevant_recipients(current_user: User, course_id: Optional[int], db: AsyncSession) -> List[User]:
     """Get list of users that the current user can send messages to."""
-    recipients = []
+    query = select(User).where(User.id != current_user.id)
     
     if current_user.role == "admin":
         # Admins can message anyone
-        recipients = db.query(User).filter(User.id != current_user.id).all()
+        pass
     elif current_user.role == "instructor":
         # Instructors can message students and other instructors
-        recipients = db.query(User).filter(
-            User.id != current_user.id,
-            User.role.in_(["student", "instructor"])
-        ).all()
+        query = query.where(User.role.in_(["student", "instructor"]))
     elif current_user.role == "student":
         # Students can only message instructors
-        recipients = db.query(User).filter(
-            User.id != current_user.id,
-            User.role == "instructor"
-        ).all()
+        query = query.where(User.role == "instructor")
+    else:
+        return []
     
-    return recipients
+    return list((await db.scalars(query)).all())
 
 
 # Real-time Notifications
@@ -164,7 +168,7 @@ async def options_notifications_stream():
 @router.get("/notifications/stream")
 async def stream_notifications(
     token: str = Query(..., description="JWT token for authentication"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Stream real-time notifications using Server-Sent Events."""
     # Authenticate user using token
@@ -174,16 +178,20 @@ async def stream_notifications(
         if not email:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        current_user = db.query(User).filter(User.email == email).first()
+        current_user = await db.scalar(select(User).where(User.email == email))
         if not current_user:
             raise HTTPException(status_code=401, detail="User not found")
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
     
+    user_id = current_user.id
+    # Don't hold a database connection for the lifetime of the stream
+    await db.close()
+    
     async def event_generator():
-        # Create a queue for this user
-        queue = asyncio.Queue()
-        active_connections[current_user.id] = queue
+        # Each stream (tab, device) gets its own bounded queue
+        broker = get_notification_broker()
+        subscription = broker.subscribe(user_id)
         
         try:
             # Send initial connection confirmation
@@ -191,17 +199,16 @@ async def stream_notifications(
             
             # Keep connection alive and send notifications
             while True:
-                try:
-                    # Wait for notification with timeout
-                    notification = await asyncio.wait_for(queue.get(), timeout=30.0)
+                # Wait for notification with timeout
+                notification = await subscription.get(timeout=30.0)
+                if notification is not None:
                     yield f"data: {json.dumps(notification)}\n\n"
-                except asyncio.TimeoutError:
+                else:
                     # Send heartbeat to keep connection alive
                     yield f"data: {json.dumps({'type': 'heartbeat', 'timestamp': datetime.now().isoformat()})}\n\n"
-        except asyncio.CancelledError:
+        finally:
             # Clean up when client disconnects
-            active_connections.pop(current_user.id, None)
-            raise
+            broker.unsubscribe(subscription)
     
     return StreamingResponse(
         event_generator(),
@@ -220,11 +227,11 @@ async def stream_notifications(
 @router.get("/recipients", response_model=List[UserResponse])
 async def get_recipients(
     course_id: Optional[int] = Query(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get list of users that the current user can send messages to."""
-    recipients = get_relevant_recipients(current_user, course_id, db)
+    recipients = await get_relevant_recipients(current_user, course_id, db)
     
     # Convert to UserResponse format
     return [
@@ -242,12 +249,12 @@ async def get_recipients(
 @router.post("/messages", response_model=MessageResponse)
 async def create_message(
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new message."""
     # Check if recipient exists
-    recipient = db.query(User).filter(User.id == message_data.recipient_id).first()
+    recipient = await db.get(User, message_data.recipient_id)
     if not recipient:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -274,11 +281,11 @@ async def create_message(
     )
     
     db.add(message)
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
     
     # Create notification for recipient
-    create_notification(
+    await create_notification(
         db=db,
         user_id=message_data.recipient_id,
         title=f"New message from {current_user.email}",
@@ -290,8 +297,7 @@ async def create_message(
     )
     
     # Load related data for response
-    db.refresh(message)
-    return _format_message_response(message, db)
+    return await _format_message_response(message, db)
 
 
 @router.get("/messages", response_model=List[MessageResponse])
@@ -302,11 +308,11 @@ async def get_messages(
     course_id: Optional[int] = Query(None),
     is_read: Optional[bool] = Query(None),
     is_archived: Optional[bool] = Query(False),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get messages for current user."""
-    query = db.query(Message).filter(
+    query = select(Message).where(
         or_(
             Message.sender_id == current_user.id,
             Message.recipient_id == current_user.id
@@ -314,7 +320,7 @@ async def get_messages(
     )
     
     if search:
-        query = query.filter(
+        query = query.where(
             or_(
                 Message.subject.ilike(f"%{search}%"),
                 Message.content.ilike(f"%{search}%")
@@ -322,27 +328,27 @@ async def get_messages(
         )
     
     if course_id:
-        query = query.filter(Message.course_id == course_id)
+        query = query.where(Message.course_id == course_id)
     
     if is_read is not None:
-        query = query.filter(Message.is_read == is_read)
+        query = query.where(Message.is_read == is_read)
     
     if is_archived is not None:
-        query = query.filter(Message.is_archived == is_archived)
+        query = query.where(Message.is_archived == is_archived)
     
-    messages = query.order_by(desc(Message.created_at)).offset(skip).limit(limit).all()
+    messages = (await db.scalars(query.order_by(desc(Message.created_at)).offset(skip).limit(limit))).all()
     
-    return [_format_message_response(msg, db) for msg in messages]
+    return await _format_message_responses(messages, db)
 
 
 @router.get("/messages/{message_id}", response_model=MessageResponse)
 async def get_message(
     message_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific message."""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = await db.get(Message, message_id)
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -359,20 +365,21 @@ async def get_message(
     # Mark as read if user is recipient
     if message.recipient_id == current_user.id and not message.is_read:
         message.is_read = True
-        db.commit()
+        await db.commit()
+        await db.refresh(message)
     
-    return _format_message_response(message, db)
+    return await _format_message_response(message, db)
 
 
 @router.put("/messages/{message_id}", response_model=MessageResponse)
 async def update_message(
     message_id: int,
     message_data: MessageUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a message."""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = await db.get(Message, message_id)
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -390,20 +397,20 @@ async def update_message(
     for field, value in message_data.dict(exclude_unset=True).items():
         setattr(message, field, value)
     
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
     
-    return _format_message_response(message, db)
+    return await _format_message_response(message, db)
 
 
 @router.delete("/messages/{message_id}")
 async def delete_message(
     message_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a message."""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = await db.get(Message, message_id)
     if not message:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -417,8 +424,8 @@ async def delete_message(
             detail="Access denied"
         )
     
-    db.delete(message)
-    db.commit()
+    await db.delete(message)
+    await db.commit()
     
     return {"message": "Message deleted successfully"}
 
@@ -427,13 +434,13 @@ async def delete_message(
 @router.post("/qa/posts", response_model=QAPostResponse)
 async def create_qa_post(
     post_data: QAPostCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new Q&A post."""
     # Check if course exists and user has access
     from ..models.course import Course
-    course = db.query(Course).filter(Course.id == post_data.course_id).first()
+    course = await db.get(Course, post_data.course_id)
     if not course:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -443,11 +450,11 @@ async def create_qa_post(
     # Check if user is enrolled in course or is instructor/admin
     if current_user.role == "student":
         from ..models.learning import Enrollment
-        enrollment = db.query(Enrollment).filter(
+        enrollment = await db.scalar(select(Enrollment).where(
             Enrollment.user_id == current_user.id,
             Enrollment.course_id == post_data.course_id,
             Enrollment.status == "active"
-        ).first()
+        ))
         if not enrollment:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -467,13 +474,16 @@ async def create_qa_post(
     )
     
     db.add(post)
-    db.commit()
-    db.refresh(post)
+    if post.parent_post_id:
+        # Counted in the same transaction as the reply itself
+        await _update_post_counters(db, post.parent_post_id, replies=1, touch=True)
+    await db.commit()
+    await db.refresh(post)
     
     # Create notifications for course participants
-    _create_qa_notifications(post, db)
+    await _create_qa_notifications(post, db)
     
-    return _format_qa_post_response(post, current_user.id, db)
+    return await _format_qa_post_response(post, current_user.id, db)
 
 
 @router.get("/qa/posts", response_model=List[QAPostResponse])
@@ -484,22 +494,23 @@ async def get_qa_posts(
     tags: Optional[str] = Query(None),
     is_resolved: Optional[bool] = Query(None),
     is_pinned: Optional[bool] = Query(None),
+    sort: QAPostSort = Query(QAPostSort.RECENT),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get Q&A posts."""
-    query = db.query(QAPost).filter(QAPost.parent_post_id.is_(None))  # Only top-level posts
+    """Get Q&A posts, pinned first, then newest, highest scoring or most recently active."""
+    query = select(QAPost).where(QAPost.parent_post_id.is_(None))  # Only top-level posts
     
     if course_id:
-        query = query.filter(QAPost.course_id == course_id)
+        query = query.where(QAPost.course_id == course_id)
     
     if post_type:
-        query = query.filter(QAPost.post_type == post_type)
+        query = query.where(QAPost.post_type == post_type)
     
     if search:
-        query = query.filter(
+        query = query.where(
             or_(
                 QAPost.title.ilike(f"%{search}%"),
                 QAPost.content.ilike(f"%{search}%")
@@ -508,27 +519,34 @@ async def get_qa_posts(
     
     if tags:
         tag_list = [tag.strip() for tag in tags.split(",")]
-        query = query.filter(QAPost.tags.contains(tag_list))
+        query = query.where(QAPost.tags.contains(tag_list))
     
     if is_resolved is not None:
-        query = query.filter(QAPost.is_resolved == is_resolved)
+        query = query.where(QAPost.is_resolved == is_resolved)
     
     if is_pinned is not None:
-        query = query.filter(QAPost.is_pinned == is_pinned)
+        query = query.where(QAPost.is_pinned == is_pinned)
     
-    posts = query.order_by(desc(QAPost.is_pinned), desc(QAPost.created_at)).offset(skip).limit(limit).all()
+    if sort == QAPostSort.SCORE:
+        order = desc(QAPost.upvotes - QAPost.downvotes)
+    elif sort == QAPostSort.ACTIVITY:
+        order = desc(QAPost.last_activity_at)
+    else:
+        order = desc(QAPost.created_at)
     
-    return [_format_qa_post_response(post, current_user.id, db) for post in posts]
+    posts = (await db.scalars(query.order_by(desc(QAPost.is_pinned), order).offset(skip).limit(limit))).all()
+    
+    return await _format_qa_post_responses(posts, current_user.id, db)
 
 
 @router.get("/qa/posts/{post_id}", response_model=QAPostResponse)
 async def get_qa_post(
     post_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific Q&A post with replies."""
-    post = db.query(QAPost).filter(QAPost.id == post_id).first()
+    post = await db.get(QAPost, post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -537,20 +555,21 @@ async def get_qa_post(
     
     # Increment view count
     post.view_count += 1
-    db.commit()
+    await db.commit()
+    await db.refresh(post)
     
-    return _format_qa_post_response(post, current_user.id, db)
+    return await _format_qa_post_response(post, current_user.id, db)
 
 
 @router.put("/qa/posts/{post_id}", response_model=QAPostResponse)
 async def update_qa_post(
     post_id: int,
     post_data: QAPostUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a Q&A post."""
-    post = db.query(QAPost).filter(QAPost.id == post_id).first()
+    post = await db.get(QAPost, post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -568,20 +587,20 @@ async def update_qa_post(
     for field, value in post_data.dict(exclude_unset=True).items():
         setattr(post, field, value)
     
-    db.commit()
-    db.refresh(post)
+    await db.commit()
+    await db.refresh(post)
     
-    return _format_qa_post_response(post, current_user.id, db)
+    return await _format_qa_post_response(post, current_user.id, db)
 
 
 @router.delete("/qa/posts/{post_id}")
 async def delete_qa_post(
     post_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a Q&A post."""
-    post = db.query(QAPost).filter(QAPost.id == post_id).first()
+    post = await db.get(QAPost, post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -595,8 +614,10 @@ async def delete_qa_post(
             detail="Access denied"
         )
     
-    db.delete(post)
-    db.commit()
+    if post.parent_post_id:
+        await _update_post_counters(db, post.parent_post_id, replies=-1)
+    await db.delete(post)
+    await db.commit()
     
     return {"message": "Post deleted successfully"}
 
@@ -605,12 +626,12 @@ async def delete_qa_post(
 @router.post("/qa/votes", response_model=QAVoteResponse)
 async def create_vote(
     vote_data: QAVoteCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create or update a vote on a Q&A post."""
     # Check if post exists
-    post = db.query(QAPost).filter(QAPost.id == vote_data.post_id).first()
+    post = await db.get(QAPost, vote_data.post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -618,16 +639,19 @@ async def create_vote(
         )
     
     # Check if user already voted
-    existing_vote = db.query(QAVote).filter(
+    existing_vote = await db.scalar(select(QAVote).where(
         QAVote.post_id == vote_data.post_id,
         QAVote.user_id == current_user.id
-    ).first()
+    ))
     
     if existing_vote:
-        # Update existing vote
+        # Update existing vote, moving it between the post's counters
+        if existing_vote.vote_type != vote_data.vote_type:
+            await _update_post_counters(db, post.id, **_vote_deltas(existing_vote.vote_type, -1))
+            await _update_post_counters(db, post.id, **_vote_deltas(vote_data.vote_type, 1))
         existing_vote.vote_type = vote_data.vote_type
-        db.commit()
-        db.refresh(existing_vote)
+        await db.commit()
+        await db.refresh(existing_vote)
         return existing_vote
     else:
         # Create new vote
@@ -637,22 +661,23 @@ async def create_vote(
             vote_type=vote_data.vote_type
         )
         db.add(vote)
-        db.commit()
-        db.refresh(vote)
+        await _update_post_counters(db, post.id, **_vote_deltas(vote_data.vote_type, 1))
+        await db.commit()
+        await db.refresh(vote)
         return vote
 
 
 @router.delete("/qa/votes/{post_id}")
 async def delete_vote(
     post_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Remove a vote from a Q&A post."""
-    vote = db.query(QAVote).filter(
+    vote = await db.scalar(select(QAVote).where(
         QAVote.post_id == post_id,
         QAVote.user_id == current_user.id
-    ).first()
+    ))
     
     if not vote:
         raise HTTPException(
@@ -660,8 +685,9 @@ async def delete_vote(
             detail="Vote not found"
         )
     
-    db.delete(vote)
-    db.commit()
+    await _update_post_counters(db, post_id, **_vote_deltas(vote.vote_type, -1))
+    await db.delete(vote)
+    await db.commit()
     
     return {"message": "Vote removed successfully"}
 
@@ -672,32 +698,32 @@ async def get_notifications(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
     is_read: Optional[bool] = Query(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get notifications for current user."""
-    query = db.query(Notification).filter(Notification.user_id == current_user.id)
+    query = select(Notification).where(Notification.user_id == current_user.id)
     
     if is_read is not None:
-        query = query.filter(Notification.is_read == is_read)
+        query = query.where(Notification.is_read == is_read)
     
-    notifications = query.order_by(desc(Notification.created_at)).offset(skip).limit(limit).all()
+    notifications = (await db.scalars(query.order_by(desc(Notification.created_at)).offset(skip).limit(limit))).all()
     
-    return [_format_notification_response(notif, db) for notif in notifications]
+    return await _format_notification_responses(notifications, db)
 
 
 @router.put("/notifications/{notification_id}", response_model=NotificationResponse)
 async def update_notification(
     notification_id: int,
     notification_data: NotificationUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a notification."""
-    notification = db.query(Notification).filter(
+    notification = await db.scalar(select(Notification).where(
         Notification.id == notification_id,
         Notification.user_id == current_user.id
-    ).first()
+    ))
     
     if not notification:
         raise HTTPException(
@@ -712,23 +738,23 @@ async def update_notification(
     if notification_data.is_read and not notification.is_read:
         notification.read_at = datetime.utcnow()
     
-    db.commit()
-    db.refresh(notification)
+    await db.commit()
+    await db.refresh(notification)
     
-    return _format_notification_response(notification, db)
+    return await _format_notification_response(notification, db)
 
 
 @router.delete("/notifications/{notification_id}")
 async def delete_notification(
     notification_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a notification."""
-    notification = db.query(Notification).filter(
+    notification = await db.scalar(select(Notification).where(
         Notification.id == notification_id,
         Notification.user_id == current_user.id
-    ).first()
+    ))
     
     if not notification:
         raise HTTPException(
@@ -736,8 +762,8 @@ async def delete_notification(
             detail="Notification not found"
         )
     
-    db.delete(notification)
-    db.commit()
+    await db.delete(notification)
+    await db.commit()
     
     return {"message": "Notification deleted successfully"}
 
@@ -746,7 +772,7 @@ async def delete_notification(
 # Notification Preferences
 @router.get("/notifications/preferences")
 async def get_notification_preferences(
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_async)
 ):
     """Get user's notification preferences."""
     return {
@@ -764,8 +790,8 @@ async def get_notification_preferences(
 @router.put("/notifications/preferences")
 async def update_notification_preferences(
     preferences: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user's notification preferences."""
     # Update email notifications
@@ -780,8 +806,8 @@ async def update_notification_preferences(
     if "preferences" in preferences:
         current_user.notification_preferences = preferences["preferences"]
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     
     return {
         "message": "Notification preferences updated successfully",
@@ -792,230 +818,309 @@ async def update_notification_preferences(
 
 @router.get("/dashboard/summary", response_model=MessagingSummary)
 async def get_messaging_summary(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get messaging summary for dashboard."""
     # Count unread messages
-    unread_messages = db.query(Message).filter(
+    unread_messages = await db.scalar(select(func.count(Message.id)).where(
         Message.recipient_id == current_user.id,
         Message.is_read == False
-    ).count()
+    ))
     
     # Count unread notifications
-    unread_notifications = db.query(Notification).filter(
+    unread_notifications = await db.scalar(select(func.count(Notification.id)).where(
         Notification.user_id == current_user.id,
         Notification.is_read == False
-    ).count()
+    ))
     
     # Get recent messages
-    recent_messages = db.query(Message).filter(
+    recent_messages = (await db.scalars(select(Message).where(
         or_(
             Message.sender_id == current_user.id,
             Message.recipient_id == current_user.id
         )
-    ).order_by(desc(Message.created_at)).limit(5).all()
+    ).order_by(desc(Message.created_at)).limit(5))).all()
     
     # Get recent notifications
-    recent_notifications = db.query(Notification).filter(
+    recent_notifications = (await db.scalars(select(Notification).where(
         Notification.user_id == current_user.id
-    ).order_by(desc(Notification.created_at)).limit(5).all()
+    ).order_by(desc(Notification.created_at)).limit(5))).all()
     
     return MessagingSummary(
         unread_messages=unread_messages,
         unread_notifications=unread_notifications,
-        recent_messages=[_format_message_response(msg, db) for msg in recent_messages],
-        recent_notifications=[_format_notification_response(notif, db) for notif in recent_notifications]
+        recent_messages=await _format_message_responses(recent_messages, db),
+        recent_notifications=await _format_notification_responses(recent_notifications, db)
     )
 
 
 @router.get("/qa/summary", response_model=QASummary)
 async def get_qa_summary(
     course_id: Optional[int] = Query(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get Q&A summary for dashboard."""
-    query = db.query(QAPost).filter(QAPost.parent_post_id.is_(None))
+    filters = [QAPost.parent_post_id.is_(None)]
     
     if course_id:
-        query = query.filter(QAPost.course_id == course_id)
+        filters.append(QAPost.course_id == course_id)
     
     # Count total questions
-    total_questions = query.filter(QAPost.post_type == "question").count()
+    total_questions = await db.scalar(
+        select(func.count(QAPost.id)).where(*filters, QAPost.post_type == "question")
+    )
     
     # Count unanswered questions
-    unanswered_questions = query.filter(
+    unanswered_questions = await db.scalar(select(func.count(QAPost.id)).where(
+        *filters,
         QAPost.post_type == "question",
         QAPost.is_resolved == False
-    ).count()
+    ))
     
     # Get recent posts
-    recent_posts = query.order_by(desc(QAPost.created_at)).limit(10).all()
+    recent_posts = (await db.scalars(
+        select(QAPost).where(*filters).order_by(desc(QAPost.created_at)).limit(10)
+    )).all()
     
     # Get popular tags
-    tag_counts = db.query(
+    tag_counts = (await db.execute(select(
         func.json_array_elements_text(QAPost.tags).label('tag'),
         func.count().label('count')
-    ).filter(
+    ).where(
         QAPost.tags.isnot(None),
         QAPost.tags != '[]'
-    ).group_by('tag').order_by(desc('count')).limit(10).all()
+    ).group_by('tag').order_by(desc('count')).limit(10))).all()
     
     popular_tags = [{"tag": tag, "count": count} for tag, count in tag_counts]
     
     return QASummary(
         total_questions=total_questions,
         unanswered_questions=unanswered_questions,
-        recent_posts=[_format_qa_post_response(post, current_user.id, db) for post in recent_posts],
+        recent_posts=await _format_qa_post_responses(recent_posts, current_user.id, db),
         popular_tags=popular_tags
     )
 
 
 # Helper functions
-def _format_message_response(message: Message, db: Session) -> MessageResponse:
-    """Format message for response with related data."""
+async def _user_emails(user_ids, db: AsyncSession) -> dict:
+    """Email (shown as the display name) of each user, in one query"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return {}
+    return dict((await db.execute(select(User.id, User.email).where(User.id.in_(user_ids)))).all())
+
+
+async def _course_titles(course_ids, db: AsyncSession) -> dict:
+    """Title of each course, in one query"""
+    from ..models.course import Course
+    course_ids = {course_id for course_id in course_ids if course_id is not None}
+    if not course_ids:
+        return {}
+    return dict((await db.execute(select(Course.id, Course.title).where(Course.id.in_(course_ids)))).all())
+
+
+async def _format_message_responses(messages: List[Message], db: AsyncSession) -> List[MessageResponse]:
+    """Format a page of messages with related data.
+    
+    Users, courses and reply counts for the whole page are loaded in at
+    most three queries, however many messages there are.
+    """
+    if not messages:
+        return []
+    
     # Get sender and recipient names
-    sender = db.query(User).filter(User.id == message.sender_id).first()
-    recipient = db.query(User).filter(User.id == message.recipient_id).first()
+    names = await _user_emails(
+        [m.sender_id for m in messages] + [m.recipient_id for m in messages], db
+    )
     
-    # Get course title if applicable
-    course_title = None
-    if message.course_id:
-        from ..models.course import Course
-        course = db.query(Course).filter(Course.id == message.course_id).first()
-        course_title = course.title if course else None
+    # Get course titles where applicable
+    course_titles = await _course_titles([m.course_id for m in messages], db)
     
     # Count replies
-    reply_count = db.query(Message).filter(Message.parent_message_id == message.id).count()
-    
-    return MessageResponse(
-        id=message.id,
-        sender_id=message.sender_id,
-        recipient_id=message.recipient_id,
-        subject=message.subject,
-        content=message.content,
-        message_type=message.message_type,
-        course_id=message.course_id,
-        parent_message_id=message.parent_message_id,
-        is_read=message.is_read,
-        is_archived=message.is_archived,
-        attachments=message.attachments,
-        created_at=message.created_at,
-        updated_at=message.updated_at,
-        sender_name=f"{sender.email}" if sender else None,
-        recipient_name=f"{recipient.email}" if recipient else None,
-        course_title=course_title,
-        reply_count=reply_count
-    )
+    reply_counts = dict((await db.execute(
+        select(Message.parent_message_id, func.count(Message.id))
+        .where(Message.parent_message_id.in_([m.id for m in messages]))
+        .group_by(Message.parent_message_id)
+    )).all())
+    
+    return [
+        MessageResponse(
+            id=message.id,
+            sender_id=message.sender_id,
+            recipient_id=message.recipient_id,
+            subject=message.subject,
+            content=message.content,
+            message_type=message.message_type,
+            course_id=message.course_id,
+            parent_message_id=message.parent_message_id,
+            is_read=message.is_read,
+            is_archived=message.is_archived,
+            attachments=message.attachments,
+            created_at=message.created_at,
+            updated_at=message.updated_at,
+            sender_name=names.get(message.sender_id),
+            recipient_name=names.get(message.recipient_id),
+            course_title=course_titles.get(message.course_id),
+            reply_count=reply_counts.get(message.id, 0)
+        )
+        for message in messages
+    ]
 
 
-def _format_qa_post_response(post: QAPost, user_id: int, db: Session) -> QAPostResponse:
-    """Format Q&A post for response with related data."""
-    # Get author name
-    author = db.query(User).filter(User.id == post.author_id).first()
-    
-    # Get course title
-    from ..models.course import Course
-    course = db.query(Course).filter(Course.id == post.course_id).first()
+async def _format_message_response(message: Message, db: AsyncSession) -> MessageResponse:
+    """Format message for response with related data."""
+    return (await _format_message_responses([message], db))[0]
+
+
+async def _format_qa_post_responses(posts: List[QAPost], user_id: int, db: AsyncSession) -> List[QAPostResponse]:
+    """Format a page of Q&A posts with related data.
+    
+    Vote and reply totals come from the post's own counters; authors,
+    courses and the current user's votes for the whole page are loaded in
+    at most three queries.
+    """
+    if not posts:
+        return []
+    
+    # Get author names
+    names = await _user_emails([post.author_id for post in posts], db)
+    
+    # Get course titles
+    course_titles = await _course_titles([post.course_id for post in posts], db)
+    
+    # Get the user's votes
+    user_votes = dict((await db.execute(
+        select(QAVote.post_id, QAVote.vote_type).where(
+            QAVote.post_id.in_([post.id for post in posts]),
+            QAVote.user_id == user_id
+        )
+    )).all())
     
-    # Count replies
-    reply_count = db.query(QAPost).filter(QAPost.parent_post_id == post.id).count()
-    
-    # Calculate vote score
-    upvotes = db.query(QAVote).filter(
-        QAVote.post_id == post.id,
-        QAVote.vote_type == "up"
-    ).count()
-    downvotes = db.query(QAVote).filter(
-        QAVote.post_id == post.id,
-        QAVote.vote_type == "down"
-    ).count()
-    vote_score = upvotes - downvotes
-    
-    # Get user's vote
-    user_vote = db.query(QAVote).filter(
-        QAVote.post_id == post.id,
-        QAVote.user_id == user_id
-    ).first()
-    
-    return QAPostResponse(
-        id=post.id,
-        course_id=post.course_id,
-        author_id=post.author_id,
-        title=post.title,
-        content=post.content,
-        post_type=post.post_type,
-        parent_post_id=post.parent_post_id,
-        is_pinned=post.is_pinned,
-        is_resolved=post.is_resolved,
-        is_archived=post.is_archived,
-        tags=post.tags,
-        attachments=post.attachments,
-        view_count=post.view_count,
-        created_at=post.created_at,
-        updated_at=post.updated_at,
-        author_name=f"{author.email}" if author else None,
-        course_title=course.title if course else None,
-        reply_count=reply_count,
-        vote_score=vote_score,
-        user_vote=user_vote.vote_type if user_vote else None
-    )
+    return [
+        QAPostResponse(
+            id=post.id,
+            course_id=post.course_id,
+            author_id=post.author_id,
+            title=post.title,
+            content=post.content,
+            post_type=post.post_type,
+            parent_post_id=post.parent_post_id,
+            is_pinned=post.is_pinned,
+            is_resolved=post.is_resolved,
+            is_archived=post.is_archived,
+            tags=post.tags,
+            attachments=post.attachments,
+            view_count=post.view_count,
+            created_at=post.created_at,
+            updated_at=post.updated_at,
+            author_name=names.get(post.author_id),
+            course_title=course_titles.get(post.course_id),
+            reply_count=post.reply_count or 0,
+            upvotes=post.upvotes or 0,
+            downvotes=post.downvotes or 0,
+            vote_score=(post.upvotes or 0) - (post.downvotes or 0),
+            user_vote=user_votes.get(post.id),
+            last_activity_at=post.last_activity_at
+        )
+        for post in posts
+    ]
+
+
+def _vote_deltas(vote_type: str, change: int) -> dict:
+    """Counter changes for adding (1) or removing (-1) a vote"""
+    return {"upvotes": change} if vote_type == "up" else {"downvotes": change}
+
+
+async def _update_post_counters(
+    db: AsyncSession,
+    post_id: int,
+    upvotes: int = 0,
+    downvotes: int = 0,
+    replies: int = 0,
+    touch: bool = False
+):
+    """Adjust a post's counters in the current transaction.
+    
+    The UPDATE increments in the database, so concurrent votes on the same
+    post cannot overwrite each other's counts.
+    """
+    values = {}
+    if upvotes:
+        values[QAPost.upvotes] = QAPost.upvotes + upvotes
+    if downvotes:
+        values[QAPost.downvotes] = QAPost.downvotes + downvotes
+    if replies:
+        values[QAPost.reply_count] = QAPost.reply_count + replies
+    if touch:
+        values[QAPost.last_activity_at] = func.now()
+    if values:
+        await db.execute(
+            update(QAPost).where(QAPost.id == post_id).values(values),
+            execution_options={"synchronize_session": False}
+        )
+
+
+async def _format_qa_post_response(post: QAPost, user_id: int, db: AsyncSession) -> QAPostResponse:
+    """Format Q&A post for response with related data."""
+    return (await _format_qa_post_responses([post], user_id, db))[0]
+
+
+async def _format_notification_responses(notifications: List[Notification], db: AsyncSession) -> List[NotificationResponse]:
+    """Format a page of notifications, loading course titles in one query."""
+    course_titles = await _course_titles([n.course_id for n in notifications], db)
+    return [
+        NotificationResponse(
+            id=notification.id,
+            user_id=notification.user_id,
+            title=notification.title,
+            content=notification.content,
+            notification_type=notification.notification_type,
+            related_entity_type=notification.related_entity_type,
+            related_entity_id=notification.related_entity_id,
+            course_id=notification.course_id,
+            is_read=notification.is_read,
+            is_archived=notification.is_archived,
+            created_at=notification.created_at,
+            read_at=notification.read_at,
+            course_title=course_titles.get(notification.course_id)
+        )
+        for notification in notifications
+    ]
 
 
-def _format_notification_response(notification: Notification, db: Session) -> NotificationResponse:
+async def _format_notification_response(notification: Notification, db: AsyncSession) -> NotificationResponse:
     """Format notification for response with related data."""
-    # Get course title if applicable
-    course_title = None
-    if notification.course_id:
-        from ..models.course import Course
-        course = db.query(Course).filter(Course.id == notification.course_id).first()
-        course_title = course.title if course else None
-    
-    return NotificationResponse(
-        id=notification.id,
-        user_id=notification.user_id,
-        title=notification.title,
-        content=notification.content,
-        notification_type=notification.notification_type,
-        related_entity_type=notification.related_entity_type,
-        related_entity_id=notification.related_entity_id,
-        course_id=notification.course_id,
-        is_read=notification.is_read,
-        is_archived=notification.is_archived,
-        created_at=notification.created_at,
-        read_at=notification.read_at,
-        course_title=course_title
-    )
+    return (await _format_notification_responses([notification], db))[0]
 
 
-def _create_qa_notifications(post: QAPost, db: Session):
+async def _create_qa_notifications(post: QAPost, db: AsyncSession):
     """Create notifications for Q&A post participants."""
     from ..models.learning import Enrollment
     from ..models.course import Course
     
     # Get course participants
-    enrollments = db.query(Enrollment).filter(
+    student_ids = (await db.scalars(select(Enrollment.user_id).where(
         Enrollment.course_id == post.course_id,
         Enrollment.status == "active"
-    ).all()
+    ))).all()
     
     # Get course instructors
-    course = db.query(Course).filter(Course.id == post.course_id).first()
-    instructor_ids = [course.instructor_id] if course else []
+    instructor_id = await db.scalar(select(Course.instructor_id).where(Course.id == post.course_id))
+    instructor_ids = [instructor_id] if instructor_id else []
     
     # Create notifications for all participants
-    all_user_ids = set([e.user_id for e in enrollments] + instructor_ids)
+    all_user_ids = set(list(student_ids) + instructor_ids)
     all_user_ids.discard(post.author_id)  # Don't notify the author
     
-    for user_id in all_user_ids:
-        create_notification(
-            db=db,
-            user_id=user_id,
-            title=f"New {post.post_type} in course discussion",
-            content=f"{post.title[:50]}..." if len(post.title) > 50 else post.title,
-            notification_type="qa_reply",
-            related_entity_type="qa_post",
-            related_entity_id=post.id,
-            course_id=post.course_id
-        )
+    await create_notifications(
+        db=db,
+        user_ids=sorted(all_user_ids),
+        title=f"New {post.post_type} in course discussion",
+        content=f"{post.title[:50]}..." if len(post.title) > 50 else post.title,
+        notification_type="qa_reply",
+        related_entity_type="qa_post",
+        related_entity_id=post.id,
+        course_id=post.course_id
+    )
@@ -14,6 +14,7 @@ from ..models.course import Course
 from ..models.learning import Enrollment
 from ..models.user import User
 from ..schemas.learning import StudentCourseResponse
+from ..services.metrics_query import MetricsQuery
 
 router = APIRouter()
 
@@ -278,41 +279,32 @@ async def get_course_statistics(
         )
     
     # Get enrollment statistics
-    total_enrollments = db.query(Enrollment).filter(
-        Enrollment.user_id == current_user.id
-    ).count()
-    
-    active_enrollments = db.query(Enrollment).filter(
-        and_(
-            Enrollment.user_id == current_user.id,
-            Enrollment.status == "active"
-        )
-    ).count()
-    
-    completed_enrollments = db.query(Enrollment).filter(
-        and_(
-            Enrollment.user_id == current_user.id,
-            Enrollment.status == "completed"
-        )
-    ).count()
-    
-    # Get total available courses
-    total_available = db.query(Course).filter(Course.is_active == True).count()
+    enrollments = (
+        MetricsQuery(db, Enrollment)
+        .count("total")
+        .count("active", Enrollment.status == "active")
+        .count("completed", Enrollment.status == "completed")
+        .filter(Enrollment.user_id == current_user.id)
+        .one()
+    )
     
-    # Get category distribution
-    category_stats = db.query(
-        Course.category,
-        db.func.count(Course.id).label('count')
-    ).filter(Course.is_active == True).group_by(Course.category).all()
+    # Get category distribution; the available courses are its total
+    category_stats = (
+        MetricsQuery(db, Course)
+        .count("count")
+        .filter(Course.is_active == True)
+        .group_by(Course.category)
+        .all()
+    )
     
     return {
-        "total_available_courses": total_available,
-        "total_enrollments": total_enrollments,
-        "active_enrollments": active_enrollments,
-        "completed_enrollments": completed_enrollments,
+        "total_available_courses": sum(stats["count"] for stats in category_stats.values()),
+        "total_enrollments": enrollments["total"],
+        "active_enrollments": enrollments["active"],
+        "completed_enrollments": enrollments["completed"],
         "category_distribution": [
-            {"category": cat, "count": count} 
-            for cat, count in category_stats
+            {"category": cat, "count": stats["count"]} 
+            for cat, stats in category_stats.items()
         ]
     }
 
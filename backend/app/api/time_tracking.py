@@ -2,13 +2,14 @@
 Time tracking API endpoints for learning sessions.
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, timezone
 import uuid
 
-from ..core.database import get_db
-from ..core.auth import get_current_user
+from ..core.database import get_async_db
+from ..core.auth import get_current_user_async
 from ..models.learning import LearningTimeTracking, Enrollment
 from ..models.user import User
 from ..schemas.time_tracking import (
@@ -25,17 +26,17 @@ router = APIRouter()
 @router.post("/start", response_model=TimeTrackingResponse)
 async def start_time_tracking(
     data: TimeTrackingStart,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Start tracking time for a learning session."""
     
     # Check if user is enrolled in the course
-    enrollment = db.query(Enrollment).filter(
+    enrollment = await db.scalar(select(Enrollment).where(
         Enrollment.user_id == current_user.id,
         Enrollment.course_id == data.course_id,
         Enrollment.status == "active"
-    ).first()
+    ))
     
     if not enrollment:
         raise HTTPException(
@@ -61,8 +62,8 @@ async def start_time_tracking(
     )
     
     db.add(time_tracking)
-    db.commit()
-    db.refresh(time_tracking)
+    await db.commit()
+    await db.refresh(time_tracking)
     
     return TimeTrackingResponse(
         id=time_tracking.id,
@@ -81,16 +82,16 @@ async def start_time_tracking(
 async def update_time_tracking(
     session_id: str,
     data: TimeTrackingUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update time tracking for an active session."""
     
-    time_tracking = db.query(LearningTimeTracking).filter(
+    time_tracking = await db.scalar(select(LearningTimeTracking).where(
         LearningTimeTracking.session_id == session_id,
         LearningTimeTracking.user_id == current_user.id,
         LearningTimeTracking.is_active == True
-    ).first()
+    ))
     
     if not time_tracking:
         raise HTTPException(
@@ -109,8 +110,8 @@ async def update_time_tracking(
     if data.tracking_metadata is not None:
         time_tracking.tracking_metadata = data.tracking_metadata
     
-    db.commit()
-    db.refresh(time_tracking)
+    await db.commit()
+    await db.refresh(time_tracking)
     
     return TimeTrackingResponse(
         id=time_tracking.id,
@@ -129,16 +130,16 @@ async def update_time_tracking(
 async def end_time_tracking(
     session_id: str,
     data: TimeTrackingEnd,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """End time tracking for a session."""
     
-    time_tracking = db.query(LearningTimeTracking).filter(
+    time_tracking = await db.scalar(select(LearningTimeTracking).where(
         LearningTimeTracking.session_id == session_id,
         LearningTimeTracking.user_id == current_user.id,
         LearningTimeTracking.is_active == True
-    ).first()
+    ))
     
     if not time_tracking:
         raise HTTPException(
@@ -155,8 +156,8 @@ async def end_time_tracking(
     if data.tracking_metadata is not None:
         time_tracking.tracking_metadata = data.tracking_metadata
     
-    db.commit()
-    db.refresh(time_tracking)
+    await db.commit()
+    await db.refresh(time_tracking)
     
     return TimeTrackingResponse(
         id=time_tracking.id,
@@ -175,16 +176,16 @@ async def end_time_tracking(
 @router.get("/course/{course_id}/summary", response_model=TimeTrackingSummary)
 async def get_course_time_summary(
     course_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get time tracking summary for a course."""
     
     # Get all time tracking records for this course and user
-    time_records = db.query(LearningTimeTracking).filter(
+    time_records = (await db.scalars(select(LearningTimeTracking).where(
         LearningTimeTracking.user_id == current_user.id,
         LearningTimeTracking.course_id == course_id
-    ).all()
+    ))).all()
     
     total_time_seconds = sum(record.time_spent_seconds for record in time_records)
     total_sessions = len(time_records)
@@ -214,15 +215,15 @@ async def get_course_time_summary(
 
 @router.get("/active", response_model=List[TimeTrackingResponse])
 async def get_active_sessions(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all active time tracking sessions for the current user."""
     
-    active_sessions = db.query(LearningTimeTracking).filter(
+    active_sessions = (await db.scalars(select(LearningTimeTracking).where(
         LearningTimeTracking.user_id == current_user.id,
         LearningTimeTracking.is_active == True
-    ).all()
+    ))).all()
     
     return [
         TimeTrackingResponse(
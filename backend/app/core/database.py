@@ -1,21 +1,210 @@
 """
 Database configuration and session management for Neon DB.
+
+settings.db_pool_mode selects how connections are managed:
+- "queue": keeps up to db_pool_size connections open between requests,
+  plus db_max_overflow extra ones during bursts (long-running servers)
+- "pgbouncer": the same pool, for PgBouncer or Neon's pooled endpoint in
+  transaction mode; server-side prepared statements are disabled because
+  consecutive transactions may run on different server connections
+- "null": opens a new connection for every session (serverless)
+
+Async endpoints use get_async_db, an AsyncSession on a second engine over
+the same database through asyncpg (Postgres) or aiosqlite (SQLite), with
+the same pool mode.
 """
-from sqlalchemy import create_engine
+import time
+import threading
+from typing import Any, AsyncIterator, Dict, Optional
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from .config import settings
 
+POOL_MODES = ("queue", "pgbouncer", "null")
+
+
+class PoolMetrics:
+    """Connection checkout counters shared by the application's engines"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checked_out = 0
+            self.checkouts = 0
+            self.connections_opened = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+pool_metrics = PoolMetrics()
+
+
+class _TimedPool:
+    """Records how long getting a connection took, including opening one when needed"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.add("timeouts")
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedPool, NullPool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pgbouncer_connect_args(url: str) -> Dict[str, Any]:
+    """Driver options that avoid server-side prepared statements"""
+    driver = make_url(url).get_driver_name()
+    if driver == "psycopg":
+        return {"prepare_threshold": None}
+    if driver == "asyncpg":
+        return {"statement_cache_size": 0, "prepared_statement_cache_size": 0}
+    return {}  # psycopg2 does not prepare statements server-side
+
+
+def async_database_url(url: str) -> str:
+    """The database URL with its async driver (asyncpg or aiosqlite)"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        query = dict(url.query)
+        # asyncpg takes "ssl" instead of libpq's "sslmode" and has no channel binding option
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        query.pop("channel_binding", None)
+        url = url.set(drivername="postgresql+asyncpg", query=query)
+    elif backend == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
+
+def engine_options(url: str, mode: str = None, use_async: bool = False) -> Dict[str, Any]:
+    """create_engine() keyword arguments for a pool mode"""
+    mode = mode or settings.db_pool_mode
+    if mode not in POOL_MODES:
+        raise ValueError(f"Unknown database pool mode: {mode}")
+
+    options: Dict[str, Any] = {"pool_pre_ping": True, "echo": settings.debug}
+    if mode == "null":
+        options["poolclass"] = TimedNullPool
+        return options
+
+    options.update(
+        poolclass=TimedAsyncQueuePool if use_async else TimedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        # Neon closes idle connections; recycle before that happens
+        pool_recycle=settings.db_pool_recycle,
+        pool_use_lifo=True  # Lets surplus connections go idle long enough to be recycled
+    )
+    if mode == "pgbouncer":
+        options["connect_args"] = _pgbouncer_connect_args(url)
+    return options
+
+
+def instrument_engine(engine: Engine) -> Engine:
+    """Count connections and checkouts of an engine in pool_metrics"""
+    pool = getattr(engine, "sync_engine", engine).pool
+    event.listen(pool, "connect", lambda *args: pool_metrics.add("connections_opened"))
+
+    def on_checkout(*args):
+        pool_metrics.add("checkouts")
+        pool_metrics.add("checked_out")
+
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", lambda *args: pool_metrics.add("checked_out", -1))
+    return engine
+
+
+def create_db_engine(url: str = None, mode: str = None) -> Engine:
+    """Engine for the database with the configured (or given) pool mode"""
+    url = url or settings.database_url
+    return instrument_engine(create_engine(url, **engine_options(url, mode)))
+
+
 # Create database engine with Neon DB optimizations
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=settings.debug,
-    # Use NullPool for Neon DB to avoid connection issues
-    poolclass=NullPool
-)
+engine = create_db_engine()
+
+# Async engine, created on first use so the async driver is only needed by async endpoints
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+_async_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncEngine:
+    """The application's async engine"""
+    global _async_engine, _async_session_factory
+    with _async_lock:
+        if _async_engine is None:
+            url = async_database_url(settings.database_url)
+            _async_engine = instrument_engine(create_async_engine(url, **engine_options(url, use_async=True)))
+            # Objects stay loaded after commit; reloading them would need an await
+            _async_session_factory = async_sessionmaker(_async_engine, expire_on_commit=False, autoflush=False)
+        return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """A new AsyncSession, the async counterpart of SessionLocal"""
+    get_async_engine()
+    return _async_session_factory()
+
+
+async def close_async_engine():
+    """Close the async engine's connections; called on application shutdown"""
+    global _async_engine, _async_session_factory
+    async_engine, _async_engine, _async_session_factory = _async_engine, None, None
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+def pool_status() -> Dict[str, Any]:
+    """Current pool state and checkout statistics, for monitoring"""
+    pool = engine.pool
+    status = {
+        "mode": settings.db_pool_mode,
+        "checked_out": pool_metrics.checked_out,
+        "checkouts": pool_metrics.checkouts,
+        "connections_opened": pool_metrics.connections_opened,
+        "timeouts": pool_metrics.timeouts,
+        "wait_ms_avg": round(1000 * pool_metrics.wait_total / pool_metrics.checkouts, 3) if pool_metrics.checkouts else 0.0,
+        "wait_ms_max": round(1000 * pool_metrics.wait_max, 3),
+    }
+    if isinstance(pool, QueuePool):
+        status.update(pool_size=pool.size(), idle=pool.checkedin(), overflow=max(0, pool.overflow()))
+    return status
+
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -35,6 +224,14 @@ def get_db():
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dependency to get an async database session.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def create_tables():
     """
     Create all database tables.
@@ -1,14 +1,41 @@
 """
 Email notification system.
+
+EmailService keeps one authenticated SMTP connection open and reuses it for
+consecutive messages instead of connecting, negotiating TLS and logging in
+for every email. MailQueue sends transactional email (password resets,
+verification links) from request handlers without delay: a worker thread
+sends queued emails at a limited rate over that connection and retries
+failures with backoff. Notification emails are not sent from here; they
+wait in the notifications table and go out as per-user digests from the
+send_notification_digests job (see services/notification_emails.py).
 """
+import time
+import heapq
 import smtplib
 import ssl
+import itertools
+import threading
+from dataclasses import dataclass
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 import os
 from ..core.config import settings
 
+# Errors after which the connection is reopened and the message resent at once
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, smtplib.SMTPHeloError)
+# Errors that resending the same message will not fix
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused,)
+
+NOTIFICATION_STYLES = {
+    "message": {"icon": "💬", "color": "#3B82F6"},
+    "qa_reply": {"icon": "💡", "color": "#10B981"},
+    "course_update": {"icon": "📚", "color": "#F59E0B"},
+    "test_result": {"icon": "📊", "color": "#8B5CF6"},
+    "system": {"icon": "🔔", "color": "#6B7280"}
+}
+
 class EmailService:
     def __init__(self):
         self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
@@ -17,6 +44,95 @@ class EmailService:
         self.smtp_password = os.getenv("SMTP_PASSWORD", "")
         self.from_email = os.getenv("FROM_EMAIL", "noreply@operatorskillshub.com")
         self.from_name = os.getenv("FROM_NAME", "Operator Skills Hub")
+        self.starttls = settings.smtp_starttls
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+    
+    def is_configured(self) -> bool:
+        """Credentials are set, or STARTTLS is off for a local relay that needs no login"""
+        return bool(self.smtp_username and self.smtp_password) or not self.starttls
+    
+    def build_message(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: Optional[str] = None
+    ) -> MIMEMultipart:
+        """Create the MIME message for an email."""
+        message = MIMEMultipart("alternative")
+        message["Subject"] = subject
+        message["From"] = f"{self.from_name} <{self.from_email}>"
+        message["To"] = to_email
+        
+        # Add text content
+        if text_content:
+            text_part = MIMEText(text_content, "plain")
+            message.attach(text_part)
+        
+        # Add HTML content
+        html_part = MIMEText(html_content, "html")
+        message.attach(html_part)
+        return message
+    
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=settings.smtp_timeout)
+        try:
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+            if self.smtp_username:
+                server.login(self.smtp_username, self.smtp_password)
+        except Exception:
+            server.close()
+            raise
+        self.connections_opened += 1
+        return server
+    
+    def _connection(self) -> smtplib.SMTP:
+        """The open connection, reconnecting when it has been idle too long; called with the lock held"""
+        if self._server is not None and time.monotonic() - self._last_used > settings.smtp_idle_timeout:
+            self._disconnect()
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+    
+    def _disconnect(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+    
+    def deliver(self, to_email: str, message: MIMEMultipart):
+        """Send over the shared connection; raises on failure.
+        
+        A connection the server closed while idle is reopened and the
+        message sent again once.
+        """
+        with self._lock:
+            for attempt in range(2):
+                server = self._connection()
+                try:
+                    server.sendmail(self.from_email, to_email, message.as_string())
+                    break
+                except RECONNECT_ERRORS:
+                    self._disconnect()
+                    if attempt:
+                        raise
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                    raise  # The server answered; the connection is still usable
+                except Exception:
+                    self._disconnect()
+                    raise
+            self._last_used = time.monotonic()
+    
+    def close(self):
+        """Close the shared SMTP connection"""
+        with self._lock:
+            self._disconnect()
     
     def send_email(
         self,
@@ -26,33 +142,12 @@ class EmailService:
         text_content: Optional[str] = None
     ) -> bool:
         """Send an email notification."""
-        if not self.smtp_username or not self.smtp_password:
+        if not self.is_configured():
             print("Email configuration not set, skipping email notification")
             return False
         
         try:
-            # Create message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = f"{self.from_name} <{self.from_email}>"
-            message["To"] = to_email
-            
-            # Add text content
-            if text_content:
-                text_part = MIMEText(text_content, "plain")
-                message.attach(text_part)
-            
-            # Add HTML content
-            html_part = MIMEText(html_content, "html")
-            message.attach(html_part)
-            
-            # Create secure connection and send email
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls(context=context)
-                server.login(self.smtp_username, self.smtp_password)
-                server.sendmail(self.from_email, to_email, message.as_string())
-            
+            self.deliver(to_email, self.build_message(to_email, subject, html_content, text_content))
             print(f"Email sent successfully to {to_email}")
             return True
             
@@ -70,6 +165,20 @@ class EmailService:
         action_url: Optional[str] = None
     ) -> bool:
         """Send a formatted notification email."""
+        subject, html_content, text_content = self.notification_email(
+            notification_type, title, content, course_title, action_url
+        )
+        return self.send_email(to_email, subject, html_content, text_content)
+    
+    def notification_email(
+        self,
+        notification_type: str,
+        title: str,
+        content: str,
+        course_title: Optional[str] = None,
+        action_url: Optional[str] = None
+    ) -> tuple:
+        """Subject, HTML and text of a notification email."""
         
         # Create HTML content
         html_content = self._create_notification_html(
@@ -81,7 +190,65 @@ class EmailService:
             title, content, course_title, action_url, notification_type
         )
         
-        return self.send_email(to_email, title, html_content, text_content)
+        return title, html_content, text_content
+    
+    def digest_email(self, notifications: List[Dict[str, Any]]) -> tuple:
+        """Subject, HTML and text of one email summarising several notifications."""
+        subject = f"You have {len(notifications)} new notifications"
+        
+        items_html = ""
+        items_text = ""
+        for notification in notifications:
+            info = NOTIFICATION_STYLES.get(notification["notification_type"], NOTIFICATION_STYLES["system"])
+            course_title = notification.get("course_title")
+            action_url = notification.get("action_url")
+            items_html += f"""
+                    <div style="background: white; padding: 20px; border-radius: 8px; border-left: 4px solid {info['color']}; margin-bottom: 15px;">
+                        <h3 style="margin: 0 0 10px 0; font-size: 16px;">{info['icon']} {notification['title']}</h3>
+                        <p style="margin: 0;">{notification['content']}</p>
+                        {f'<p style="margin: 10px 0 0 0; color: #6B7280;"><strong>Course:</strong> {course_title}</p>' if course_title else ''}
+                        {f'<p style="margin: 10px 0 0 0;"><a href="{action_url}" style="color: {info["color"]}; font-weight: bold;">View Details</a></p>' if action_url else ''}
+                    </div>"""
+            items_text += f"- {notification['title']}\n  {notification['content']}\n"
+            if course_title:
+                items_text += f"  Course: {course_title}\n"
+            if action_url:
+                items_text += f"  View Details: {action_url}\n"
+            items_text += "\n"
+        
+        html_content = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>{subject}</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+            <div style="background: linear-gradient(135deg, #3B82F6, #1E40AF); padding: 30px; text-align: center; border-radius: 10px 10px 0 0;">
+                <h1 style="color: white; margin: 0; font-size: 24px;">
+                    🔔 {subject}
+                </h1>
+            </div>
+            
+            <div style="background: #f8fafc; padding: 30px; border-radius: 0 0 10px 10px; border: 1px solid #e2e8f0;">
+                {items_html}
+                
+                <hr style="border: none; border-top: 1px solid #e2e8f0; margin: 30px 0;">
+                <p style="font-size: 14px; color: #6B7280; text-align: center;">
+                    This is an automated notification from Operator Skills Hub.<br>
+                    You can manage your notification preferences in your account settings.
+                </p>
+            </div>
+        </body>
+        </html>
+        """
+        
+        text_content = f"{subject}\n\n{items_text}"
+        text_content += "This is an automated notification from Operator Skills Hub.\n"
+        text_content += "You can manage your notification preferences in your account settings."
+        
+        return subject, html_content, text_content
     
     def _create_notification_html(
         self,
@@ -94,15 +261,7 @@ class EmailService:
         """Create HTML content for notification email."""
         
         # Get notification icon and color based on type
-        icon_map = {
-            "message": {"icon": "💬", "color": "#3B82F6"},
-            "qa_reply": {"icon": "💡", "color": "#10B981"},
-            "course_update": {"icon": "📚", "color": "#F59E0B"},
-            "test_result": {"icon": "📊", "color": "#8B5CF6"},
-            "system": {"icon": "🔔", "color": "#6B7280"}
-        }
-        
-        notification_info = icon_map.get(notification_type, icon_map["system"])
+        notification_info = NOTIFICATION_STYLES.get(notification_type, NOTIFICATION_STYLES["system"])
         
         return f"""
         <!DOCTYPE html>
@@ -165,18 +324,152 @@ class EmailService:
         
         return text
 
-# Global email service instance
-email_service = EmailService()
-
-
-
-
+@dataclass
+class OutgoingEmail:
+    """An email waiting in the mail queue"""
+    to_email: str
+    subject: str
+    html_content: str
+    text_content: Optional[str] = None
+    attempts: int = 0
 
 
+class MailQueue:
+    """Outbound mail queue drained by one worker thread.
+    
+    Emails are sent as soon as they are queued, over the service's shared
+    connection and at most settings.email_rate_limit per second. Failed
+    sends are retried with exponential backoff up to
+    settings.email_max_attempts times. Only transactional email belongs
+    here: anything still queued when the process dies is lost, so nothing
+    is held back waiting for other mail.
+    """
+    
+    def __init__(self, service: EmailService, rate_limit: float = None,
+                 max_attempts: int = None):
+        self.service = service
+        self.rate_limit = settings.email_rate_limit if rate_limit is None else rate_limit
+        self.max_attempts = settings.email_max_attempts if max_attempts is None else max_attempts
+        self._scheduled: List[tuple] = []  # (due, seq, OutgoingEmail)
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._busy = False
+        self._stopping = False
+        self._next_send = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"sent": 0, "failed": 0, "retried": 0}
+    
+    def start(self):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="mail-queue")
+                self._thread.start()
+    
+    def _schedule(self, due: float, item):
+        """Add an item to the schedule; called with the condition held"""
+        heapq.heappush(self._scheduled, (due, next(self._seq), item))
+        self._condition.notify()
+    
+    def enqueue(self, to_email: str, subject: str, html_content: str,
+                text_content: Optional[str] = None):
+        """Queue an email for sending as soon as the rate limit allows"""
+        with self._condition:
+            self._schedule(time.monotonic(), OutgoingEmail(to_email, subject, html_content, text_content))
+    
+    def _next(self) -> Optional[OutgoingEmail]:
+        """Wait for the next email that is due; None once stopped and drained"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._scheduled and (self._scheduled[0][0] <= now or self._stopping):
+                    self._busy = True
+                    return heapq.heappop(self._scheduled)[2]
+                if self._stopping:
+                    return None
+                self._condition.notify_all()  # Wake flush() when idle
+                timeout = self._scheduled[0][0] - now if self._scheduled else None
+                self._condition.wait(timeout)
+    
+    def _run(self):
+        while True:
+            email = self._next()
+            if email is None:
+                break
+            if self.rate_limit > 0:
+                delay = self._next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self._next_send = max(self._next_send, time.monotonic()) + 1.0 / self.rate_limit
+            self._send(email)
+        self.service.close()
+    
+    def _send(self, email: OutgoingEmail):
+        email.attempts += 1
+        try:
+            if not self.service.is_configured():
+                raise RuntimeError("Email configuration not set")
+            message = self.service.build_message(
+                email.to_email, email.subject, email.html_content, email.text_content
+            )
+            self.service.deliver(email.to_email, message)
+        except Exception as e:
+            with self._condition:
+                self._busy = False
+                permanent = isinstance(e, PERMANENT_ERRORS + (RuntimeError,))
+                if not permanent and email.attempts < self.max_attempts and not self._stopping:
+                    self.stats["retried"] += 1
+                    backoff = settings.email_retry_backoff * 2 ** (email.attempts - 1)
+                    self._schedule(time.monotonic() + backoff, email)
+                else:
+                    self.stats["failed"] += 1
+                    print(f"Failed to send email to {email.to_email}: {str(e)}")
+            return
+        with self._condition:
+            self._busy = False
+            self.stats["sent"] += 1
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is due (retries waiting out their backoff aside); returns whether it drained"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._busy or (self._scheduled and self._scheduled[0][0] <= time.monotonic()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+    
+    def stop(self, timeout: float = None):
+        """Send everything still queued (retries are not waited for) and stop the worker"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(settings.email_shutdown_timeout if timeout is None else timeout)
 
 
+# Global email service instance
+email_service = EmailService()
 
+_mail_queue: Optional[MailQueue] = None
+_mail_queue_lock = threading.Lock()
 
 
+def get_mail_queue() -> MailQueue:
+    """The process-wide mail queue; its worker starts on first use"""
+    global _mail_queue
+    with _mail_queue_lock:
+        if _mail_queue is None:
+            _mail_queue = MailQueue(email_service)
+            _mail_queue.start()
+        return _mail_queue
 
 
+def close_mail_queue():
+    """Drain and stop the mail queue; called on application shutdown"""
+    global _mail_queue
+    with _mail_queue_lock:
+        mail_queue, _mail_queue = _mail_queue, None
+    if mail_queue is not None:
+        mail_queue.stop()
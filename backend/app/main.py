@@ -6,13 +6,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from contextlib import asynccontextmanager
 import os
+import asyncio
 
 from .core.config import settings
-from .core.database import create_tables
-from .api import auth, courses, users, learning, ai, course_management, user_profiles, content_management, instructor_ai, pdf_serve, student_learning, student_enrollment, assessments, learning_analytics, course_requests, web_content, image_serve, course_images, messaging, analytics, time_tracking, security, schedule
+from .core.database import create_tables, pool_status, close_async_engine
+from .core.email import close_mail_queue
+from .services.llm_client import close_llm_client
+from .services.job_queue import start_embedded_worker
+from .services.notification_broker import close_notification_broker
+from .api import auth, courses, users, learning, ai, course_management, user_profiles, content_management, instructor_ai, pdf_serve, student_learning, student_enrollment, assessments, learning_analytics, course_requests, web_content, image_serve, course_images, messaging, analytics, time_tracking, security, schedule, jobs
 
 # Import all models to ensure they are registered with SQLAlchemy
-from .models import user, course, learning as learning_models, course_request, messaging as messaging_models, analytics as analytics_models
+from .models import user, course, learning as learning_models, course_request, messaging as messaging_models, analytics as analytics_models, jobs as jobs_models
 
 
 async def seed_database_if_empty():
@@ -60,9 +65,17 @@ async def lifespan(app: FastAPI):
     # Seed database if empty
     await seed_database_if_empty()
     
+    # Background jobs; separate workers can be run with run_worker.py
+    job_worker = start_embedded_worker()
+    
     yield
     # Shutdown
-    pass
+    if job_worker:
+        job_worker.stop()
+    await close_llm_client()
+    await close_notification_broker()
+    await asyncio.to_thread(close_mail_queue)  # Sends emails still queued
+    await close_async_engine()
 
 
 # Create FastAPI application
@@ -136,6 +149,7 @@ app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics &
 app.include_router(time_tracking.router, prefix="/api/time-tracking", tags=["Time Tracking"])
 app.include_router(security.router, prefix="/api/security", tags=["Security"])
 app.include_router(schedule.router, prefix="/api/schedule", tags=["Schedule & Events"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Background Jobs"])
 
 
 @app.get("/")
@@ -151,7 +165,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "version": settings.app_version}
+    return {"status": "healthy", "version": settings.app_version, "database_pool": pool_status()}
 
 @app.get("/api/env-check")
 async def env_check():
@@ -6,6 +6,7 @@ from .course import Course, CourseModule, CourseContent, CourseFileContent
 from .learning import Enrollment, LearningSession, Assessment, AssessmentAttempt
 from .course_request import CourseRequest
 from .ai import ContentGeneration, PredictiveScore, InstructorMetric
+from .jobs import Job
 
 __all__ = [
     "User",
@@ -21,5 +22,6 @@ __all__ = [
     "CourseRequest",
     "ContentGeneration",
     "PredictiveScore",
-    "InstructorMetric"
+    "InstructorMetric",
+    "Job"
 ]
@@ -1,7 +1,7 @@
 """
 Analytics and reporting models for admin dashboard.
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, JSON, Date
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, JSON, Date, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -22,6 +22,12 @@ class AnalyticsEvent(Base):
     user_agent = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # Reports count one event type, or active users, over a date range
+    __table_args__ = (
+        Index("ix_analytics_events_event_type_created_at", "event_type", "created_at"),
+        Index("ix_analytics_events_created_at", "created_at"),
+    )
+    
     # Relationships
     user = relationship("User")
 
@@ -101,6 +107,11 @@ class CourseAnalytics(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # One rollup row per course and day
+    __table_args__ = (
+        Index("ix_course_analytics_course_id_date", "course_id", "date", unique=True),
+    )
+    
     # Relationships
     course = relationship("Course")
 
@@ -138,6 +149,11 @@ class UserEngagementMetrics(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # One rollup row per user and day
+    __table_args__ = (
+        Index("ix_user_engagement_metrics_user_id_date", "user_id", "date", unique=True),
+    )
+    
     # Relationships
     user = relationship("User")
 
@@ -0,0 +1,41 @@
+"""
+Background job models.
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, JSON, Index, text
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class Job(Base):
+    """Queued background work such as document processing and content generation."""
+
+    __tablename__ = "jobs"
+
+    id = Column(String(36), primary_key=True)  # UUID, safe to hand out in status URLs
+    job_type = Column(String(50), nullable=False)  # process_document, generate_content, create_test
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    progress = Column(Float, default=0.0)  # 0-1
+    progress_message = Column(String(255), nullable=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    periodic = Column(Boolean, default=False, server_default=text("false"), nullable=False)  # Enqueued by the schedule
+    locked_by = Column(String(100), nullable=True)  # Worker holding the job
+    locked_until = Column(DateTime(timezone=True), nullable=True)  # Lease; expired leases are requeued
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_created_at", "status", "created_at"),
+        Index("ix_jobs_user_id_created_at", "user_id", "created_at"),
+        # At most one pending run per periodic job type, however many workers schedule it
+        Index(
+            "uq_jobs_periodic_pending", "job_type", unique=True,
+            postgresql_where=text("periodic AND status IN ('queued', 'running')"),
+            sqlite_where=text("periodic = 1 AND status IN ('queued', 'running')")
+        ),
+    )
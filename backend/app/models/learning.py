@@ -1,7 +1,7 @@
 """
 Learning and progress tracking models.
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, JSON, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -23,6 +23,15 @@ class Enrollment(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Access checks look up a student's enrollment; course pages list a course's enrollments;
+    # analytics count enrollments and completions (dated by the last update) per day
+    __table_args__ = (
+        Index("ix_enrollments_user_id_course_id_status", "user_id", "course_id", "status"),
+        Index("ix_enrollments_course_id_status", "course_id", "status"),
+        Index("ix_enrollments_created_at", "created_at"),
+        Index("ix_enrollments_completed_at", func.coalesce(updated_at, created_at)),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="enrollments")
     course = relationship("Course", back_populates="enrollments")
@@ -44,6 +53,11 @@ class LearningSession(Base):
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     ended_at = Column(DateTime(timezone=True), nullable=True)
     
+    # Analytics aggregate sessions per day
+    __table_args__ = (
+        Index("ix_learning_sessions_started_at", "started_at"),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="learning_sessions")
     enrollment = relationship("Enrollment", back_populates="learning_sessions")
@@ -109,6 +123,11 @@ class AssessmentAttempt(Base):
     completed_at = Column(DateTime(timezone=True), nullable=True)
     time_taken_minutes = Column(Integer, nullable=True)
     
+    # Analytics aggregate attempts per day
+    __table_args__ = (
+        Index("ix_assessment_attempts_started_at", "started_at"),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="assessment_attempts")
     assessment = relationship("Assessment", back_populates="attempts")
@@ -132,6 +151,15 @@ class LearningTimeTracking(Base):
     ended_at = Column(DateTime(timezone=True), nullable=True)
     tracking_metadata = Column(JSON, nullable=True)  # Additional tracking data
     
+    # Heartbeats look up a user's active session; ended sessions are only read per course
+    __table_args__ = (
+        Index(
+            "ix_learning_time_tracking_active_user_id_session_id", "user_id", "session_id",
+            postgresql_where=text("is_active"), sqlite_where=text("is_active = 1")
+        ),
+        Index("ix_learning_time_tracking_user_id_course_id", "user_id", "course_id"),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="learning_time_tracking")
     course = relationship("Course", back_populates="learning_time_tracking")
@@ -1,7 +1,7 @@
 """
 Messaging and Q&A system models.
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -26,6 +26,15 @@ class Message(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Reply counts; most messages start a thread, so only replies are indexed
+    __table_args__ = (
+        Index(
+            "ix_messages_parent_message_id", "parent_message_id",
+            postgresql_where=text("parent_message_id IS NOT NULL"),
+            sqlite_where=text("parent_message_id IS NOT NULL")
+        ),
+    )
+    
     # Relationships
     sender = relationship("User", foreign_keys=[sender_id])
     recipient = relationship("User", foreign_keys=[recipient_id])
@@ -52,9 +61,26 @@ class QAPost(Base):
     tags = Column(JSON, nullable=True)  # List of tags for categorization
     attachments = Column(JSON, nullable=True)  # List of file attachments
     view_count = Column(Integer, default=0)
+    # Counters maintained with each vote and reply, so listings need no aggregation
+    upvotes = Column(Integer, nullable=False, default=0, server_default="0")
+    downvotes = Column(Integer, nullable=False, default=0, server_default="0")
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_activity_at = Column(DateTime(timezone=True), server_default=func.now())  # Creation or latest reply
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Thread listings: top-level posts of a course, pinned first, by score or activity
+    __table_args__ = (
+        Index(
+            "ix_qa_posts_course_id_score", "course_id", text("is_pinned DESC"), text("(upvotes - downvotes) DESC"),
+            postgresql_where=text("parent_post_id IS NULL"), sqlite_where=text("parent_post_id IS NULL")
+        ),
+        Index(
+            "ix_qa_posts_course_id_last_activity_at", "course_id", text("is_pinned DESC"), text("last_activity_at DESC"),
+            postgresql_where=text("parent_post_id IS NULL"), sqlite_where=text("parent_post_id IS NULL")
+        ),
+    )
+    
     # Relationships
     course = relationship("Course")
     author = relationship("User")
@@ -96,6 +122,20 @@ class Notification(Base):
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     read_at = Column(DateTime(timezone=True), nullable=True)
+    # Still to be emailed in the recipient's next notification digest
+    email_pending = Column(Boolean, default=False, server_default=text("false"), nullable=False)
+    email_attempts = Column(Integer, default=0, server_default=text("0"), nullable=False)  # Failed sends so far
+    
+    # A user's notifications, newest first, optionally only unread ones; analytics count them per day;
+    # the digest job reads the (few) notifications still waiting for an email
+    __table_args__ = (
+        Index("ix_notifications_user_id_is_read_created_at", "user_id", "is_read", "created_at"),
+        Index("ix_notifications_created_at", "created_at"),
+        Index(
+            "ix_notifications_email_pending", "user_id",
+            postgresql_where=text("email_pending"), sqlite_where=text("email_pending = 1")
+        ),
+    )
     
     # Relationships
     user = relationship("User")
@@ -31,6 +31,12 @@ class VoteType(str, Enum):
     DOWN = "down"
 
 
+class QAPostSort(str, Enum):
+    RECENT = "recent"
+    SCORE = "score"
+    ACTIVITY = "activity"
+
+
 # Message Schemas
 class MessageBase(BaseModel):
     subject: str = Field(..., max_length=255)
@@ -110,8 +116,11 @@ class QAPostResponse(QAPostBase):
     author_name: Optional[str] = None
     course_title: Optional[str] = None
     reply_count: int = 0
+    upvotes: int = 0
+    downvotes: int = 0
     vote_score: int = 0
     user_vote: Optional[VoteType] = None
+    last_activity_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -5,11 +5,14 @@ Generates learning materials, lesson plans, and tests from uploaded content
 
 import json
 import re
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional
 from datetime import datetime
-import requests
 import os
 from ..core.config import settings
+from .llm_client import get_llm_client
+from .text_cache import cached_pdf_text
+
+SYSTEM_PROMPT = "You are an expert educational content creator specializing in construction industry training. Create high-quality, practical educational materials. Use UK English spelling and terminology throughout. Ensure all content is appropriate for the construction industry and follows British standards and regulations."
 
 
 class AIContentGenerator:
@@ -17,16 +20,16 @@ class AIContentGenerator:
     
     def __init__(self):
         self.api_key = settings.openai_api_key or os.getenv("OPENAI_API_KEY", "")
-        self.base_url = "https://api.openai.com/v1/chat/completions"
         self.model = settings.ai_model
         self.max_tokens = settings.ai_max_tokens
         self.temperature = settings.ai_temperature
     
-    def generate_learning_material(self, 
+    async def generate_learning_material(self, 
                                  original_content: str, 
                                  title: str, 
                                  description: str,
-                                 additional_instructions: str = "") -> Dict[str, Any]:
+                                 additional_instructions: str = "",
+                                 stream: bool = False) -> Dict[str, Any]:
         """Generate learning material from original content"""
         
         prompt = f"""
@@ -49,13 +52,14 @@ class AIContentGenerator:
         Format the output as a well-structured educational resource suitable for construction industry training.
         """
         
-        return self._call_ai_api(prompt, "learning_material")
+        return await self._call_ai_api(prompt, "learning_material", stream)
     
-    def generate_lesson_plan(self, 
+    async def generate_lesson_plan(self, 
                            original_content: str, 
                            title: str, 
                            description: str,
-                           additional_instructions: str = "") -> Dict[str, Any]:
+                           additional_instructions: str = "",
+                           stream: bool = False) -> Dict[str, Any]:
         """Generate a lesson plan from original content"""
         
         prompt = f"""
@@ -80,14 +84,15 @@ class AIContentGenerator:
         Format as a professional lesson plan suitable for construction industry training.
         """
         
-        return self._call_ai_api(prompt, "lesson_plan")
+        return await self._call_ai_api(prompt, "lesson_plan", stream)
     
-    def generate_knowledge_test(self, 
+    async def generate_knowledge_test(self, 
                               original_content: str, 
                               title: str, 
                               description: str,
                               additional_instructions: str = "",
-                              question_count: int = 10) -> Dict[str, Any]:
+                              question_count: int = 10,
+                              stream: bool = False) -> Dict[str, Any]:
         """Generate a knowledge test from original content"""
         
         prompt = f"""
@@ -126,42 +131,36 @@ class AIContentGenerator:
         }}
         """
         
-        return self._call_ai_api(prompt, "knowledge_test")
+        return await self._call_ai_api(prompt, "knowledge_test", stream)
     
-    def _call_ai_api(self, prompt: str, content_type: str) -> Dict[str, Any]:
-        """Call OpenAI API to generate content"""
+    async def _call_ai_api(self, prompt: str, content_type: str, stream: bool = False) -> Dict[str, Any]:
+        """Call OpenAI API to generate content.
+
+        With stream=True the content is returned as {"chunks": async iterator of text}
+        instead of a finished "content" string.
+        """
+        
+        if stream:
+            return {
+                "chunks": self._stream_ai_api(prompt, content_type),
+                "content_type": content_type,
+                "ai_model": self.model
+            }
         
         if not self.api_key:
             # Fallback to mock data if no API key
             return self._generate_mock_content(content_type)
         
         try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are an expert educational content creator specializing in construction industry training. Create high-quality, practical educational materials. Use UK English spelling and terminology throughout. Ensure all content is appropriate for the construction industry and follows British standards and regulations."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": self.max_tokens,
-                "temperature": self.temperature
-            }
-            
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            
-            result = response.json()
-            generated_content = result["choices"][0]["message"]["content"]
+            generated_content = await get_llm_client().complete(
+                prompt,
+                SYSTEM_PROMPT,
+                content_type=content_type,
+                model=self.model,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                namespace="ai_content_generator"
+            )
             
             return {
                 "content": generated_content,
@@ -175,6 +174,22 @@ class AIContentGenerator:
             # Fallback to mock data on error
             return self._generate_mock_content(content_type, str(e))
     
+    async def _stream_ai_api(self, prompt: str, content_type: str) -> AsyncIterator[str]:
+        """Yield generated text as it arrives; mock content when no API key is configured"""
+        if not self.api_key:
+            yield self._generate_mock_content(content_type)["content"]
+            return
+        async for delta in get_llm_client().stream_complete(
+            prompt,
+            SYSTEM_PROMPT,
+            content_type=content_type,
+            model=self.model,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            namespace="ai_content_generator"
+        ):
+            yield delta
+    
     def _generate_mock_content(self, content_type: str, error: str = None) -> Dict[str, Any]:
         """Generate mock content when AI API is not available"""
         
@@ -329,17 +344,7 @@ By the end of this lesson, students will be able to:
     def extract_text_from_pdf(self, file_path: str) -> str:
         """Extract text content from PDF file"""
         try:
-            import PyPDF2
-            
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text() + "\n"
-                
-                return text
+            return cached_pdf_text(file_path)
                 
         except ImportError:
             return "PDF text extraction not available. Please install PyPDF2."
@@ -0,0 +1,417 @@
+"""
+Analytics Rollups
+Pre-aggregates dashboard activity into one row per day: platform figures in
+platform_metrics, per-course figures in course_analytics and per-user
+figures in user_engagement_metrics. The rollup job computes the complete
+days after the watermark (the latest day in platform_metrics), so each run
+reads only new history. Dashboards read the stored days and compute the
+days after the watermark, normally just today, live with the same queries.
+
+Days are UTC dates. Per-course and per-user rows are only written for days
+with activity. Cumulative figures (total users, courses and enrollments,
+course completions) are as of the end of the day; the rest count that
+day's activity.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import and_, func, insert, or_
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..models.analytics import AnalyticsEvent, CourseAnalytics, PlatformMetrics, UserEngagementMetrics
+from ..models.course import Course
+from ..models.learning import Assessment, AssessmentAttempt, Enrollment, LearningSession
+from ..models.messaging import Notification
+from ..models.user import User
+from .metrics_query import MetricsQuery
+
+# Days computed per transaction when catching up on history
+ROLLUP_CHUNK_DAYS = 31
+
+PLATFORM_FIELDS = (
+    "total_users", "active_users", "new_registrations", "total_courses", "course_enrollments",
+    "course_completions", "total_learning_hours", "average_session_duration", "assessment_attempts",
+    "assessment_pass_rate", "total_messages_sent", "qa_posts_created", "notification_sent",
+)
+COURSE_FIELDS = (
+    "total_enrollments", "new_enrollments", "completions", "completion_rate", "total_views",
+    "unique_viewers", "average_time_spent", "total_assessments", "passed_assessments", "average_score",
+)
+USER_FIELDS = (
+    "login_count", "learning_time", "courses_accessed", "assessments_completed", "assessments_passed",
+    "messages_sent", "qa_posts_created", "courses_completed",
+)
+
+# An enrollment counts as completed on its last update
+_completed_at = func.coalesce(Enrollment.updated_at, Enrollment.created_at)
+
+
+def utc_today() -> date:
+    return datetime.utcnow().date()
+
+
+def _as_date(value) -> date:
+    # SQLite returns date() as a string
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _days(start: date, end: date) -> Iterable[date]:
+    for offset in range((end - start).days):
+        yield start + timedelta(days=offset)
+
+
+class _Daily(dict):
+    """Metrics per (*by, day); days without rows read as zero"""
+
+    def __init__(self, rows, zero):
+        super().__init__(rows)
+        self.zero = zero
+
+    def __missing__(self, key):
+        return self.zero
+
+
+def _daily(metrics: MetricsQuery, day_column, start: date, end: date, by=()) -> _Daily:
+    """Run metrics per (*by, day) over rows whose day_column falls in [start, end)"""
+    groups = metrics.filter(day_column >= start, day_column < end).group_by(*by, func.date(day_column)).all()
+    rows = {}
+    for key, values in groups.items():
+        key = key if isinstance(key, tuple) else (key,)
+        rows[key[:-1] + (_as_date(key[-1]),)] = values
+    return _Daily(rows, metrics.zero())
+
+
+def compute_platform_days(db: Session, start: date, end: date) -> Dict[date, Dict[str, Any]]:
+    """Platform metrics for each day in [start, end)"""
+    users_before = db.query(func.count(User.id)).filter(User.created_at < start).scalar() or 0
+    courses_before = db.query(func.count(Course.id)).filter(Course.created_at < start).scalar() or 0
+
+    registrations = _daily(MetricsQuery(db, User).count("count"), User.created_at, start, end)
+    courses = _daily(MetricsQuery(db, Course).count("count"), Course.created_at, start, end)
+    enrollments = _daily(MetricsQuery(db, Enrollment).count("count"), Enrollment.created_at, start, end)
+    completions = _daily(
+        MetricsQuery(db, Enrollment).count("count").filter(Enrollment.status == "completed"),
+        _completed_at, start, end
+    )
+    sessions = _daily(
+        MetricsQuery(db, LearningSession).count("count").sum("minutes", LearningSession.duration_minutes),
+        LearningSession.started_at, start, end
+    )
+    attempts = _daily(
+        MetricsQuery(db, AssessmentAttempt).count("count").count("passed", AssessmentAttempt.passed == True),
+        AssessmentAttempt.started_at, start, end
+    )
+    events = _daily(
+        MetricsQuery(db, AnalyticsEvent)
+        .count_distinct("active_users", AnalyticsEvent.user_id)
+        .count("messages", AnalyticsEvent.event_type == "message_sent")
+        .count("qa_posts", AnalyticsEvent.event_type == "qa_post_created"),
+        AnalyticsEvent.created_at, start, end
+    )
+    notifications = _daily(MetricsQuery(db, Notification).count("count"), Notification.created_at, start, end)
+
+    days = {}
+    total_users, total_courses = users_before, courses_before
+    for day in _days(start, end):
+        key = (day,)
+        total_users += registrations[key]["count"]
+        total_courses += courses[key]["count"]
+        session_count, minutes = sessions[key]["count"], sessions[key]["minutes"]
+        attempt_count, passed = attempts[key]["count"], attempts[key]["passed"]
+        days[day] = {
+            "total_users": total_users,
+            "active_users": events[key]["active_users"],
+            "new_registrations": registrations[key]["count"],
+            "total_courses": total_courses,
+            "course_enrollments": enrollments[key]["count"],
+            "course_completions": completions[key]["count"],
+            "total_learning_hours": minutes / 60,
+            "average_session_duration": minutes / session_count if session_count else 0.0,
+            "assessment_attempts": attempt_count,
+            "assessment_pass_rate": passed / attempt_count * 100 if attempt_count else 0.0,
+            "total_messages_sent": events[key]["messages"],
+            "qa_posts_created": events[key]["qa_posts"],
+            "notification_sent": notifications[key]["count"],
+        }
+    return days
+
+
+def compute_course_days(db: Session, start: date, end: date,
+                        course_id: Optional[int] = None) -> Dict[Tuple[int, date], Dict[str, Any]]:
+    """Course metrics for each (course, day) in [start, end) with activity"""
+    enrollment_filter = [Enrollment.course_id == course_id] if course_id else []
+    before = (
+        MetricsQuery(db, Enrollment)
+        .count("total")
+        .count("completed", Enrollment.status == "completed", _completed_at < start)
+        .filter(Enrollment.created_at < start, *enrollment_filter)
+        .group_by(Enrollment.course_id)
+        .all()
+    )
+    enrollments = _daily(
+        MetricsQuery(db, Enrollment).count("count").filter(*enrollment_filter),
+        Enrollment.created_at, start, end, by=[Enrollment.course_id]
+    )
+    completions = _daily(
+        MetricsQuery(db, Enrollment).count("count").filter(Enrollment.status == "completed", *enrollment_filter),
+        _completed_at, start, end, by=[Enrollment.course_id]
+    )
+    sessions = _daily(
+        MetricsQuery(db, LearningSession)
+        .count("count")
+        .count_distinct("users", LearningSession.user_id)
+        .avg("minutes", LearningSession.duration_minutes)
+        .filter(*([LearningSession.course_id == course_id] if course_id else [])),
+        LearningSession.started_at, start, end, by=[LearningSession.course_id]
+    )
+    attempts = _daily(
+        MetricsQuery(db, AssessmentAttempt)
+        .count("count")
+        .count("passed", AssessmentAttempt.passed == True)
+        .avg("score", AssessmentAttempt.score)
+        .join(Assessment, AssessmentAttempt.assessment_id == Assessment.id)
+        .filter(*([Assessment.course_id == course_id] if course_id else [])),
+        AssessmentAttempt.started_at, start, end, by=[Assessment.course_id]
+    )
+
+    active_days = sorted(set(enrollments) | set(completions) | set(sessions) | set(attempts), key=lambda k: k[1])
+    days = {}
+    totals = {course: (counts["total"], counts["completed"]) for course, counts in before.items()}
+    for key in active_days:
+        course, day = key
+        total, completed = totals.get(course, (0, 0))
+        # Completions before start are carried in, later ones added on their day
+        total += enrollments[key]["count"]
+        completed += completions[key]["count"]
+        totals[course] = (total, completed)
+        days[key] = {
+            "total_enrollments": total,
+            "new_enrollments": enrollments[key]["count"],
+            "completions": completed,
+            "completion_rate": completed / total * 100 if total else 0.0,
+            "total_views": sessions[key]["count"],
+            "unique_viewers": sessions[key]["users"],
+            "average_time_spent": float(sessions[key]["minutes"] or 0),
+            "total_assessments": attempts[key]["count"],
+            "passed_assessments": attempts[key]["passed"],
+            "average_score": float(attempts[key]["score"] or 0),
+        }
+    return days
+
+
+def compute_user_days(db: Session, start: date, end: date) -> Dict[Tuple[int, date], Dict[str, Any]]:
+    """Engagement metrics for each (user, day) in [start, end) with activity"""
+    events = _daily(
+        MetricsQuery(db, AnalyticsEvent)
+        .count("logins", AnalyticsEvent.event_type == "login")
+        .count("messages", AnalyticsEvent.event_type == "message_sent")
+        .count("qa_posts", AnalyticsEvent.event_type == "qa_post_created")
+        .filter(AnalyticsEvent.user_id.isnot(None),
+                AnalyticsEvent.event_type.in_(["login", "message_sent", "qa_post_created"])),
+        AnalyticsEvent.created_at, start, end, by=[AnalyticsEvent.user_id]
+    )
+    sessions = _daily(
+        MetricsQuery(db, LearningSession)
+        .sum("minutes", LearningSession.duration_minutes)
+        .count_distinct("courses", LearningSession.course_id),
+        LearningSession.started_at, start, end, by=[LearningSession.user_id]
+    )
+    attempts = _daily(
+        MetricsQuery(db, AssessmentAttempt).count("count").count("passed", AssessmentAttempt.passed == True),
+        AssessmentAttempt.started_at, start, end, by=[AssessmentAttempt.user_id]
+    )
+    completions = _daily(
+        MetricsQuery(db, Enrollment).count("count").filter(Enrollment.status == "completed"),
+        _completed_at, start, end, by=[Enrollment.user_id]
+    )
+
+    days = {}
+    for key in set(events) | set(sessions) | set(attempts) | set(completions):
+        days[key] = {
+            "login_count": events[key]["logins"],
+            "learning_time": sessions[key]["minutes"] / 60,
+            "courses_accessed": sessions[key]["courses"],
+            "assessments_completed": attempts[key]["count"],
+            "assessments_passed": attempts[key]["passed"],
+            "messages_sent": events[key]["messages"],
+            "qa_posts_created": events[key]["qa_posts"],
+            "courses_completed": completions[key]["count"],
+        }
+    return days
+
+
+def compute_platform_totals(db: Session, start: date, end: date) -> Dict[str, Any]:
+    """Period activity over [start, end) summed straight from the activity tables"""
+    enrollments = (
+        MetricsQuery(db, Enrollment)
+        .count("enrollments", Enrollment.created_at >= start, Enrollment.created_at < end)
+        .count("completions", Enrollment.status == "completed", _completed_at >= start, _completed_at < end)
+        .filter(or_(and_(Enrollment.created_at >= start, Enrollment.created_at < end),
+                    and_(_completed_at >= start, _completed_at < end)))
+        .one()
+    )
+    sessions = (
+        MetricsQuery(db, LearningSession)
+        .sum("minutes", LearningSession.duration_minutes)
+        .filter(LearningSession.started_at >= start, LearningSession.started_at < end)
+        .one()
+    )
+    attempts = (
+        MetricsQuery(db, AssessmentAttempt)
+        .count("count")
+        .count("passed", AssessmentAttempt.passed == True)
+        .filter(AssessmentAttempt.started_at >= start, AssessmentAttempt.started_at < end)
+        .one()
+    )
+    events = (
+        MetricsQuery(db, AnalyticsEvent)
+        .count("messages", AnalyticsEvent.event_type == "message_sent")
+        .count("qa_posts", AnalyticsEvent.event_type == "qa_post_created")
+        .filter(AnalyticsEvent.event_type.in_(["message_sent", "qa_post_created"]),
+                AnalyticsEvent.created_at >= start, AnalyticsEvent.created_at < end)
+        .one()
+    )
+    return {
+        "course_enrollments": enrollments["enrollments"],
+        "course_completions": enrollments["completions"],
+        "total_learning_hours": sessions["minutes"] / 60,
+        "assessment_attempts": attempts["count"],
+        "assessments_passed": attempts["passed"],
+        "total_messages_sent": events["messages"],
+        "qa_posts_created": events["qa_posts"],
+    }
+
+
+def get_watermark(db: Session) -> Optional[date]:
+    """The latest rolled-up day"""
+    return _as_date(db.query(func.max(PlatformMetrics.date)).scalar())
+
+
+def platform_days(db: Session, start: date, end: date) -> Dict[date, Dict[str, Any]]:
+    """Platform metrics for each day in [start, end), from rollups where available.
+
+    Rolled-up days are contiguous up to the watermark, so the latest stored
+    day in the period is where the live part starts; no rows means the
+    whole period is after the watermark.
+    """
+    rows = db.query(PlatformMetrics.date, *(getattr(PlatformMetrics, field) for field in PLATFORM_FIELDS)).filter(
+        PlatformMetrics.date >= start, PlatformMetrics.date < end
+    )
+    days = {
+        _as_date(row[0]): {field: value or 0 for field, value in zip(PLATFORM_FIELDS, row[1:])} for row in rows
+    }
+    live_start = max(days) + timedelta(days=1) if days else start
+    if live_start < end:
+        days.update(compute_platform_days(db, live_start, end))
+    return dict(sorted(days.items()))
+
+
+def platform_totals(db: Session, start: date, end: date) -> Dict[str, Any]:
+    """Period activity summed over [start, end), from rollups where available.
+
+    As in platform_days, the latest stored day in the period is where the
+    live part starts.
+    """
+    stored = (
+        MetricsQuery(db, PlatformMetrics)
+        .max("last_day", PlatformMetrics.date)
+        .sum("course_enrollments", PlatformMetrics.course_enrollments)
+        .sum("course_completions", PlatformMetrics.course_completions)
+        .sum("total_learning_hours", PlatformMetrics.total_learning_hours)
+        .sum("assessment_attempts", PlatformMetrics.assessment_attempts)
+        .sum("assessments_passed", PlatformMetrics.assessment_pass_rate * PlatformMetrics.assessment_attempts / 100)
+        .sum("total_messages_sent", PlatformMetrics.total_messages_sent)
+        .sum("qa_posts_created", PlatformMetrics.qa_posts_created)
+        .filter(PlatformMetrics.date >= start, PlatformMetrics.date < end)
+        .one()
+    )
+    last_day = stored.pop("last_day")
+    live_start = _as_date(last_day) + timedelta(days=1) if last_day is not None else start
+    if live_start < end:
+        live = compute_platform_totals(db, live_start, end)
+        stored = {field: value + live[field] for field, value in stored.items()}
+    # The stored pass rates give back whole pass counts up to float rounding
+    stored["assessments_passed"] = round(stored["assessments_passed"])
+    return stored
+
+
+def course_days(db: Session, start: date, end: date,
+                course_id: Optional[int] = None) -> Dict[Tuple[int, date], Dict[str, Any]]:
+    """Course metrics for each (course, day) in [start, end) with activity, from rollups where available"""
+    watermark = get_watermark(db)
+    days = {}
+    if watermark is not None and start <= watermark:
+        query = db.query(
+            CourseAnalytics.course_id, CourseAnalytics.date, *(getattr(CourseAnalytics, field) for field in COURSE_FIELDS)
+        ).filter(CourseAnalytics.date >= start, CourseAnalytics.date < min(end, watermark + timedelta(days=1)))
+        if course_id:
+            query = query.filter(CourseAnalytics.course_id == course_id)
+        days = {
+            (row[0], row[1]): {field: value or 0 for field, value in zip(COURSE_FIELDS, row[2:])}
+            for row in query
+        }
+    live_start = max(start, watermark + timedelta(days=1)) if watermark is not None else start
+    if live_start < end:
+        days.update(compute_course_days(db, live_start, end, course_id))
+    return days
+
+
+def _first_day(db: Session) -> Optional[date]:
+    """The first day with any users, where a fresh rollup starts"""
+    first = db.query(func.min(User.created_at)).scalar()
+    return _as_date(first) if first is not None else None
+
+
+def run_rollup(db: Session, progress=None) -> Dict[str, Any]:
+    """Roll up every complete day after the watermark; safe to run repeatedly.
+
+    The last analytics_rollup_lookback_days rolled-up days are recomputed
+    to pick up rows that arrived after they were rolled up.
+    """
+    today = utc_today()
+    watermark = get_watermark(db)
+    if watermark is None:
+        start = _first_day(db)
+        if start is None:
+            return {"days": 0}
+    else:
+        start = watermark + timedelta(days=1 - settings.analytics_rollup_lookback_days)
+    start = min(start, today)
+    total_days = (today - start).days
+
+    chunk_start = start
+    while chunk_start < today:
+        chunk_end = min(chunk_start + timedelta(days=ROLLUP_CHUNK_DAYS), today)
+        platform = compute_platform_days(db, chunk_start, chunk_end)
+        courses = compute_course_days(db, chunk_start, chunk_end)
+        users = compute_user_days(db, chunk_start, chunk_end)
+
+        # Replace the chunk's days in one transaction
+        for model in (PlatformMetrics, CourseAnalytics, UserEngagementMetrics):
+            db.query(model).filter(model.date >= chunk_start, model.date < chunk_end).delete(synchronize_session=False)
+        db.execute(insert(PlatformMetrics), [{"date": day, **metrics} for day, metrics in platform.items()])
+        if courses:
+            db.execute(insert(CourseAnalytics), [
+                {"course_id": course, "date": day, **metrics} for (course, day), metrics in courses.items()
+            ])
+        if users:
+            db.execute(insert(UserEngagementMetrics), [
+                {"user_id": user, "date": day, **metrics} for (user, day), metrics in users.items()
+            ])
+        db.commit()
+
+        chunk_start = chunk_end
+        if progress is not None:
+            progress((chunk_start - start).days / total_days, f"Rolled up analytics to {chunk_start.isoformat()}")
+
+    return {
+        "days": total_days,
+        "from": start.isoformat(),
+        "watermark": (today - timedelta(days=1)).isoformat() if total_days else None
+    }
@@ -0,0 +1,256 @@
+"""
+Learning Content Corpus
+In-process cache of the NOCN assessment templates and learning-content
+markdown used as context for knowledge tests. Files are split into heading
+sections and tokenized once; later calls only stat the files (at most every
+few seconds) and re-read those whose mtime or size changed. Instead of
+pasting every file into the prompt, callers retrieve the sections most
+relevant to the course with BM25 and pack them into a character budget.
+"""
+
+import re
+import json
+import math
+import time
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ..core.config import settings
+
+TEMPLATES = "templates"
+LEARNING = "learning"
+
+INDEX_FILE = "content-index.json"
+TEMPLATES_DIR = "assessment-templates"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_HEADING = re.compile(r"^(#{1,3})\s+(.*)$")
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+you your we our can should must may not all any each other into their they them which who what when
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens without stopwords or single letters"""
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+@dataclass
+class Section:
+    """A heading and the text under it, tokenized for retrieval"""
+    kind: str
+    source: str  # Title of the file the section came from
+    order: int  # Position across the corpus, for stable output
+    heading: str
+    text: str
+    terms: Counter
+    length: int
+
+
+def split_sections(markdown: str) -> List[Tuple[str, str]]:
+    """Split markdown at level 1-3 headings into (heading path, body) pairs"""
+    sections = []
+    path: List[str] = []
+    heading, lines = "", []
+
+    def flush():
+        body = "\n".join(lines).strip()
+        if body:
+            sections.append((heading, body))
+
+    for line in markdown.splitlines():
+        match = _HEADING.match(line)
+        if match:
+            flush()
+            level = len(match.group(1))
+            path = path[:level - 1] + [match.group(2).strip()]
+            heading, lines = " > ".join(path), []
+        else:
+            lines.append(line)
+    flush()
+    return sections
+
+
+class ContentCorpus:
+    """Sections of the learning-content directory, kept in sync with the files"""
+
+    def __init__(self, root: Path, check_interval: float = None):
+        self.root = root
+        self.check_interval = settings.corpus_check_interval if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._stats: Dict[Path, Tuple[int, int]] = {}
+        self._files: Dict[Path, List[Section]] = {}
+        self._sections: List[Section] = []
+        self._doc_freq: Dict[str, Counter] = {}
+        self._avg_length: Dict[str, float] = {}
+        self._course_list: Optional[List[Tuple[Path, str]]] = None
+        self._index_stat: Optional[Tuple[int, int]] = None
+        self.reads = 0
+
+    def _course_files(self) -> List[Tuple[Path, str]]:
+        """Course markdown files listed in content-index.json, with their titles"""
+        index_file = self.root / INDEX_FILE
+        if not index_file.exists():
+            return []
+        with open(index_file, "r", encoding="utf-8") as f:
+            index_data = json.load(f)
+
+        # Flat {"content": [...]} lists and the categorised library layout are both accepted
+        items = [item for item in index_data.get("content", []) if item.get("type") == "course_content"]
+        library = index_data.get("learning_content", {})
+        for category in library.get("categories", {}).values():
+            items.extend(category.get("courses", []))
+        return [(self.root / item["file"], item.get("title", item["file"])) for item in items if item.get("file")]
+
+    def _sources(self) -> List[Tuple[Path, str, str]]:
+        """Template and course files; the index is only re-parsed when it changes"""
+        index_stat = self._stat(self.root / INDEX_FILE)
+        if self._course_list is None or index_stat != self._index_stat:
+            self._course_list = self._course_files()
+            self._index_stat = index_stat
+        sources = [(path, path.stem, TEMPLATES) for path in sorted((self.root / TEMPLATES_DIR).glob("*.md"))]
+        sources.extend((path, title, LEARNING) for path, title in self._course_list)
+        return sources
+
+    def _stat(self, path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self):
+        """Re-read changed files; called with the lock held"""
+        now = time.monotonic()
+        if self._sections and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        sources = self._sources()
+        wanted = {path for path, _, _ in sources}
+        changed = False
+        for path in set(self._files) - wanted:
+            self._stats.pop(path, None)
+            self._files.pop(path, None)
+            changed = True
+
+        for path, title, kind in sources:
+            stat = self._stat(path)
+            if stat is None:
+                changed |= self._files.pop(path, None) is not None
+                self._stats.pop(path, None)
+                continue
+            if self._stats.get(path) == stat and path in self._files:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                markdown = f.read()
+            self.reads += 1
+            self._stats[path] = stat
+            self._files[path] = [
+                self._section(kind, title, heading, body) for heading, body in split_sections(markdown)
+            ]
+            changed = True
+
+        if changed or not self._sections:
+            self._rebuild(sources)
+
+    @staticmethod
+    def _section(kind: str, source: str, heading: str, body: str) -> Section:
+        terms = Counter(tokenize(f"{heading} {body}"))
+        return Section(kind, source, 0, heading, body, terms, sum(terms.values()))
+
+    def _rebuild(self, sources: List[Tuple[Path, str, str]]):
+        """Recompute corpus order and BM25 statistics"""
+        sections = []
+        for path, _, _ in sources:
+            sections.extend(self._files.get(path, []))
+        doc_freq = {TEMPLATES: Counter(), LEARNING: Counter()}
+        lengths = {TEMPLATES: [], LEARNING: []}
+        for order, section in enumerate(sections):
+            section.order = order
+            doc_freq[section.kind].update(section.terms.keys())
+            lengths[section.kind].append(section.length)
+        self._sections = sections
+        self._doc_freq = doc_freq
+        self._avg_length = {kind: (sum(l) / len(l) if l else 0.0) for kind, l in lengths.items()}
+
+    def _score(self, section: Section, query: Counter, total: int) -> float:
+        doc_freq = self._doc_freq[section.kind]
+        avg_length = self._avg_length[section.kind] or 1.0
+        score = 0.0
+        for term in query:
+            tf = section.terms.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (total - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * section.length / avg_length))
+        return score
+
+    def select(self, kind: str, query: str, max_chars: int) -> str:
+        """The most relevant sections of one kind, in document order, within max_chars.
+
+        Without query terms the sections are taken in document order.
+        """
+        with self._lock:
+            self._refresh()
+            candidates = [s for s in self._sections if s.kind == kind]
+            query_terms = Counter(tokenize(query))
+            if query_terms:
+                scored = [(self._score(s, query_terms, len(candidates)), s) for s in candidates]
+                ranked = [s for score, s in sorted(scored, key=lambda p: (-p[0], p[1].order)) if score > 0]
+            else:
+                ranked = candidates
+
+        chosen, used = [], 0
+        for section in ranked:
+            size = len(section.heading) + len(section.text) + 8
+            if used + size > max_chars:
+                continue
+            chosen.append(section)
+            used += size
+
+        parts, source = [], None
+        for section in sorted(chosen, key=lambda s: s.order):
+            if section.source != source:
+                source = section.source
+                parts.append(f"## {source}")
+            parts.append(f"### {section.heading}\n{section.text}")
+        return "\n\n".join(parts)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "sections": len(self._sections),
+                "file_reads": self.reads,
+            }
+
+
+def _default_root() -> Path:
+    """settings.learning_content_path, or the repository's learning-content directory"""
+    root = Path(settings.learning_content_path)
+    if not root.exists():
+        root = Path(__file__).resolve().parents[3] / "learning-content"
+    return root
+
+
+_corpus: Optional[ContentCorpus] = None
+_corpus_lock = threading.Lock()
+
+
+def get_content_corpus() -> ContentCorpus:
+    """The process-wide corpus, loaded on first use"""
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = ContentCorpus(_default_root())
+        return _corpus
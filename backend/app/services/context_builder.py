@@ -0,0 +1,185 @@
+"""
+RAG Context Builder
+Turns retrieved chunks into the context block of a generation prompt under a
+fixed token budget. Chunks are taken best score first, exact and near
+duplicates are skipped, the overlap the chunker leaves between neighbouring
+chunks is trimmed, and the survivors are packed until the budget is spent.
+The chosen token count is reported so prompt size, latency and cost are
+known before the completion is requested.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..core.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # Falls back to the approximate counter below
+    tiktoken = None
+
+SHINGLE_SIZE = 5
+MAX_OVERLAP_WORDS = 120  # Longest chunk overlap looked for between neighbours
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of text for the configured model.
+
+    Uses tiktoken when installed; otherwise approximates BPE tokenization
+    (roughly one token per four characters of a word, one per punctuation mark).
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.ai_model)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    return sum((len(piece) + 3) // 4 for piece in _PIECE.findall(text))
+
+
+def _shingles(words: List[str]) -> Set[Tuple[str, ...]]:
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _overlap(before: List[str], after: List[str]) -> int:
+    """Number of words at the end of before that start after"""
+    longest = min(len(before), len(after), MAX_OVERLAP_WORDS)
+    for size in range(longest, 0, -1):
+        if before[-size:] == after[:size]:
+            return size
+    return 0
+
+
+@dataclass
+class _Candidate:
+    chunk: Dict[str, Any]
+    words: List[str]
+    shingles: Set[Tuple[str, ...]]
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.chunk["document_id"], self.chunk.get("chunk_index", 0)
+
+
+@dataclass
+class PackedContext:
+    """Context block chosen for a prompt"""
+    text: str = ""
+    tokens: int = 0
+    budget: int = 0
+    chunks_used: int = 0
+    chunks_considered: int = 0
+    duplicates_dropped: int = 0
+    sources: List[str] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "chunks_used": self.chunks_used,
+            "chunks_considered": self.chunks_considered,
+            "duplicates_dropped": self.duplicates_dropped,
+            "sources": self.sources,
+        }
+
+
+def _source_title(chunk: Dict[str, Any]) -> str:
+    return chunk.get("metadata", {}).get("title") or chunk["document_id"]
+
+
+def _render(selected: List[_Candidate]) -> Tuple[str, List[str]]:
+    """Group chunks by document, in document order, joining neighbours without their overlap"""
+    by_document: Dict[str, List[_Candidate]] = {}
+    for candidate in selected:  # Best-scoring document first
+        by_document.setdefault(candidate.chunk["document_id"], []).append(candidate)
+
+    parts, sources = [], []
+    for candidates in by_document.values():
+        candidates.sort(key=lambda c: c.key[1])
+        passages, previous = [], None
+        for candidate in candidates:
+            words = candidate.words
+            if previous is not None and candidate.key[1] == previous.key[1] + 1:
+                passages[-1].extend(words[_overlap(previous.words, words):])
+            else:
+                passages.append(list(words))
+            previous = candidate
+        title = _source_title(candidates[0].chunk)
+        sources.append(title)
+        parts.append(f"Source: {title}\n" + "\n...\n".join(" ".join(p) for p in passages) + "\n")
+    return "\n".join(parts), sources
+
+
+def build_context(chunks: List[Dict[str, Any]], budget: Optional[int] = None,
+                  dedup_threshold: Optional[float] = None) -> PackedContext:
+    """Pack retrieved chunks (search results with a score) into a token budget.
+
+    A chunk whose word shingles are mostly contained in an already chosen
+    chunk is dropped as a duplicate. Chunks that do not fit are skipped so
+    smaller, lower-ranked chunks can still use the remaining budget.
+    """
+    budget = settings.rag_context_tokens if budget is None else budget
+    threshold = settings.rag_context_dedup_threshold if dedup_threshold is None else dedup_threshold
+    result = PackedContext(budget=budget, chunks_considered=len(chunks))
+
+    ranked = sorted(chunks, key=lambda c: c.get("score", 0.0), reverse=True)
+    selected: List[_Candidate] = []
+    seen_shingles: Set[Tuple[str, ...]] = set()
+    used = 0
+
+    for chunk in ranked:
+        words = chunk["content"].split()
+        if not words:
+            continue
+        candidate = _Candidate(chunk, words, _shingles([w.lower() for w in words]))
+        if any(c.key == candidate.key for c in selected):
+            continue
+
+        # Overlap with a neighbouring chunk of the same document is trimmed, not a duplicate
+        neighbour_shingles: Set[Tuple[str, ...]] = set()
+        for c in selected:
+            if c.key[0] == candidate.key[0] and abs(c.key[1] - candidate.key[1]) == 1:
+                neighbour_shingles |= c.shingles
+        duplicate = (candidate.shingles & seen_shingles) - neighbour_shingles
+        if candidate.shingles and len(duplicate) / len(candidate.shingles) >= threshold:
+            result.duplicates_dropped += 1
+            continue
+
+        # Cost of adding the chunk: its text without any overlap already in the context
+        new_words = words
+        for c in selected:
+            if c.key[0] == candidate.key[0]:
+                if c.key[1] == candidate.key[1] - 1:
+                    new_words = new_words[_overlap(c.words, new_words):]
+                elif c.key[1] == candidate.key[1] + 1:
+                    new_words = new_words[:len(new_words) - _overlap(new_words, c.words)]
+        cost = count_tokens(" ".join(new_words))
+        if not any(c.key[0] == candidate.key[0] for c in selected):
+            cost += count_tokens(f"Source: {_source_title(chunk)}\n\n")
+        if used + cost > budget:
+            continue
+
+        selected.append(candidate)
+        seen_shingles |= candidate.shingles
+        used += cost
+
+    # Separators can push the estimate over; drop the lowest-ranked chunks until it fits
+    while selected:
+        result.text, result.sources = _render(selected)
+        result.tokens = count_tokens(result.text)
+        if result.tokens <= budget:
+            break
+        selected.pop()
+    else:
+        result.text, result.sources, result.tokens = "", [], 0
+
+    result.chunks_used = len(selected)
+    return result
@@ -0,0 +1,192 @@
+"""
+Persistent embedding cache
+Stores model embeddings of chunk text so re-ingesting known content skips
+inference. Vectors live in a float16 memmap, one row per entry, and an
+append-only index file maps each (model, normalized text) hash to its row.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+from ..core.config import settings
+
+DIGEST_SIZE = 16
+
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace so re-extracted copies of a chunk hash the same"""
+    return " ".join(text.split())
+
+
+def text_key(model_name: str, text: str) -> bytes:
+    """Cache key for a chunk under a given model"""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(_normalize(text).encode("utf-8"))
+    return digest.digest()
+
+
+class EmbeddingCache:
+    """float16 embedding store for one model, shared by every worker on the host"""
+
+    VECTORS_FILE = "embeddings.f16"
+    INDEX_FILE = "embeddings.idx"
+    LOCK_FILE = ".lock"
+
+    def __init__(self, path: str, model_name: str, dimension: int):
+        self.path = Path(path) / re.sub(r"[^A-Za-z0-9._-]", "_", model_name)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.dimension = dimension
+        self.row_bytes = dimension * 2
+
+        self.rows: Dict[bytes, int] = {}
+        self._index_offset = 0
+        self._vectors = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize appends across worker processes"""
+        with open(self.path / self.LOCK_FILE, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up rows other processes appended since the last read"""
+        index_path = self.path / self.INDEX_FILE
+        if not index_path.exists():
+            return
+        size = index_path.stat().st_size
+        # Ignore a partially written trailing record
+        size -= size % DIGEST_SIZE
+        if size <= self._index_offset:
+            return
+        with open(index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read(size - self._index_offset)
+        row = self._index_offset // DIGEST_SIZE
+        for start in range(0, len(data), DIGEST_SIZE):
+            self.rows.setdefault(data[start:start + DIGEST_SIZE], row)
+            row += 1
+        self._index_offset = size
+        self._vectors = None
+
+    def _matrix(self) -> np.ndarray:
+        """Memory-mapped view of every committed row"""
+        if self._vectors is None:
+            rows = self._index_offset // DIGEST_SIZE
+            if rows == 0:
+                return np.empty((0, self.dimension), dtype="float16")
+            self._vectors = np.memmap(self.path / self.VECTORS_FILE, dtype="float16",
+                                      mode="r", shape=(rows, self.dimension))
+        return self._vectors
+
+    def lookup(self, texts: List[str]):
+        """Return (keys, cached vectors as float32 or None per text)"""
+        keys = [text_key(self.model_name, text) for text in texts]
+        with self._lock:
+            self._refresh()
+            matrix = self._matrix()
+            found = [self.rows.get(key) for key in keys]
+            vectors = [None if row is None else np.asarray(matrix[row], dtype="float32") for row in found]
+        return keys, vectors
+
+    def store(self, keys: List[bytes], embeddings: np.ndarray):
+        """Append new embeddings; vectors are written before their index records"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            new = {}
+            for key, embedding in zip(keys, embeddings):
+                if key not in self.rows and key not in new:
+                    new[key] = embedding
+            if not new:
+                return
+
+            rows = self._index_offset // DIGEST_SIZE
+            vectors_path = self.path / self.VECTORS_FILE
+            with open(vectors_path, "ab") as f:
+                # Drop any rows a crashed writer left without index records
+                f.truncate(rows * self.row_bytes)
+                f.write(np.asarray(list(new.values()), dtype="float16").tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.path / self.INDEX_FILE, "ab") as f:
+                f.truncate(self._index_offset)
+                f.write(b"".join(new.keys()))
+                f.flush()
+                os.fsync(f.fileno())
+            self._refresh()
+
+    def encode(self, texts: List[str], encoder: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embed texts, running the encoder only on chunks not seen before"""
+        keys, vectors = self.lookup(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            # Encode each distinct missing text once
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            encoded = encoder(list(unique.values()))
+            self.store(list(unique.keys()), encoded)
+            by_key = dict(zip(unique.keys(), encoded))
+            for i in missing:
+                vectors[i] = np.asarray(by_key[keys[i]], dtype="float32")
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        embeddings = np.vstack(vectors).astype("float32") if vectors else \
+            np.empty((0, self.dimension), dtype="float32")
+        # float16 rounding leaves vectors slightly off unit length
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        np.divide(embeddings, norms, out=embeddings, where=norms > 0)
+        return embeddings
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process plus the on-disk size"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.rows),
+                # Hits avoid recomputing float32 vectors
+                "bytes_saved": self.hits * self.dimension * 4,
+                "disk_bytes": (self._index_offset // DIGEST_SIZE) * (self.row_bytes + DIGEST_SIZE),
+            }
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, dimension: int) -> EmbeddingCache:
+    """One cache per model per process"""
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = _caches[model_name] = EmbeddingCache(settings.embedding_cache_path, model_name, dimension)
+        return cache
@@ -0,0 +1,57 @@
+"""
+Streaming Generation Responses
+Server-sent events for AI generation endpoints. Text is forwarded to the
+client as the model produces it and the result is stored once the stream
+completes. If the client disconnects, the server cancels the response
+task, which closes the upstream model stream and skips saving.
+"""
+
+import json
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict
+
+from fastapi.responses import StreamingResponse
+
+from .llm_client import LLMError
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_generation(chunks: AsyncIterator[str], start: Dict[str, Any],
+                            on_complete: Callable[[str], Dict[str, Any]]) -> AsyncIterator[str]:
+    """Relay generated text as SSE events, then persist it.
+
+    Events: "start" (start), "token" ({"text"}) per chunk, then "done" with
+    the dict returned by on_complete(full_text), or "error". on_complete is
+    blocking (database work) and runs in a worker thread.
+    """
+    yield sse_event("start", start)
+    parts = []
+    try:
+        async for text in chunks:
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+        result = await asyncio.to_thread(on_complete, "".join(parts))
+    except LLMError as e:
+        yield sse_event("error", {"detail": str(e)})
+        return
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Error generating content: {e}"})
+        return
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    yield sse_event("done", result)
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+    """StreamingResponse for SSE, with proxy buffering disabled"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,81 @@
+"""
+Background Job Handlers
+The slow parts of document upload, content generation and test creation,
+and the periodic analytics rollup and notification email digests, run by
+job workers. Each handler receives its own database session.
+"""
+
+from typing import Any, Dict
+
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from .job_queue import JobContext, JobError, job_handler
+from .analytics_rollup import run_rollup
+from .notification_emails import send_pending_notification_emails
+from .simple_rag_service import SimpleRAGService
+from .knowledge_test_generator import KnowledgeTestGenerator
+
+
+@job_handler("process_document")
+def process_document(db: Session, payload: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Extract, chunk and embed an uploaded document.
+
+    The lease is renewed after every embedded batch and once more before
+    the vector store commit, which is skipped if another worker has taken
+    the job over in the meantime.
+    """
+    context.progress(0.1, "Extracting and embedding document")
+    result = SimpleRAGService(db).process_uploaded_document(
+        payload["content_id"], payload["instructor_id"], heartbeat=context.renew
+    )
+    if "error" in result:
+        raise JobError(result["error"])
+    return result
+
+
+@job_handler("generate_content")
+def generate_content(db: Session, payload: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Generate course content with RAG and save it as a ContentGeneration"""
+    context.progress(0.1, "Generating content")
+    result = SimpleRAGService(db).generate_course_content(
+        course_id=payload["course_id"],
+        instructor_id=payload["instructor_id"],
+        content_type=payload["content_type"],
+        title=payload["title"],
+        description=payload["description"],
+        additional_instructions=payload.get("additional_instructions", ""),
+        use_rag=payload.get("use_rag", True)
+    )
+    if "error" in result:
+        raise JobError(result["error"])
+    return result
+
+
+@job_handler("create_test")
+async def create_test(db: Session, payload: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Generate a knowledge test from uploaded content"""
+    context.progress(0.1, "Generating knowledge test")
+    result = await KnowledgeTestGenerator().generate_knowledge_test(
+        course_id=payload["course_id"],
+        content_id=payload["content_id"],
+        question_count=payload.get("question_count", 10),
+        passing_score=payload.get("passing_score", 70),
+        time_limit=payload.get("time_limit", 30),
+        db=db
+    )
+    if result.get("status") == "error":
+        raise JobError(result["message"])
+    return result
+
+
+@job_handler("rollup_analytics", every=settings.analytics_rollup_interval)
+def rollup_analytics(db: Session, payload: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Roll up the complete days since the last run into the analytics tables"""
+    return run_rollup(db, context.progress)
+
+
+@job_handler("send_notification_digests", every=settings.email_digest_window)
+def send_notification_digests(db: Session, payload: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Email each user the notifications that arrived since the last run, as one digest"""
+    return send_pending_notification_emails(db, heartbeat=context.renew)
@@ -0,0 +1,386 @@
+"""
+Background Job Queue
+Runs document processing and content generation outside the HTTP request.
+Jobs are rows in the ``jobs`` table, which holds their status, progress
+and result. Workers claim queued jobs with a guarded UPDATE and hold a
+lease while running; jobs whose worker died are requeued when the lease
+expires. The Redis backend keeps the same table but dispatches job ids
+over a Redis list, so idle workers wake immediately instead of polling.
+Handlers registered with an interval are also enqueued by the workers
+whenever no job of that type has run within the interval; a partial unique
+index keeps racing workers from enqueuing the same one twice.
+"""
+
+import os
+import time
+import uuid
+import socket
+import asyncio
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..models.jobs import Job
+from .llm_client import close_llm_client
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+REDIS_QUEUE_KEY = "jobs:queue"
+
+_handlers: Dict[str, Callable] = {}
+_periodic: Dict[str, float] = {}  # job type -> seconds between runs
+
+
+class JobError(Exception):
+    """Raised by handlers for failures that retrying will not fix"""
+
+
+def job_handler(job_type: str, every: Optional[float] = None):
+    """Register a function as the handler for a job type.
+
+    Handlers are called as handler(db, payload, context) in a worker and
+    return a JSON-serializable result. Coroutine functions are supported.
+    With every (seconds), workers also enqueue the job with an empty
+    payload on that schedule.
+    """
+    def register(func: Callable) -> Callable:
+        _handlers[job_type] = func
+        if every:
+            _periodic[job_type] = every
+        return func
+    return register
+
+
+class LeaseLost(JobError):
+    """Raised when the job's lease expired and another worker may have taken it over"""
+
+
+class JobContext:
+    """Handed to handlers for progress reporting; also renews the job's lease"""
+
+    def __init__(self, job_id: str, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._next_renewal = 0.0
+
+    def _update(self, values: Dict[Any, Any]) -> bool:
+        """Apply values and extend the lease, if this worker still holds it"""
+        values[Job.locked_until] = datetime.utcnow() + timedelta(seconds=settings.job_lease_seconds)
+        db = SessionLocal()
+        try:
+            held = db.query(Job).filter(
+                Job.id == self.job_id, Job.locked_by == self.worker_id, Job.status == JOB_RUNNING
+            ).update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        self._next_renewal = time.monotonic() + settings.job_lease_seconds / 10
+        return bool(held)
+
+    def progress(self, fraction: float, message: str = None):
+        self._update({
+            Job.progress: max(0.0, min(1.0, fraction)),
+            Job.progress_message: message[:255] if message else None
+        })
+
+    def renew(self, force: bool = False):
+        """Extend the lease during a long step; call it once per batch of work.
+
+        Renewals are throttled to a tenth of the lease unless forced; force
+        before committing results so the lease cannot lapse mid-commit.
+        Raises LeaseLost if another worker has taken the job over.
+        """
+        if not force and time.monotonic() < self._next_renewal:
+            return
+        if not self._update({}):
+            raise LeaseLost(f"Lost the lease on job {self.job_id}")
+
+
+class DatabaseJobQueue:
+    """Queue backed only by the jobs table; idle workers poll it"""
+
+    def notify(self, job_id: str):
+        pass
+
+    def wait(self, timeout: float) -> Optional[str]:
+        """Block until a job may be available; returns its id when known"""
+        time.sleep(timeout)
+        return None
+
+    def done(self, job_id: str):
+        pass
+
+
+class RedisJobQueue(DatabaseJobQueue):
+    """Dispatches job ids over a Redis list; the jobs table stays the source of truth"""
+
+    def __init__(self, url: str):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+
+    def notify(self, job_id: str):
+        try:
+            self.redis.lpush(REDIS_QUEUE_KEY, job_id)
+        except Exception as e:
+            # Workers also poll the table, so a missed notification only adds latency
+            print(f"Warning: could not publish job {job_id} to Redis: {e}")
+
+    def wait(self, timeout: float) -> Optional[str]:
+        try:
+            item = self.redis.brpop(REDIS_QUEUE_KEY, timeout=max(1, int(timeout)))
+        except Exception as e:
+            print(f"Warning: Redis unavailable, polling the jobs table: {e}")
+            time.sleep(timeout)
+            return None
+        return item[1].decode() if item else None
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> DatabaseJobQueue:
+    """The configured queue backend (settings.job_queue_backend: "database" or "redis")"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if settings.job_queue_backend == "redis":
+                _queue = RedisJobQueue(settings.redis_url)
+            else:
+                _queue = DatabaseJobQueue()
+        return _queue
+
+
+def enqueue_job(db: Session, job_type: str, payload: Dict[str, Any],
+                user_id: Optional[int] = None, periodic: bool = False) -> Job:
+    """Create a queued job and wake a worker.
+
+    A periodic job raises IntegrityError if one of its type is already
+    queued or running.
+    """
+    if job_type not in _handlers:
+        # Handlers register on import; make sure they are loaded in this process
+        from . import job_handlers  # noqa: F401
+    if job_type not in _handlers:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    job = Job(
+        id=str(uuid.uuid4()),
+        job_type=job_type,
+        status=JOB_QUEUED,
+        payload=payload,
+        progress=0.0,
+        attempts=0,
+        max_attempts=settings.job_max_attempts,
+        user_id=user_id,
+        periodic=periodic
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    get_job_queue().notify(job.id)
+    return job
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    """Status representation returned by the job endpoints"""
+    return {
+        "job_id": job.id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "progress": job.progress or 0.0,
+        "progress_message": job.progress_message,
+        "attempts": job.attempts,
+        "result": job.result if job.status == JOB_SUCCEEDED else None,
+        "error": job.error if job.status == JOB_FAILED else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "status_url": f"/api/jobs/{job.id}"
+    }
+
+
+async def _run_coroutine_handler(result):
+    """Await a coroutine handler on its own event loop, then close the loop's LLM client"""
+    try:
+        return await result
+    finally:
+        await close_llm_client()
+
+
+class JobWorker:
+    """Claims and runs jobs until stopped"""
+
+    def __init__(self, queue: DatabaseJobQueue = None, worker_id: str = None):
+        self.queue = queue or get_job_queue()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._next_schedule_check = 0.0
+        from . import job_handlers  # noqa: F401
+
+    def stop(self):
+        self._stop.set()
+
+    def _claim(self, db: Session, job_id: Optional[str] = None) -> Optional[Job]:
+        """Atomically move a queued job to running under this worker's lease.
+
+        Candidates are claimed with an UPDATE guarded on status, so two
+        workers racing for the same row cannot both win.
+        """
+        query = db.query(Job.id).filter(Job.status == JOB_QUEUED)
+        if job_id is not None:
+            query = query.filter(Job.id == job_id)
+        candidates = [row.id for row in query.order_by(Job.created_at).limit(5)]
+
+        now = datetime.utcnow()
+        for candidate in candidates:
+            claimed = db.query(Job).filter(Job.id == candidate, Job.status == JOB_QUEUED).update({
+                Job.status: JOB_RUNNING,
+                Job.locked_by: self.worker_id,
+                Job.locked_until: now + timedelta(seconds=settings.job_lease_seconds),
+                Job.started_at: now,
+                Job.attempts: Job.attempts + 1
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                return db.query(Job).filter(Job.id == candidate).first()
+        return None
+
+    def _recover_expired(self, db: Session):
+        """Requeue jobs whose worker stopped renewing its lease, or fail them when out of attempts"""
+        now = datetime.utcnow()
+        expired = db.query(Job).filter(Job.status == JOB_RUNNING, Job.locked_until < now).all()
+        for job in expired:
+            if job.attempts >= job.max_attempts:
+                job.status = JOB_FAILED
+                job.error = "Worker stopped responding"
+                job.finished_at = now
+            else:
+                job.status = JOB_QUEUED
+            job.locked_by = None
+            job.locked_until = None
+        db.commit()
+        for job in expired:
+            if job.status == JOB_QUEUED:
+                self.queue.notify(job.id)
+
+    def _schedule_periodic(self, db: Session):
+        """Enqueue periodic jobs that are due.
+
+        A job is due when none of its type is queued or running and none
+        was created within its interval, so any number of workers share
+        one schedule. The check is only a shortcut: two workers that both
+        find a job due conflict on uq_jobs_periodic_pending, and only one
+        enqueues it.
+        """
+        if not _periodic or time.monotonic() < self._next_schedule_check:
+            return
+        self._next_schedule_check = time.monotonic() + min(min(_periodic.values()), 60.0)
+
+        now = datetime.now(timezone.utc)
+        for job_type, every in _periodic.items():
+            pending = db.query(Job.id).filter(
+                Job.job_type == job_type,
+                or_(Job.status.in_([JOB_QUEUED, JOB_RUNNING]), Job.created_at >= now - timedelta(seconds=every))
+            ).first()
+            if pending is None:
+                try:
+                    enqueue_job(db, job_type, {}, periodic=True)
+                except IntegrityError:
+                    db.rollback()  # Another worker enqueued it first
+
+    def _execute(self, job: Job):
+        handler = _handlers[job.job_type]
+        context = JobContext(job.id, self.worker_id)
+        db = SessionLocal()
+        try:
+            result = handler(db, job.payload, context)
+            if asyncio.iscoroutine(result):
+                result = asyncio.run(_run_coroutine_handler(result))
+        except JobError as e:
+            db.rollback()
+            self._finish(job.id, JOB_FAILED, error=str(e), retry=False)
+            return
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            self._finish(job.id, JOB_FAILED, error=str(e))
+            return
+        finally:
+            db.close()
+        self._finish(job.id, JOB_SUCCEEDED, result=result)
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: str = None,
+                retry: bool = True):
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id, Job.locked_by == self.worker_id).first()
+            if job is None:
+                return  # Lease expired and another worker took over
+            if status == JOB_FAILED and retry and job.attempts < job.max_attempts:
+                # Retry later; the error is kept for visibility until it succeeds
+                job.status = JOB_QUEUED
+                job.error = error
+            else:
+                job.status = status
+                job.result = result
+                job.error = error
+                job.progress = 1.0 if status == JOB_SUCCEEDED else job.progress
+                job.finished_at = datetime.utcnow()
+            job.locked_by = None
+            job.locked_until = None
+            db.commit()
+            if job.status == JOB_QUEUED:
+                self.queue.notify(job.id)
+        finally:
+            db.close()
+            self.queue.done(job_id)
+
+    def run_once(self, job_id: Optional[str] = None) -> bool:
+        """Claim and run at most one job; returns whether one ran"""
+        db = SessionLocal()
+        try:
+            self._recover_expired(db)
+            self._schedule_periodic(db)
+            job = self._claim(db, job_id)
+            if job is None and job_id is not None:
+                # The notified job was taken already; fall back to the oldest queued job
+                job = self._claim(db)
+            if job is None:
+                return False
+            db.expunge(job)
+        finally:
+            db.close()
+        self._execute(job)
+        return True
+
+    def run(self):
+        """Process jobs until stop() is called"""
+        print(f"Job worker {self.worker_id} started ({type(self.queue).__name__})")
+        job_id = None
+        while not self._stop.is_set():
+            try:
+                ran = self.run_once(job_id)
+            except Exception as e:
+                print(f"Job worker error: {e}")
+                ran = False
+            job_id = None if ran else self.queue.wait(settings.job_poll_interval)
+
+
+def start_embedded_worker() -> Optional[JobWorker]:
+    """Run a worker thread inside the API process (single-process deployments)"""
+    if not settings.job_embedded_worker:
+        return None
+    worker = JobWorker()
+    threading.Thread(target=worker.run, daemon=True, name="job-worker").start()
+    return worker
@@ -5,8 +5,8 @@ Creates knowledge tests using uploaded materials and NOCN guidance framework
 
 import json
 import os
+import asyncio
 from typing import List, Dict, Any, Optional
-from pathlib import Path
 from datetime import datetime
 import openai
 from sqlalchemy.orm import Session
@@ -15,6 +15,12 @@ from ..core.config import settings
 from ..models.course import CourseFileContent, Course
 from ..models.learning import Assessment, AssessmentQuestion, AssessmentAttempt
 from ..models.user import User
+from .llm_cache import acached_completion
+from .text_cache import cached_pdf_text
+from .content_corpus import LEARNING, TEMPLATES, get_content_corpus
+
+# Upper bound on uploaded-document text included in the prompt
+CONTENT_EXCERPT_CHARS = 8000
 
 
 class KnowledgeTestGenerator:
@@ -22,8 +28,7 @@ class KnowledgeTestGenerator:
     
     def __init__(self):
         self.openai_client = openai.OpenAI(api_key=settings.openai_api_key)
-        self.nocn_templates_path = Path("learning-content/assessment-templates")
-        self.learning_content_path = Path("learning-content")
+        self.corpus = get_content_corpus()
     
     async def generate_knowledge_test(
         self,
@@ -51,11 +56,17 @@ class KnowledgeTestGenerator:
             if not course:
                 raise ValueError("Course not found")
             
+            # Uploaded document text, parsed once per file and cached next to the upload
+            content_text = await asyncio.to_thread(self._load_content_text, content)
+            
+            # Only the template and learning-content sections relevant to this course go in the prompt
+            query = self._context_query(course, content, content_text)
+            
             # Load NOCN assessment templates
-            nocn_context = self._load_nocn_templates()
+            nocn_context = self._load_nocn_templates(query)
             
             # Load learning content context
-            learning_context = self._load_learning_content()
+            learning_context = self._load_learning_content(query)
             
             # Generate test using AI
             test_data = await self._generate_test_with_ai(
@@ -65,7 +76,8 @@ class KnowledgeTestGenerator:
                 passing_score=passing_score,
                 time_limit=time_limit,
                 nocn_context=nocn_context,
-                learning_context=learning_context
+                learning_context=learning_context,
+                content_text=content_text
             )
             
             # For now, return the test data without saving to database
@@ -89,42 +101,36 @@ class KnowledgeTestGenerator:
                 "message": f"Failed to generate knowledge test: {str(e)}"
             }
     
-    def _load_nocn_templates(self) -> str:
-        """Load NOCN assessment templates for context"""
+    @staticmethod
+    def _context_query(course: Course, content: CourseFileContent, content_text: str) -> str:
+        """Retrieval query for the corpus: course and upload details plus the start of the upload"""
+        return " ".join([
+            course.title or "", course.description or "", course.category or "",
+            content.title or "", content.description or "", content_text[:1000]
+        ])
+    
+    def _load_nocn_templates(self, query: str = "") -> str:
+        """Load the NOCN assessment template sections most relevant to the query"""
         try:
-            templates = []
-            if self.nocn_templates_path.exists():
-                for template_file in self.nocn_templates_path.glob("*.md"):
-                    with open(template_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        templates.append(f"## {template_file.stem}\n{content}")
-            
-            return "\n\n".join(templates)
+            return self.corpus.select(TEMPLATES, query, settings.corpus_template_chars)
         except Exception as e:
             print(f"Warning: Could not load NOCN templates: {e}")
             return ""
     
-    def _load_learning_content(self) -> str:
-        """Load learning content for context"""
+    def _load_content_text(self, content: CourseFileContent) -> str:
+        """Load an excerpt of the uploaded PDF's text from the text cache"""
+        if not content.file_path or content.content_type != "pdf" or not os.path.exists(content.file_path):
+            return ""
         try:
-            content = []
-            if self.learning_content_path.exists():
-                # Load content index
-                index_file = self.learning_content_path / "content-index.json"
-                if index_file.exists():
-                    with open(index_file, 'r', encoding='utf-8') as f:
-                        index_data = json.load(f)
-                    
-                    # Load main content files
-                    for item in index_data.get("content", []):
-                        if item.get("type") == "course_content":
-                            file_path = self.learning_content_path / item["file"]
-                            if file_path.exists():
-                                with open(file_path, 'r', encoding='utf-8') as f:
-                                    file_content = f.read()
-                                    content.append(f"## {item['title']}\n{file_content}")
-            
-            return "\n\n".join(content)
+            return cached_pdf_text(content.file_path)[:CONTENT_EXCERPT_CHARS]
+        except Exception as e:
+            print(f"Warning: Could not load uploaded content text: {e}")
+            return ""
+    
+    def _load_learning_content(self, query: str = "") -> str:
+        """Load the learning content sections most relevant to the query"""
+        try:
+            return self.corpus.select(LEARNING, query, settings.corpus_learning_chars)
         except Exception as e:
             print(f"Warning: Could not load learning content: {e}")
             return ""
@@ -137,7 +143,8 @@ class KnowledgeTestGenerator:
         passing_score: int,
         time_limit: int,
         nocn_context: str,
-        learning_context: str
+        learning_context: str,
+        content_text: str = ""
     ) -> Dict[str, Any]:
         """Generate test using OpenAI with context from uploaded materials and NOCN framework"""
         
@@ -155,6 +162,9 @@ UPLOADED CONTENT:
 - Description: {content.description}
 - Content Type: {content.content_type}
 
+UPLOADED CONTENT TEXT:
+{content_text}
+
 NOCN ASSESSMENT FRAMEWORK:
 {nocn_context}
 
@@ -205,28 +215,21 @@ Return the response as JSON with this structure:
 """
 
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an expert construction training assessment creator. Create comprehensive, fair, and educational knowledge tests."},
-                    {"role": "user", "content": context_prompt}
-                ],
-                max_tokens=3000,
-                temperature=0.7
+            messages = [
+                {"role": "system", "content": "You are an expert construction training assessment creator. Create comprehensive, fair, and educational knowledge tests."},
+                {"role": "user", "content": context_prompt}
+            ]
+            
+            # Repeat requests are answered from the response cache; only parseable tests are cached
+            ai_response = await acached_completion(
+                messages, "gpt-3.5-turbo", 0.7, "knowledge_test",
+                lambda: asyncio.to_thread(self._complete, messages),
+                accept=self._is_valid_test,
+                params={"max_tokens": 3000}, namespace=f"course:{course.id}"
             )
             
             # Parse AI response
-            ai_response = response.choices[0].message.content.strip()
-            
-            # Try to extract JSON from response
-            if "```json" in ai_response:
-                json_start = ai_response.find("```json") + 7
-                json_end = ai_response.find("```", json_start)
-                json_str = ai_response[json_start:json_end].strip()
-            else:
-                json_str = ai_response
-            
-            test_data = json.loads(json_str)
+            test_data = self._parse_test_json(ai_response)
             
             # Validate and clean the data
             if "questions" not in test_data:
@@ -248,6 +251,35 @@ Return the response as JSON with this structure:
             print(f"AI generation failed: {e}")
             return self._create_fallback_test(course, content, question_count)
     
+    def _complete(self, messages: List[Dict[str, str]]) -> str:
+        """Blocking OpenAI call; run in a worker thread"""
+        response = self.openai_client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=messages,
+            max_tokens=3000,
+            temperature=0.7
+        )
+        return response.choices[0].message.content
+    
+    @staticmethod
+    def _parse_test_json(ai_response: str) -> Dict[str, Any]:
+        """Extract the test JSON from a completion, which may wrap it in a code fence"""
+        ai_response = ai_response.strip()
+        if "```json" in ai_response:
+            json_start = ai_response.find("```json") + 7
+            json_end = ai_response.find("```", json_start)
+            json_str = ai_response[json_start:json_end].strip()
+        else:
+            json_str = ai_response
+        
+        return json.loads(json_str)
+    
+    def _is_valid_test(self, ai_response: str) -> bool:
+        try:
+            return "questions" in self._parse_test_json(ai_response)
+        except ValueError:
+            return False
+    
     def _create_fallback_test(self, course: Course, content: CourseFileContent, question_count: int) -> Dict[str, Any]:
         """Create a fallback test if AI generation fails"""
         
@@ -0,0 +1,259 @@
+"""
+LLM Response Cache
+Persists chat-completion results in a local SQLite file so regenerating the
+same lesson plan or knowledge test does not pay for another completion.
+Entries are keyed by (model, temperature, generation params, normalized
+prompt hash), expire after a TTL and are evicted least-recently-used beyond
+a size cap. An optional semantic tier returns the cached result of a
+near-identical user prompt when the prompt embeddings are similar enough,
+but only among entries of the same scope: model, temperature, content type,
+system prompt, generation params and the caller's namespace (prompt
+template or course) must all match exactly.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Callable, Awaitable, Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import settings
+
+# Bump when keys or the responses table change; older entries are dropped
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    model TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    content_type TEXT NOT NULL,
+    response TEXT NOT NULL,
+    embedding BLOB,
+    latency_ms REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used_at);
+CREATE INDEX IF NOT EXISTS ix_responses_scope ON responses (scope, last_used_at);
+CREATE TABLE IF NOT EXISTS stats (
+    content_type TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    semantic_hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    latency_saved_ms REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace; prompts are built from indented f-strings"""
+    return " ".join(text.split())
+
+
+def _normalized_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [{"role": m["role"], "content": _normalize(m["content"])} for m in messages]
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_key(model: str, temperature: float, messages: List[Dict[str, str]],
+              params: Optional[Dict[str, Any]] = None) -> str:
+    """Exact-match key for a completion request"""
+    return f"{model}:{round(temperature, 3)}:{_hash([params or {}, _normalized_messages(messages)])}"
+
+
+def scope_key(model: str, temperature: float, content_type: str, messages: List[Dict[str, str]],
+              params: Optional[Dict[str, Any]] = None, namespace: str = "") -> str:
+    """Everything but the user prompt that must match for a semantic hit"""
+    system = [m["content"] for m in _normalized_messages(messages) if m["role"] != "user"]
+    return _hash([model, round(temperature, 3), content_type, params or {}, namespace, system])
+
+
+class ResponseCache:
+    """SQLite-backed completion cache shared by every worker on the host"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._embedder = None
+        conn = self._connection()
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.executescript(f"DROP TABLE IF EXISTS responses; PRAGMA user_version = {SCHEMA_VERSION};")
+        conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets workers read while another writes"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _embed(self, messages: List[Dict[str, str]]) -> np.ndarray:
+        """Embed the user prompt with the lightweight document embedder"""
+        if self._embedder is None:
+            from .simple_rag_service import SimpleDocumentEmbedder
+            self._embedder = SimpleDocumentEmbedder()
+        prompt = " ".join(m["content"] for m in messages if m["role"] == "user")
+        return self._embedder._simple_embeddings([_normalize(prompt)])[0].astype("float32")
+
+    def _record(self, conn: sqlite3.Connection, content_type: str, column: str, latency_ms: float = 0.0):
+        conn.execute("INSERT OR IGNORE INTO stats (content_type) VALUES (?)", (content_type,))
+        conn.execute(
+            f"UPDATE stats SET {column} = {column} + 1, latency_saved_ms = latency_saved_ms + ? "
+            "WHERE content_type = ?",
+            (latency_ms, content_type)
+        )
+
+    def lookup(self, model: str, temperature: float, messages: List[Dict[str, str]],
+               content_type: str, params: Optional[Dict[str, Any]] = None,
+               namespace: str = "") -> Optional[str]:
+        """Cached response for the request, or None"""
+        now = time.time()
+        expires_before = now - settings.llm_cache_ttl_hours * 3600
+        key = cache_key(model, temperature, messages, params)
+        conn = self._connection()
+
+        row = conn.execute(
+            "SELECT response, latency_ms, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and row[2] >= expires_before:
+            conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self._record(conn, content_type, "hits", row[1])
+            return row[0]
+
+        if settings.llm_cache_semantic:
+            # Near-duplicates of the user prompt within the same scope, recently used first
+            rows = conn.execute(
+                "SELECT key, response, latency_ms, embedding FROM responses "
+                "WHERE scope = ? AND created_at >= ? "
+                "AND embedding IS NOT NULL ORDER BY last_used_at DESC LIMIT ?",
+                (scope_key(model, temperature, content_type, messages, params, namespace), expires_before,
+                 settings.llm_cache_semantic_candidates)
+            ).fetchall()
+            if rows:
+                query = self._embed(messages)
+                matrix = np.vstack([np.frombuffer(r[3], dtype="float32") for r in rows])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= settings.llm_cache_semantic_threshold:
+                    conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, rows[best][0]))
+                    self._record(conn, content_type, "semantic_hits", rows[best][2])
+                    return rows[best][1]
+
+        self._record(conn, content_type, "misses")
+        return None
+
+    def store(self, model: str, temperature: float, messages: List[Dict[str, str]],
+              content_type: str, response: str, latency_ms: float,
+              params: Optional[Dict[str, Any]] = None, namespace: str = ""):
+        """Save a response, then drop expired and least-recently-used entries"""
+        now = time.time()
+        embedding = self._embed(messages).tobytes() if settings.llm_cache_semantic else None
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses "
+            "(key, scope, model, temperature, content_type, response, embedding, latency_ms, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (cache_key(model, temperature, messages, params),
+             scope_key(model, temperature, content_type, messages, params, namespace),
+             model, round(temperature, 3), content_type, response, embedding, latency_ms, now, now)
+        )
+        conn.execute("DELETE FROM responses WHERE created_at < ?",
+                     (now - settings.llm_cache_ttl_hours * 3600,))
+        conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+            "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (settings.llm_cache_max_entries,)
+        )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hit rate and completion time saved per content type, across all workers"""
+        rows = self._connection().execute(
+            "SELECT content_type, hits, semantic_hits, misses, latency_saved_ms FROM stats"
+        ).fetchall()
+        result = {}
+        for content_type, hits, semantic_hits, misses, latency_saved_ms in rows:
+            total = hits + semantic_hits + misses
+            result[content_type] = {
+                "hits": hits,
+                "semantic_hits": semantic_hits,
+                "misses": misses,
+                "hit_rate": round((hits + semantic_hits) / total, 3) if total else 0.0,
+                "latency_saved_seconds": round(latency_saved_ms / 1000, 1),
+            }
+        return result
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The process-wide cache, or None when caching is disabled"""
+    global _cache
+    if not settings.llm_cache_enabled:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(settings.llm_cache_path)
+        return _cache
+
+
+def cached_completion(messages: List[Dict[str, str]], model: str, temperature: float,
+                      content_type: str, complete: Callable[[], str],
+                      accept: Callable[[str], bool] = None,
+                      params: Optional[Dict[str, Any]] = None, namespace: str = "") -> str:
+    """Return a cached completion, or run complete() and cache its result.
+
+    accept can reject responses that should not be served again, such as
+    output that failed to parse. params holds any other generation
+    settings complete() uses (max_tokens, ...); namespace names the prompt
+    template or course, so near-identical prompts from different callers
+    are never served each other's responses.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return complete()
+    cached = cache.lookup(model, temperature, messages, content_type, params, namespace)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    response = complete()
+    if accept is not None and not accept(response):
+        return response
+    cache.store(model, temperature, messages, content_type, response,
+                (time.perf_counter() - started) * 1000, params, namespace)
+    return response
+
+
+async def acached_completion(messages: List[Dict[str, str]], model: str, temperature: float,
+                             content_type: str, complete: Callable[[], Awaitable[str]],
+                             accept: Callable[[str], bool] = None,
+                             params: Optional[Dict[str, Any]] = None, namespace: str = "") -> str:
+    """Async cached_completion; cache I/O runs off the event loop"""
+    cache = get_response_cache()
+    if cache is None:
+        return await complete()
+    cached = await asyncio.to_thread(cache.lookup, model, temperature, messages, content_type, params, namespace)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    response = await complete()
+    if accept is not None and not accept(response):
+        return response
+    await asyncio.to_thread(cache.store, model, temperature, messages, content_type, response,
+                            (time.perf_counter() - started) * 1000, params, namespace)
+    return response
@@ -0,0 +1,273 @@
+"""
+Async LLM Client
+Shared, pooled HTTP client for chat-completion calls. Requests go through
+one connection pool per event loop, are capped by a concurrency limit,
+retried with jittered exponential backoff, and identical prompts that are
+already in flight share a single upstream call.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from ..core.config import settings
+from .llm_cache import acached_completion, get_response_cache
+
+# Upstream responses worth retrying; other HTTP errors fail immediately
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """A chat completion failed after all retries"""
+
+
+class LLMClient:
+    """Chat-completion client bound to the event loop it was created on"""
+
+    def __init__(self, base_url: str = None, api_key: str = None,
+                 max_concurrency: int = None, max_retries: int = None,
+                 timeout: float = None, backoff: float = None):
+        self.base_url = (base_url or settings.ai_api_base_url).rstrip("/")
+        self.api_key = api_key if api_key is not None else \
+            (settings.openai_api_key or os.getenv("OPENAI_API_KEY", ""))
+        self.max_retries = settings.ai_max_retries if max_retries is None else max_retries
+        self.backoff = settings.ai_retry_backoff if backoff is None else backoff
+        concurrency = max_concurrency or settings.ai_max_concurrency
+
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout or settings.ai_request_timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+        self.stats = {"requests": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+    @staticmethod
+    def _request_key(payload: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def chat(self, messages: List[Dict[str, str]], model: str = None,
+                   max_tokens: int = None, temperature: float = None) -> Dict[str, Any]:
+        """Run a chat completion and return the decoded response body.
+
+        Concurrent calls with an identical payload wait on the same request.
+        """
+        payload = {
+            "model": model or settings.ai_model,
+            "messages": messages,
+            "max_tokens": max_tokens or settings.ai_max_tokens,
+            "temperature": settings.ai_temperature if temperature is None else temperature,
+        }
+        key = self._request_key(payload)
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._post_with_retries(payload))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+
+        # A cancelled caller must not cancel the request other callers share
+        return await asyncio.shield(task)
+
+    async def complete(self, prompt: str, system_prompt: str, content_type: str = None,
+                       model: str = None, max_tokens: int = None, temperature: float = None,
+                       namespace: str = "") -> str:
+        """Return only the assistant message text.
+
+        With a content_type the response cache is consulted first and the
+        result is cached under that content type and namespace (the caller's
+        prompt template).
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+
+        async def request() -> str:
+            result = await self.chat(messages, model=model, max_tokens=max_tokens, temperature=temperature)
+            return result["choices"][0]["message"]["content"]
+
+        if content_type is None:
+            return await request()
+        return await acached_completion(
+            messages, model or settings.ai_model,
+            settings.ai_temperature if temperature is None else temperature,
+            content_type, request,
+            params={"max_tokens": max_tokens or settings.ai_max_tokens}, namespace=namespace
+        )
+
+    async def stream_chat(self, messages: List[Dict[str, str]], model: str = None,
+                          max_tokens: int = None, temperature: float = None) -> AsyncIterator[str]:
+        """Yield the assistant message text as it is generated.
+
+        Failures before the first token are retried like chat(); once text
+        has been yielded an error ends the stream with LLMError. Closing the
+        iterator early closes the upstream connection.
+        """
+        payload = {
+            "model": model or settings.ai_model,
+            "messages": messages,
+            "max_tokens": max_tokens or settings.ai_max_tokens,
+            "temperature": settings.ai_temperature if temperature is None else temperature,
+            "stream": True,
+        }
+        url = f"{self.base_url}/chat/completions"
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            started = False
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    async with self._client.stream("POST", url, headers=self._headers(), json=payload) as response:
+                        if response.status_code not in RETRY_STATUS_CODES:
+                            if response.is_error:
+                                await response.aread()
+                                self.stats["failures"] += 1
+                                raise LLMError(f"HTTP {response.status_code}: {response.text[:200]}")
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    break
+                                choices = json.loads(data).get("choices") or [{}]
+                                delta = choices[0].get("delta", {}).get("content")
+                                if delta:
+                                    started = True
+                                    yield delta
+                            return
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                if started:
+                    self.stats["failures"] += 1
+                    raise LLMError(f"Stream interrupted: {type(e).__name__}: {e}") from e
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt == self.max_retries:
+                break
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+        self.stats["failures"] += 1
+        raise LLMError(f"Chat completion stream failed after {self.max_retries + 1} attempts: {error}")
+
+    async def stream_messages(self, messages: List[Dict[str, str]], content_type: str = None,
+                              model: str = None, max_tokens: int = None,
+                              temperature: float = None, namespace: str = "") -> AsyncIterator[str]:
+        """stream_chat through the response cache.
+
+        A cached response is yielded in one piece; a streamed response is
+        cached only if the stream ran to completion. Entries are scoped like
+        complete()'s, so a stream and a completion of the same request share one.
+        """
+        model = model or settings.ai_model
+        temperature = settings.ai_temperature if temperature is None else temperature
+        params = {"max_tokens": max_tokens or settings.ai_max_tokens}
+        cache = get_response_cache() if content_type is not None else None
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.lookup, model, temperature, messages, content_type,
+                                             params, namespace)
+            if cached is not None:
+                yield cached
+                return
+
+        started = time.perf_counter()
+        parts = []
+        async for delta in self.stream_chat(messages, model=model, max_tokens=max_tokens, temperature=temperature):
+            parts.append(delta)
+            yield delta
+
+        if cache is not None:
+            await asyncio.to_thread(cache.store, model, temperature, messages, content_type,
+                                    "".join(parts), (time.perf_counter() - started) * 1000, params, namespace)
+
+    def stream_complete(self, prompt: str, system_prompt: str, content_type: str = None,
+                        model: str = None, max_tokens: int = None,
+                        temperature: float = None, namespace: str = "") -> AsyncIterator[str]:
+        """Streaming counterpart of complete()"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        return self.stream_messages(messages, content_type=content_type, model=model,
+                                    max_tokens=max_tokens, temperature=temperature, namespace=namespace)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After if given"""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), 60.0)
+                except ValueError:
+                    pass
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    async def _post_with_retries(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        headers = self._headers()
+        url = f"{self.base_url}/chat/completions"
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    response = await self._client.post(url, headers=headers, json=payload)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            except httpx.HTTPStatusError as e:
+                self.stats["failures"] += 1
+                raise LLMError(f"HTTP {e.response.status_code}: {e.response.text[:200]}") from e
+
+            if attempt == self.max_retries:
+                break
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+        self.stats["failures"] += 1
+        raise LLMError(f"Chat completion failed after {self.max_retries + 1} attempts: {error}")
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_clients: Dict[asyncio.AbstractEventLoop, LLMClient] = {}
+
+
+def get_llm_client() -> LLMClient:
+    """The client for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # Drop clients of loops that have since closed (e.g. asyncio.run in scripts)
+        for stale in [l for l in _clients if l.is_closed()]:
+            del _clients[stale]
+        client = _clients[loop] = LLMClient()
+    return client
+
+
+async def close_llm_client():
+    """Close the running loop's client; called on application shutdown"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,118 @@
+"""
+Metrics Query Builder
+Computes several counts, sums and averages over one table in a single
+query instead of one query per figure. Each metric may carry its own
+conditions, rendered as aggregate FILTER (WHERE ...) clauses on PostgreSQL
+and as CASE expressions inside the aggregate elsewhere (SQLite):
+
+    counts = (
+        MetricsQuery(db, Enrollment)
+        .count("total")
+        .count("completed", Enrollment.status == "completed")
+        .filter(Enrollment.user_id == user_id)
+        .one()
+    )
+    counts["completed"]
+
+With group_by(), all() returns the metrics per group.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import and_, case, distinct, func
+from sqlalchemy.orm import Session
+
+
+class MetricsQuery:
+    """Named conditional aggregates over one table, fetched in one round trip"""
+
+    def __init__(self, db: Session, entity):
+        self.db = db
+        self.entity = entity
+        self._metrics: List[Tuple[str, Any, Any]] = []  # (name, aggregate, value when no rows match)
+        self._joins = []
+        self._filters = []
+        self._group_by = []
+        self._filter_clause = db.get_bind().dialect.name == "postgresql"
+
+    def _aggregate(self, aggregate, column, conditions):
+        if not conditions:
+            return aggregate(column) if column is not None else aggregate()
+        condition = and_(*conditions)
+        if self._filter_clause:
+            expression = aggregate(column) if column is not None else aggregate()
+            return expression.filter(condition)
+        return aggregate(case((condition, column if column is not None else 1)))
+
+    def count(self, name: str, *conditions) -> "MetricsQuery":
+        """Rows matching all conditions"""
+        self._metrics.append((name, self._aggregate(func.count, None, conditions), 0))
+        return self
+
+    def count_distinct(self, name: str, column, *conditions) -> "MetricsQuery":
+        """Distinct non-null values of column among rows matching all conditions"""
+        self._metrics.append((name, self._aggregate(lambda c: func.count(distinct(c)), column, conditions), 0))
+        return self
+
+    def sum(self, name: str, column, *conditions) -> "MetricsQuery":
+        """Sum of column over rows matching all conditions; 0 when none do"""
+        self._metrics.append((name, self._aggregate(func.sum, column, conditions), 0))
+        return self
+
+    def avg(self, name: str, column, *conditions) -> "MetricsQuery":
+        """Average of column over rows matching all conditions; None when none do"""
+        self._metrics.append((name, self._aggregate(func.avg, column, conditions), None))
+        return self
+
+    def max(self, name: str, column, *conditions) -> "MetricsQuery":
+        """Largest value of column among rows matching all conditions; None when none do"""
+        self._metrics.append((name, self._aggregate(func.max, column, conditions), None))
+        return self
+
+    def join(self, target, onclause) -> "MetricsQuery":
+        self._joins.append((target, onclause))
+        return self
+
+    def filter(self, *criteria) -> "MetricsQuery":
+        """Restrict the rows every metric is computed over"""
+        self._filters.extend(criteria)
+        return self
+
+    def group_by(self, *columns) -> "MetricsQuery":
+        self._group_by.extend(columns)
+        return self
+
+    def _query(self):
+        query = self.db.query(
+            *self._group_by, *(aggregate.label(name) for name, aggregate, _ in self._metrics)
+        ).select_from(self.entity)
+        for target, onclause in self._joins:
+            query = query.join(target, onclause)
+        if self._filters:
+            query = query.filter(*self._filters)
+        if self._group_by:
+            query = query.group_by(*self._group_by)
+        return query
+
+    def _values(self, row) -> Dict[str, Any]:
+        values = row[len(self._group_by):]
+        return {
+            name: default if value is None else value
+            for (name, _, default), value in zip(self._metrics, values)
+        }
+
+    def zero(self) -> Dict[str, Any]:
+        """The metrics when no rows match"""
+        return {name: default for name, _, default in self._metrics}
+
+    def one(self) -> Dict[str, Any]:
+        """The metrics over all rows"""
+        return self._values(self._query().one())
+
+    def all(self) -> Dict[Any, Dict[str, Any]]:
+        """The metrics per group, keyed by the group value (a tuple for several group_by columns)"""
+        groups = {}
+        for row in self._query().all():
+            key = tuple(row[:len(self._group_by)])
+            groups[key[0] if len(key) == 1 else key] = self._values(row)
+        return groups
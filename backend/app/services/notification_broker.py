@@ -0,0 +1,221 @@
+"""
+Notification Broker
+Fans real-time notifications out to every open notification stream of a
+user. Each stream gets its own bounded queue; when a slow client falls
+behind, the overflow policy decides what is lost:
+
+- "drop_oldest": discard the oldest pending notification
+- "drop_newest": discard the incoming notification
+- "merge": replace a pending notification about the same entity, and
+  otherwise fall back to drop_oldest
+
+The client is told how many notifications were dropped so it can refetch.
+The in-memory backend only reaches streams in the same process; the Redis
+backend publishes through Redis pub/sub so a notification created on any
+worker reaches the user's streams on every worker.
+"""
+
+import json
+import asyncio
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from ..core.config import settings
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "merge")
+REDIS_CHANNEL_PREFIX = "notifications:user:"
+
+
+class Subscription:
+    """One open notification stream with a bounded queue of pending events"""
+
+    def __init__(self, user_id: int, maxsize: int, policy: str, loop: asyncio.AbstractEventLoop):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.policy = policy
+        self.loop = loop
+        self.dropped = 0
+        self._pending: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._ids = itertools.count()
+        self._ready = asyncio.Event()
+
+    def put(self, event: Dict[str, Any], merge_key: Optional[str] = None):
+        """Queue an event; safe to call from any thread"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._offer(event, merge_key)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._offer, event, merge_key)
+
+    def _offer(self, event: Dict[str, Any], merge_key: Optional[str]):
+        if self.policy == "merge" and merge_key is not None and merge_key in self._pending:
+            merged = self._pending[merge_key].get("merged", 1) + 1
+            self._pending[merge_key] = {**event, "merged": merged}
+            return
+        if len(self._pending) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return
+            self._pending.popitem(last=False)
+        key = merge_key if self.policy == "merge" and merge_key is not None else ("id", next(self._ids))
+        self._pending[key] = event
+        self._ready.set()
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None after timeout seconds without one"""
+        if not self._pending and not self.dropped:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {"type": "notifications_dropped", "count": dropped}
+        return self._pending.popitem(last=False)[1]
+
+
+class InMemoryNotificationBroker:
+    """Delivers to streams open in this process"""
+
+    def __init__(self, queue_size: int = None, policy: str = None):
+        self.queue_size = queue_size or settings.notification_queue_size
+        self.policy = policy or settings.notification_overflow_policy
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Open a queue for one stream of a user; call from the event loop"""
+        subscription = Subscription(user_id, self.queue_size, self.policy, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def connection_count(self, user_id: int = None) -> int:
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscriptions.get(user_id, ()))
+            return sum(len(s) for s in self._subscriptions.values())
+
+    def deliver(self, user_id: int, event: Dict[str, Any], merge_key: Optional[str] = None):
+        """Queue an event on every local stream of the user"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put(event, merge_key)
+
+    def publish(self, user_id: int, event: Dict[str, Any], merge_key: Optional[str] = None):
+        """Send an event to all of the user's streams; safe to call from any thread"""
+        self.deliver(user_id, event, merge_key)
+
+    async def close(self):
+        pass
+
+
+class RedisNotificationBroker(InMemoryNotificationBroker):
+    """Publishes through Redis; each process relays messages to its local streams.
+
+    Every process pattern-subscribes to all user channels once, so opening
+    or closing a stream needs no Redis round trip.
+    """
+
+    def __init__(self, url: str, queue_size: int = None, policy: str = None):
+        super().__init__(queue_size, policy)
+        import redis
+        import redis.asyncio as aioredis
+        self.url = url
+        self._publisher = redis.Redis.from_url(url)
+        self._aioredis = aioredis
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, user_id: int) -> Subscription:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return super().subscribe(user_id)
+
+    def publish(self, user_id: int, event: Dict[str, Any], merge_key: Optional[str] = None):
+        message = json.dumps({"event": event, "merge_key": merge_key}, default=str)
+        try:
+            self._publisher.publish(f"{REDIS_CHANNEL_PREFIX}{user_id}", message)
+        except Exception as e:
+            # Still reach the streams on this worker
+            print(f"Warning: could not publish notification to Redis: {e}")
+            self.deliver(user_id, event, merge_key)
+
+    async def _listen(self):
+        """Relay published notifications to local streams, reconnecting on errors"""
+        delay = 1.0
+        while True:
+            client = self._aioredis.Redis.from_url(self.url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{REDIS_CHANNEL_PREFIX}*")
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    payload = json.loads(message["data"])
+                    self.deliver(int(channel[len(REDIS_CHANNEL_PREFIX):]), payload["event"], payload.get("merge_key"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: notification listener lost Redis connection: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._publisher.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_notification_broker() -> InMemoryNotificationBroker:
+    """The configured broker (settings.notification_broker: "memory" or "redis")"""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            if settings.notification_broker == "redis":
+                _broker = RedisNotificationBroker(settings.redis_url)
+            else:
+                _broker = InMemoryNotificationBroker()
+        return _broker
+
+
+async def close_notification_broker():
+    """Stop the broker; called on application shutdown"""
+    global _broker
+    broker, _broker = _broker, None
+    if broker is not None:
+        await broker.close()
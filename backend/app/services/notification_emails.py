@@ -0,0 +1,144 @@
+"""
+Notification Emails
+Notification emails wait in the notifications table (email_pending) rather
+than in process memory, so a restart or deploy never loses them. The
+periodic send_notification_digests job emails each recipient everything
+pending for them as one message: the notification itself when there is
+one, a digest when several arrived since the last run. A recipient's
+notifications are claimed (email_pending cleared) before their email is
+sent, so concurrent runs never email them twice; an email that fails is
+put back for the next run, at most settings.email_max_attempts times and
+never for refused recipients.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.email import EmailService, PERMANENT_ERRORS, RECONNECT_ERRORS, email_service
+from ..models.course import Course
+from ..models.messaging import Notification
+from ..models.user import User
+
+
+def notification_action_url(notification_type: str, course_id: Optional[int]) -> Optional[str]:
+    """Link included in notification emails"""
+    if notification_type == "message":
+        return f"http://localhost:3000/messaging"
+    elif notification_type == "qa_reply":
+        return f"http://localhost:3000/courses/{course_id}/qa" if course_id else "http://localhost:3000/qa"
+    elif notification_type == "course_update":
+        return f"http://localhost:3000/courses/{course_id}" if course_id else "http://localhost:3000/courses"
+    return None
+
+
+def _claim(db: Session, user_id: int) -> List[int]:
+    """Clear the user's pending notifications; the ids this run now owns"""
+    claimed = db.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.email_pending == True)
+        .values(email_pending=False)
+        .returning(Notification.id)
+    ).scalars().all()
+    db.commit()
+    return claimed
+
+
+def _release(db: Session, notification_ids: List[int], failed: bool = True):
+    """Put claimed notifications back for the next run.
+
+    A failed send counts as an attempt; after settings.email_max_attempts
+    the notifications are given up instead.
+    """
+    if failed:
+        values = {"email_attempts": Notification.email_attempts + 1,
+                  "email_pending": Notification.email_attempts + 1 < settings.email_max_attempts}
+    else:
+        values = {"email_pending": True}
+    db.execute(update(Notification).where(Notification.id.in_(notification_ids)).values(**values))
+    db.commit()
+
+
+def send_pending_notification_emails(db: Session, service: EmailService = None,
+                                     heartbeat: Optional[Callable[[bool], None]] = None) -> Dict[str, Any]:
+    """Email every recipient their pending notifications, one email each.
+
+    Sends are paced to settings.email_rate_limit over the service's shared
+    connection. heartbeat(False) is called before each recipient (job
+    handlers pass their lease renewal).
+    """
+    service = service or email_service
+    if not service.is_configured():
+        # Nothing could ever deliver them; don't let them pile up
+        skipped = db.execute(
+            update(Notification).where(Notification.email_pending == True).values(email_pending=False)
+        ).rowcount
+        db.commit()
+        if skipped:
+            print("Email configuration not set, skipping notification emails")
+        stats = {"recipients": 0, "sent": 0, "failed": 0, "digests": 0}
+        return {**stats, "skipped": skipped} if skipped else stats
+
+    user_ids = [row[0] for row in db.query(Notification.user_id).filter(Notification.email_pending == True).distinct()]
+    stats = {"recipients": 0, "sent": 0, "failed": 0, "digests": 0}
+    next_send = 0.0
+    for user_id in user_ids:
+        if heartbeat:
+            heartbeat(False)
+        notification_ids = _claim(db, user_id)
+        if not notification_ids:
+            continue  # Sent by a concurrent run
+        rows = (
+            db.query(
+                Notification.notification_type, Notification.title, Notification.content,
+                Notification.course_id, User.email, Course.title
+            )
+            .join(User, User.id == Notification.user_id)
+            .outerjoin(Course, Course.id == Notification.course_id)
+            .filter(Notification.id.in_(notification_ids))
+            .order_by(Notification.id)
+            .all()
+        )
+        if not rows:
+            continue
+        to_email = rows[0][4]
+        notifications = [{
+            "notification_type": notification_type,
+            "title": title,
+            "content": content,
+            "course_title": course_title,
+            "action_url": notification_action_url(notification_type, course_id)
+        } for notification_type, title, content, course_id, _, course_title in rows]
+        stats["recipients"] += 1
+        if len(notifications) == 1:
+            subject, html_content, text_content = service.notification_email(**notifications[0])
+        else:
+            subject, html_content, text_content = service.digest_email(notifications)
+
+        if settings.email_rate_limit > 0:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_send = max(next_send, time.monotonic()) + 1.0 / settings.email_rate_limit
+        try:
+            service.deliver(to_email, service.build_message(to_email, subject, html_content, text_content))
+        except PERMANENT_ERRORS as e:
+            print(f"Failed to send notification email to {to_email}: {str(e)}")
+            stats["failed"] += 1
+        except RECONNECT_ERRORS as e:
+            # The server is unreachable; everything left waits for the next run
+            print(f"Notification emails paused, mail server unavailable: {str(e)}")
+            stats["failed"] += 1
+            _release(db, notification_ids, failed=False)
+            break
+        except Exception as e:
+            print(f"Notification email to {to_email} failed: {str(e)}")
+            stats["failed"] += 1
+            _release(db, notification_ids)
+        else:
+            stats["sent"] += 1
+            stats["digests"] += len(notifications) > 1
+    return stats
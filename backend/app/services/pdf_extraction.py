@@ -0,0 +1,135 @@
+"""
+PDF Text Extraction Engine
+Streams page text out of PDFs one page at a time. Large documents are
+split into page ranges parsed in a process pool, and results are yielded
+in page order so callers can chunk and embed while parsing continues.
+"""
+
+import os
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+from ..core.config import settings
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _worker_count() -> int:
+    return settings.pdf_extract_workers or os.cpu_count() or 1
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Process pool shared by every extraction in this worker"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=_worker_count())
+        return _executor
+
+
+def _open(file_path: str):
+    import PyPDF2
+    return PyPDF2.PdfReader(str(file_path))
+
+
+def _extract_page(reader, page_index: int) -> str:
+    try:
+        return reader.pages[page_index].extract_text() or ""
+    except Exception as e:
+        print(f"Error extracting text from page {page_index + 1}: {e}")
+        return ""
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Process pool task: text of pages [start, stop) as (page number, text)"""
+    reader = _open(file_path)
+    return [(index + 1, _extract_page(reader, index)) for index in range(start, stop)]
+
+
+def read_pdf_info(file_path: str) -> Dict[str, Any]:
+    """Page count and document metadata, without extracting any text"""
+    reader = _open(file_path)
+    metadata = reader.metadata or {}
+    return {
+        "page_count": len(reader.pages),
+        "title": metadata.get("/Title", "") or "",
+        "author": metadata.get("/Author", "") or "",
+        "subject": metadata.get("/Subject", "") or "",
+        "creator": metadata.get("/Creator", "") or "",
+    }
+
+
+def iter_pdf_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Yield (page number, text) for every page in order.
+
+    Documents of at least settings.pdf_parallel_min_pages pages are parsed
+    in page ranges on the process pool. Only a bounded window of ranges is
+    in flight, so memory stays flat regardless of document length.
+    """
+    reader = _open(file_path)
+    page_count = len(reader.pages)
+
+    if page_count < settings.pdf_parallel_min_pages:
+        for index in range(page_count):
+            yield index + 1, _extract_page(reader, index)
+        return
+
+    # Each process parses the file itself; the parent only needs the page count
+    del reader
+    executor = _get_executor()
+    step = settings.pdf_pages_per_task
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    window = 2 * _worker_count()
+
+    pending = []
+    try:
+        for start, stop in ranges:
+            pending.append(executor.submit(_extract_page_range, str(file_path), start, stop))
+            if len(pending) >= window:
+                yield from pending.pop(0).result()
+        while pending:
+            yield from pending.pop(0).result()
+    finally:
+        # Abandoned by the consumer: don't keep parsing pages nobody will read
+        for future in pending:
+            future.cancel()
+
+
+def extract_pdf_text(file_path: str) -> str:
+    """Full document text with one line break between pages"""
+    return "".join(text + "\n" for _, text in iter_pdf_pages(file_path))
+
+
+async def aiter_pdf_pages(file_path: str) -> AsyncIterator[Tuple[int, str]]:
+    """Async variant of iter_pdf_pages; parsing happens off the event loop"""
+    pages = iter_pdf_pages(file_path)
+    done = object()
+    try:
+        while True:
+            page = await asyncio.to_thread(next, pages, done)
+            if page is done:
+                break
+            yield page
+    finally:
+        await asyncio.to_thread(pages.close)
+
+
+def iter_chunks(texts: Iterable[str], chunk_size: int = 500, overlap: int = 50) -> Iterator[str]:
+    """Split a stream of texts into overlapping word windows.
+
+    Produces the same chunks as splitting the joined text in one go, but
+    emits each chunk as soon as enough words have arrived.
+    """
+    step = chunk_size - overlap
+    buffer: List[str] = []
+    for text in texts:
+        buffer.extend(text.split())
+        while len(buffer) >= chunk_size:
+            yield " ".join(buffer[:chunk_size])
+            del buffer[:step]
+    while buffer:
+        yield " ".join(buffer[:chunk_size])
+        del buffer[:step]
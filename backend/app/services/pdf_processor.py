@@ -5,17 +5,18 @@ Handles PDF upload, processing, and content extraction
 
 import os
 import uuid
+import asyncio
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 from datetime import datetime
 import aiofiles
 from fastapi import UploadFile, HTTPException
 from PIL import Image
-import PyPDF2
 import magic
 from sqlalchemy.orm import Session
 
 from ..core.config import settings
+from .pdf_extraction import aiter_pdf_pages, read_pdf_info
 from ..models.course import CourseFileContent, Course
 from ..models.learning import LearningSession, Enrollment
 
@@ -65,8 +66,8 @@ class PDFProcessor:
             content = await file.read()
             await f.write(content)
         
-        # Extract PDF metadata and content
-        pdf_info = await self._extract_pdf_content(file_path)
+        # Extract PDF metadata; page text is streamed later by the embedders
+        pdf_info = await self._extract_pdf_content(file_path, include_text=False)
         
         return {
             "file_id": file_id,
@@ -81,36 +82,22 @@ class PDFProcessor:
             "status": "processed"
         }
     
-    async def _extract_pdf_content(self, file_path: Path) -> Dict[str, Any]:
-        """Extract content and metadata from PDF"""
+    async def _extract_pdf_content(self, file_path: Path, include_text: bool = True) -> Dict[str, Any]:
+        """Extract content and metadata from PDF without blocking the event loop"""
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                # Extract metadata
-                metadata = pdf_reader.metadata or {}
-                
-                # Extract text from all pages
-                text_content = []
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        text = page.extract_text()
-                        if text.strip():
-                            text_content.append({
-                                "page": page_num + 1,
-                                "text": text.strip()
-                            })
-                    except Exception as e:
-                        print(f"Error extracting text from page {page_num + 1}: {e}")
-                
-                return {
-                    "page_count": len(pdf_reader.pages),
-                    "title": metadata.get("Title", ""),
-                    "author": metadata.get("Author", ""),
-                    "subject": metadata.get("Subject", ""),
-                    "creator": metadata.get("Creator", ""),
-                    "text_content": text_content
-                }
+            pdf_info = await asyncio.to_thread(read_pdf_info, str(file_path))
+            
+            # Extract text from all pages
+            text_content = []
+            if include_text:
+                async for page_number, text in aiter_pdf_pages(str(file_path)):
+                    if text.strip():
+                        text_content.append({
+                            "page": page_number,
+                            "text": text.strip()
+                        })
+            
+            return {**pdf_info, "text_content": text_content}
         except Exception as e:
             raise HTTPException(
                 status_code=400,
@@ -6,7 +6,8 @@ Handles document embedding, vector storage, and content retrieval
 import os
 import json
 import uuid
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
 from datetime import datetime
 import numpy as np
 from sqlalchemy.orm import Session
@@ -20,124 +21,116 @@ from pathlib import Path
 from ..models.course import CourseFileContent, Course
 from ..models.ai import ContentGeneration
 from ..core.config import settings
+from .pdf_extraction import iter_chunks
+from .llm_cache import cached_completion
+from .text_cache import iter_cached_pages
+from .context_builder import PackedContext, build_context
+from .embedding_cache import get_embedding_cache
+from .vector_store import (
+    GLOBAL_SHARD, course_shard, index_documents, remove_from_shards, search_shard
+)
+
+
+_models: Dict[str, SentenceTransformer] = {}
+_models_lock = threading.Lock()
+
+
+def _get_model(model_name: str) -> SentenceTransformer:
+    """Load each SentenceTransformer once per process"""
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = SentenceTransformer(model_name)
+        return model
 
 
 class DocumentEmbedder:
     """Handles document embedding and vector storage"""
     
     def __init__(self):
-        self.model = SentenceTransformer(settings.ai_embedding_model)
+        self.model = _get_model(settings.ai_embedding_model)
         self.embedding_dim = settings.vector_dimension
-        self.vector_store_path = Path(settings.vector_store_path)
-        self.vector_store_path.mkdir(parents=True, exist_ok=True)
-        self.index = None
-        self.document_metadata = {}
-        self._load_vector_store()
+        self.cache = get_embedding_cache(settings.ai_embedding_model, self.embedding_dim) \
+            if settings.embedding_cache_enabled else None
     
-    def _load_vector_store(self):
-        """Load existing vector store if available"""
-        index_path = self.vector_store_path / "faiss_index.bin"
-        metadata_path = self.vector_store_path / "metadata.json"
-        
-        if index_path.exists() and metadata_path.exists():
-            try:
-                self.index = faiss.read_index(str(index_path))
-                with open(metadata_path, 'r') as f:
-                    self.document_metadata = json.load(f)
-            except Exception as e:
-                print(f"Error loading vector store: {e}")
-                self._create_new_index()
-        else:
-            self._create_new_index()
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts as L2-normalized float32 vectors for cosine similarity"""
+        embeddings = np.ascontiguousarray(self.model.encode(texts), dtype='float32')
+        faiss.normalize_L2(embeddings)
+        return embeddings
     
-    def _create_new_index(self):
-        """Create a new FAISS index"""
-        self.index = faiss.IndexFlatIP(self.embedding_dim)  # Inner product for cosine similarity
-        self.document_metadata = {}
+    def _encode_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Encode document chunks, reusing cached embeddings of previously seen text"""
+        if self.cache is None:
+            return self._encode(chunks)
+        return self.cache.encode(chunks, self._encode)
     
-    def _save_vector_store(self):
-        """Save vector store to disk"""
-        try:
-            index_path = self.vector_store_path / "faiss_index.bin"
-            metadata_path = self.vector_store_path / "metadata.json"
-            
-            faiss.write_index(self.index, str(index_path))
-            with open(metadata_path, 'w') as f:
-                json.dump(self.document_metadata, f, indent=2)
-        except Exception as e:
-            print(f"Error saving vector store: {e}")
+    def cache_stats(self) -> Dict[str, int]:
+        """Embedding cache hit/miss counts and bytes saved in this process"""
+        return self.cache.stats() if self.cache is not None else {}
     
-    def embed_document(self, content: str, document_id: str, metadata: Dict[str, Any]) -> bool:
-        """Embed a document and add to vector store"""
+    def embed_document(self, content: str, document_id: str, metadata: Dict[str, Any]) -> int:
+        """Embed a document and add to vector store; returns chunks created"""
         try:
             # Split content into chunks for better retrieval
             chunks = self._chunk_text(content, chunk_size=500, overlap=50)
+            if not chunks:
+                return 0
             
-            for i, chunk in enumerate(chunks):
-                # Generate embedding
-                embedding = self.model.encode([chunk])[0]
-                embedding = embedding.astype('float32')
-                
-                # Normalize for cosine similarity
-                faiss.normalize_L2(embedding.reshape(1, -1))
-                
-                # Add to index
-                self.index.add(embedding.reshape(1, -1))
-                
-                # Store metadata
-                chunk_id = f"{document_id}_chunk_{i}"
-                self.document_metadata[chunk_id] = {
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "content": chunk,
-                    "metadata": metadata,
-                    "created_at": datetime.now().isoformat()
-                }
+            embeddings = self._encode_chunks(chunks)
             
-            # Save updated vector store
-            self._save_vector_store()
-            return True
+            # Replaces any chunks stored for this document by a previous run
+            index_documents([(document_id, metadata, chunks, embeddings)], self.embedding_dim)
+            return len(chunks)
             
         except Exception as e:
             print(f"Error embedding document: {e}")
-            return False
+            return 0
     
-    def _chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
+    def remove_document(self, document_id: str, course_id: Optional[int] = None) -> int:
+        """Remove a document's chunks from its course shard and the global shard"""
+        return remove_from_shards(document_id, course_id, self.embedding_dim)
+    
+    def embed_pages(self, pages: Iterable[str], document_id: str, metadata: Dict[str, Any],
+                    batch_size: int = 64, heartbeat: Optional[Callable[[bool], None]] = None) -> int:
+        """Embed a document streamed page by page; returns chunks created.
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = " ".join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk.strip())
+        Chunks are embedded in batches while later pages are still being
+        extracted, and the document is committed to the vector store once.
+        heartbeat(False) is called after every batch and heartbeat(True)
+        just before the commit; it may raise to abandon the document.
+        """
+        chunks: List[str] = []
+        embeddings = []
+        for chunk in iter_chunks(pages, chunk_size=500, overlap=50):
+            chunks.append(chunk)
+            if len(chunks) % batch_size == 0:
+                embeddings.append(self._encode_chunks(chunks[-batch_size:]))
+                if heartbeat:
+                    heartbeat(False)
+        if len(chunks) % batch_size:
+            embeddings.append(self._encode_chunks(chunks[-(len(chunks) % batch_size):]))
+        if not chunks:
+            return 0
         
-        return chunks
+        if heartbeat:
+            heartbeat(True)
+        index_documents([(document_id, metadata, chunks, np.vstack(embeddings))], self.embedding_dim)
+        return len(chunks)
     
-    def search_similar_content(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar content using vector similarity"""
+    def _chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+        """Split text into overlapping chunks"""
+        return list(iter_chunks([text], chunk_size, overlap))
+    
+    def search_similar_content(self, query: str, top_k: int = 5,
+                               course_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Search for similar content in a course's shard, or the global shard"""
         try:
             # Generate query embedding
-            query_embedding = self.model.encode([query])[0]
-            query_embedding = query_embedding.astype('float32')
-            faiss.normalize_L2(query_embedding.reshape(1, -1))
-            
-            # Search for similar vectors
-            scores, indices = self.index.search(query_embedding.reshape(1, -1), top_k)
-            
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx in self.document_metadata:
-                    chunk_data = self.document_metadata[idx]
-                    results.append({
-                        "score": float(score),
-                        "content": chunk_data["content"],
-                        "document_id": chunk_data["document_id"],
-                        "chunk_index": chunk_data["chunk_index"],
-                        "metadata": chunk_data["metadata"]
-                    })
-            
-            return results
+            query_embedding = self._encode([query])[0]
+            
+            shard = GLOBAL_SHARD if course_id is None else course_shard(course_id)
+            return search_shard(shard, query_embedding, top_k, self.embedding_dim)
             
         except Exception as e:
             print(f"Error searching similar content: {e}")
@@ -164,15 +157,6 @@ class RAGService:
             if not document:
                 return {"error": "Document not found or access denied"}
             
-            # Extract text content from PDF
-            if document.file_path and document.content_type == "pdf":
-                text_content = self._extract_pdf_text(document.file_path)
-            else:
-                text_content = document.description or ""
-            
-            if not text_content.strip():
-                return {"error": "No text content found in document"}
-            
             # Create document metadata
             metadata = {
                 "course_id": document.course_id,
@@ -186,13 +170,22 @@ class RAGService:
             
             # Embed document
             document_id = f"doc_{content_id}"
-            success = self.embedder.embed_document(text_content, document_id, metadata)
+            if document.file_path and document.content_type == "pdf":
+                # Pages are chunked and embedded as they are read from the text cache or extracted
+                pages = (page_text for _, page_text in iter_cached_pages(document.file_path))
+                chunks_created = self.embedder.embed_pages(pages, document_id, metadata)
+            else:
+                text_content = document.description or ""
+                if not text_content.strip():
+                    return {"error": "No text content found in document"}
+                chunks_created = self.embedder.embed_document(text_content, document_id, metadata)
             
-            if success:
+            if chunks_created:
                 return {
                     "status": "success",
                     "document_id": document_id,
-                    "chunks_created": len(self.embedder.document_metadata),
+                    "chunks_created": chunks_created,
+                    "embedding_cache": self.embedder.cache_stats(),
                     "message": "Document successfully processed and embedded"
                 }
             else:
@@ -201,19 +194,13 @@ class RAGService:
         except Exception as e:
             return {"error": f"Error processing document: {str(e)}"}
     
-    def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF file"""
+    def remove_document(self, content_id: int, course_id: Optional[int] = None) -> int:
+        """Remove a deactivated document's chunks from the vector store"""
         try:
-            import PyPDF2
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
+            return self.embedder.remove_document(f"doc_{content_id}", course_id)
         except Exception as e:
-            print(f"Error extracting PDF text: {e}")
-            return ""
+            print(f"Error removing document embeddings: {e}")
+            return 0
     
     def generate_course_content(self, 
                               course_id: int, 
@@ -238,12 +225,12 @@ class RAGService:
             relevant_docs = self._get_course_documents(course_id)
             
             # Build context from relevant documents
-            context = self._build_context_from_documents(relevant_docs, description)
+            packed_context = self._build_context_from_documents(relevant_docs, description, course_id)
             
             # Generate content using AI
-            if use_rag and context:
+            if use_rag and packed_context.text:
                 generated_content = self._generate_with_rag(
-                    content_type, title, description, context, additional_instructions
+                    content_type, title, description, packed_context.text, additional_instructions
                 )
             else:
                 generated_content = self._generate_without_rag(
@@ -269,6 +256,7 @@ class RAGService:
                 "content_type": content_type,
                 "generation_id": content_generation.id,
                 "sources_used": len(relevant_docs),
+                "context": packed_context.summary(),
                 "model_used": generated_content.get("model", "gpt-3.5-turbo")
             }
             
@@ -295,20 +283,23 @@ class RAGService:
             for doc in documents
         ]
     
-    def _build_context_from_documents(self, documents: List[Dict[str, Any]], query: str) -> str:
-        """Build context from relevant document chunks"""
+    def _build_context_from_documents(self, documents: List[Dict[str, Any]], query: str,
+                                      course_id: Optional[int] = None) -> PackedContext:
+        """Build a token-budgeted context from the most relevant document chunks"""
         if not documents:
-            return ""
+            return PackedContext(budget=settings.rag_context_tokens)
         
-        # Search for relevant chunks
-        relevant_chunks = self.embedder.search_similar_content(query, top_k=10)
+        # Search for relevant chunks in the course's own shard
+        relevant_chunks = self.embedder.search_similar_content(
+            query, top_k=settings.rag_context_candidates, course_id=course_id
+        )
         
-        # Build context string
-        context_parts = []
-        for chunk in relevant_chunks:
-            context_parts.append(f"Source: {chunk['metadata']['title']}\n{chunk['content']}\n")
+        # Skip chunks of documents deactivated since they were embedded
+        active_ids = {f"doc_{doc['id']}" for doc in documents}
+        relevant_chunks = [chunk for chunk in relevant_chunks if chunk['document_id'] in active_ids]
         
-        return "\n".join(context_parts)
+        # Rank, de-duplicate and pack into the prompt's token budget
+        return build_context(relevant_chunks)
     
     def _generate_with_rag(self, content_type: str, title: str, description: str, 
                           context: str, additional_instructions: str) -> Dict[str, Any]:
@@ -319,24 +310,31 @@ class RAGService:
             
             prompt = self._build_rag_prompt(content_type, title, description, context, additional_instructions)
             
-            response = self.openai_client.chat.completions.create(
-                model=settings.ai_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert educational content creator specializing in construction industry training. Create high-quality, practical educational materials based on the provided context documents. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=settings.ai_max_tokens,
-                temperature=settings.ai_temperature
+            messages = [
+                {
+                    "role": "system",
+                    "content": "You are an expert educational content creator specializing in construction industry training. Create high-quality, practical educational materials based on the provided context documents. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+            
+            # Regenerating the same content is answered from the response cache
+            content = cached_completion(
+                messages, settings.ai_model, settings.ai_temperature, content_type,
+                lambda: self.openai_client.chat.completions.create(
+                    model=settings.ai_model,
+                    messages=messages,
+                    max_tokens=settings.ai_max_tokens,
+                    temperature=settings.ai_temperature
+                ).choices[0].message.content,
+                params={"max_tokens": settings.ai_max_tokens}, namespace="rag.with_context"
             )
             
             return {
-                "content": response.choices[0].message.content,
+                "content": content,
                 "model": "gpt-3.5-turbo"
             }
             
@@ -353,24 +351,31 @@ class RAGService:
             
             prompt = self._build_basic_prompt(content_type, title, description, additional_instructions)
             
-            response = self.openai_client.chat.completions.create(
-                model=settings.ai_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert educational content creator specializing in construction industry training. Create high-quality, practical educational materials. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=settings.ai_max_tokens,
-                temperature=settings.ai_temperature
+            messages = [
+                {
+                    "role": "system",
+                    "content": "You are an expert educational content creator specializing in construction industry training. Create high-quality, practical educational materials. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+            
+            # Regenerating the same content is answered from the response cache
+            content = cached_completion(
+                messages, settings.ai_model, settings.ai_temperature, content_type,
+                lambda: self.openai_client.chat.completions.create(
+                    model=settings.ai_model,
+                    messages=messages,
+                    max_tokens=settings.ai_max_tokens,
+                    temperature=settings.ai_temperature
+                ).choices[0].message.content,
+                params={"max_tokens": settings.ai_max_tokens}, namespace="rag.without_context"
             )
             
             return {
-                "content": response.choices[0].message.content,
+                "content": content,
                 "model": "gpt-3.5-turbo"
             }
             
@@ -604,10 +609,10 @@ By the end of this lesson, students will be able to:
             if not documents:
                 return []
             
-            # Search for relevant chunks
-            relevant_chunks = self.embedder.search_similar_content(query, top_k)
+            # Search only this course's shard
+            relevant_chunks = self.embedder.search_similar_content(query, top_k, course_id=course_id)
             
-            # Filter results to only include chunks from this course
+            # Drop chunks of documents deactivated since they were embedded
             course_document_ids = {f"doc_{doc['id']}" for doc in documents}
             filtered_results = [
                 chunk for chunk in relevant_chunks
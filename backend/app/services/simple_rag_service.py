@@ -6,7 +6,8 @@ A lightweight version that works without heavy ML dependencies
 import os
 import json
 import uuid
-from typing import List, Dict, Any, Optional, Tuple
+import zlib
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
 from datetime import datetime
 import numpy as np
 from sqlalchemy.orm import Session
@@ -19,6 +20,40 @@ from pathlib import Path
 from ..models.course import CourseFileContent, Course
 from ..models.ai import ContentGeneration
 from ..core.config import settings
+from .pdf_extraction import iter_chunks
+from .llm_cache import cached_completion
+from .text_cache import iter_cached_pages
+from .context_builder import PackedContext, build_context
+from .vector_store import (
+    GLOBAL_SHARD, course_shard, index_documents, remove_from_shards, search_shard
+)
+
+RAG_SYSTEM_PROMPT = "You are an expert educational content creator specialising in construction industry training. Create high-quality, practical educational materials based on the provided context documents. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
+BASIC_SYSTEM_PROMPT = "You are an expert educational content creator specialising in construction industry training. Create high-quality, practical educational materials. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
+
+
+class _WordBuckets(dict):
+    """Memoised word -> feature bucket mapping.
+    
+    Uses CRC32 rather than ``hash()``, which is salted per interpreter, so
+    vectors written by one process stay comparable with queries from another.
+    """
+    
+    def __init__(self, dimension: int):
+        super().__init__()
+        self.dimension = dimension
+    
+    def __missing__(self, word: str) -> int:
+        bucket = self[word] = zlib.crc32(word.encode("utf-8")) % self.dimension
+        return bucket
+
+
+_word_buckets: Dict[int, _WordBuckets] = {}
+
+
+def _get_word_buckets(dimension: int) -> _WordBuckets:
+    """Share one bucket memo per dimension across embedders in this process"""
+    return _word_buckets.setdefault(dimension, _WordBuckets(dimension))
 
 
 class SimpleDocumentEmbedder:
@@ -26,134 +61,123 @@ class SimpleDocumentEmbedder:
     
     def __init__(self):
         self.embedding_dim = settings.vector_dimension
-        self.vector_store_path = Path(settings.vector_store_path)
-        self.vector_store_path.mkdir(parents=True, exist_ok=True)
-        self.index = None
-        self.document_metadata = {}
-        self._load_vector_store()
-    
-    def _load_vector_store(self):
-        """Load existing vector store if available"""
-        index_path = self.vector_store_path / "faiss_index.bin"
-        metadata_path = self.vector_store_path / "metadata.json"
-        
-        if index_path.exists() and metadata_path.exists():
-            try:
-                self.index = faiss.read_index(str(index_path))
-                with open(metadata_path, 'r') as f:
-                    self.document_metadata = json.load(f)
-            except Exception as e:
-                print(f"Error loading vector store: {e}")
-                self._create_new_index()
-        else:
-            self._create_new_index()
-    
-    def _create_new_index(self):
-        """Create a new FAISS index"""
-        self.index = faiss.IndexFlatIP(self.embedding_dim)  # Inner product for cosine similarity
-        self.document_metadata = {}
-    
-    def _save_vector_store(self):
-        """Save vector store to disk"""
-        try:
-            index_path = self.vector_store_path / "faiss_index.bin"
-            metadata_path = self.vector_store_path / "metadata.json"
-            
-            faiss.write_index(self.index, str(index_path))
-            with open(metadata_path, 'w') as f:
-                json.dump(self.document_metadata, f, indent=2)
-        except Exception as e:
-            print(f"Error saving vector store: {e}")
+        self._word_buckets = _get_word_buckets(self.embedding_dim)
     
     def _simple_embedding(self, text: str) -> np.ndarray:
         """Create a simple embedding using basic text features"""
-        # Simple bag-of-words approach with TF-IDF-like weighting
-        words = text.lower().split()
-        word_counts = {}
-        for word in words:
-            word_counts[word] = word_counts.get(word, 0) + 1
+        return self._simple_embeddings([text])[0]
+    
+    def _simple_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Create simple bag-of-words embeddings for a batch of texts in one pass"""
+        embeddings = np.zeros((len(texts), self.embedding_dim), dtype='float32')
+        tokenised = [text.lower().split() for text in texts]
+        lengths = np.fromiter((len(words) for words in tokenised), dtype=np.int64, count=len(texts))
+        total_words = int(lengths.sum())
+        if total_words == 0:
+            return embeddings
         
-        # Create a simple embedding vector
-        embedding = np.zeros(self.embedding_dim)
+        # Hash every word into a feature bucket (each distinct word is hashed once)
+        buckets = np.fromiter(
+            map(self._word_buckets.__getitem__, (word for words in tokenised for word in words)),
+            dtype=np.int64,
+            count=total_words
+        )
+        rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
         
-        # Use word hashing to create features
-        for word, count in word_counts.items():
-            # Simple hash-based feature
-            hash_val = hash(word) % self.embedding_dim
-            embedding[hash_val] += count
+        # Scatter word counts for the whole batch into one dense matrix
+        counts = np.bincount(rows * self.embedding_dim + buckets, minlength=embeddings.size)
+        embeddings[:] = counts.reshape(embeddings.shape)
         
-        # Normalize
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
+        # Normalize every row at once
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        np.divide(embeddings, norms, out=embeddings, where=norms > 0)
         
-        return embedding.astype('float32')
+        return embeddings
     
     def embed_document(self, content: str, document_id: str, metadata: Dict[str, Any]) -> bool:
         """Embed a document and add to vector store"""
         try:
-            # Split content into chunks for better retrieval
-            chunks = self._chunk_text(content, chunk_size=500, overlap=50)
-            
-            for i, chunk in enumerate(chunks):
-                # Generate embedding
-                embedding = self._simple_embedding(chunk)
-                
-                # Add to index
-                self.index.add(embedding.reshape(1, -1))
-                
-                # Store metadata
-                chunk_id = f"{document_id}_chunk_{i}"
-                self.document_metadata[chunk_id] = {
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "content": chunk,
-                    "metadata": metadata,
-                    "created_at": datetime.now().isoformat()
-                }
-            
-            # Save updated vector store
-            self._save_vector_store()
+            self.embed_documents([(content, document_id, metadata)])
             return True
             
         except Exception as e:
             print(f"Error embedding document: {e}")
             return False
     
-    def _chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
+    def embed_documents(self, documents: List[Tuple[str, str, Dict[str, Any]]],
+                        heartbeat: Optional[Callable[[bool], None]] = None) -> int:
+        """Embed a batch of (content, document_id, metadata) documents.
+        
+        All chunks are embedded as one matrix and the vector store is
+        committed once for the whole batch. Returns the number of chunks added.
+        heartbeat(True), if given, is called just before the commit.
+        """
+        # Split content into chunks for better retrieval
+        chunked = [
+            (document_id, metadata, self._chunk_text(content, chunk_size=500, overlap=50))
+            for content, document_id, metadata in documents
+        ]
+        chunk_texts = [chunk for _, _, chunks in chunked for chunk in chunks]
+        if not chunk_texts:
+            return 0
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = " ".join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk.strip())
+        embeddings = self._simple_embeddings(chunk_texts)
+        
+        # Each document's rows of the batch matrix go to its course (and global) shard
+        batch = []
+        start = 0
+        for document_id, metadata, chunks in chunked:
+            batch.append((document_id, metadata, chunks, embeddings[start:start + len(chunks)]))
+            start += len(chunks)
+        if heartbeat:
+            heartbeat(True)
+        index_documents(batch, self.embedding_dim)
+        return len(chunk_texts)
+    
+    def remove_document(self, document_id: str, course_id: Optional[int] = None) -> int:
+        """Remove a document's chunks from its course shard and the global shard"""
+        return remove_from_shards(document_id, course_id, self.embedding_dim)
+    
+    def embed_pages(self, pages: Iterable[str], document_id: str, metadata: Dict[str, Any],
+                    batch_size: int = 64, heartbeat: Optional[Callable[[bool], None]] = None) -> int:
+        """Embed a document streamed page by page; returns chunks created.
+        
+        Chunks are embedded in batches while later pages are still being
+        extracted, and the document is committed to the vector store once.
+        heartbeat(False) is called after every batch and heartbeat(True)
+        just before the commit; it may raise to abandon the document.
+        """
+        chunks: List[str] = []
+        embeddings = []
+        for chunk in iter_chunks(pages, chunk_size=500, overlap=50):
+            chunks.append(chunk)
+            if len(chunks) % batch_size == 0:
+                embeddings.append(self._simple_embeddings(chunks[-batch_size:]))
+                if heartbeat:
+                    heartbeat(False)
+        if len(chunks) % batch_size:
+            embeddings.append(self._simple_embeddings(chunks[-(len(chunks) % batch_size):]))
+        if not chunks:
+            return 0
         
-        return chunks
+        if heartbeat:
+            heartbeat(True)
+        index_documents([(document_id, metadata, chunks, np.vstack(embeddings))], self.embedding_dim)
+        return len(chunks)
     
-    def search_similar_content(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar content using vector similarity"""
+    def _chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+        """Split text into overlapping chunks"""
+        return list(iter_chunks([text], chunk_size, overlap))
+    
+    def search_similar_content(self, query: str, top_k: int = 5,
+                               course_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Search for similar content in a course's shard, or the global shard"""
         try:
             # Generate query embedding
             query_embedding = self._simple_embedding(query)
             
-            # Search for similar vectors
-            scores, indices = self.index.search(query_embedding.reshape(1, -1), top_k)
-            
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx < len(self.document_metadata):
-                    chunk_data = self.document_metadata[f"doc_{idx//10}_chunk_{idx%10}"]  # Approximate mapping
-                    results.append({
-                        "score": float(score),
-                        "content": chunk_data["content"],
-                        "document_id": chunk_data["document_id"],
-                        "chunk_index": chunk_data["chunk_index"],
-                        "metadata": chunk_data["metadata"]
-                    })
-            
-            return results
+            shard = GLOBAL_SHARD if course_id is None else course_shard(course_id)
+            return search_shard(shard, query_embedding, top_k, self.embedding_dim)
             
         except Exception as e:
             print(f"Error searching similar content: {e}")
@@ -168,8 +192,13 @@ class SimpleRAGService:
         self.embedder = SimpleDocumentEmbedder()
         self.openai_client = openai.OpenAI(api_key=settings.openai_api_key or os.getenv("OPENAI_API_KEY", ""))
     
-    def process_uploaded_document(self, content_id: int, instructor_id: int) -> Dict[str, Any]:
-        """Process uploaded document and create embeddings"""
+    def process_uploaded_document(self, content_id: int, instructor_id: int,
+                                  heartbeat: Optional[Callable[[bool], None]] = None) -> Dict[str, Any]:
+        """Process uploaded document and create embeddings.
+        
+        heartbeat is passed to the embedder (see embed_pages); job handlers
+        use it to keep their lease through long documents.
+        """
         try:
             # Get document from database
             document = self.db.query(CourseFileContent).filter(
@@ -180,15 +209,6 @@ class SimpleRAGService:
             if not document:
                 return {"error": "Document not found or access denied"}
             
-            # Extract text content from PDF
-            if document.file_path and document.content_type == "pdf":
-                text_content = self._extract_pdf_text(document.file_path)
-            else:
-                text_content = document.description or ""
-            
-            if not text_content.strip():
-                return {"error": "No text content found in document"}
-            
             # Create document metadata
             metadata = {
                 "course_id": document.course_id,
@@ -200,36 +220,38 @@ class SimpleRAGService:
                 "created_at": document.created_at.isoformat()
             }
             
-            # Embed document
+            # Embed document (replaces any chunks from a previous run)
             document_id = f"doc_{content_id}"
-            success = self.embedder.embed_document(text_content, document_id, metadata)
-            
-            if success:
-                return {
-                    "status": "success",
-                    "document_id": document_id,
-                    "chunks_created": len(self.embedder.document_metadata),
-                    "message": "Document successfully processed and embedded"
-                }
+            if document.file_path and document.content_type == "pdf":
+                # Pages are chunked and embedded as they are read from the text cache or extracted
+                pages = (page_text for _, page_text in iter_cached_pages(document.file_path))
+                chunks_created = self.embedder.embed_pages(pages, document_id, metadata, heartbeat=heartbeat)
             else:
-                return {"error": "Failed to process document"}
+                text_content = document.description or ""
+                chunks_created = self.embedder.embed_documents(
+                    [(text_content, document_id, metadata)], heartbeat=heartbeat
+                )
+            
+            if not chunks_created:
+                return {"error": "No text content found in document"}
+            
+            return {
+                "status": "success",
+                "document_id": document_id,
+                "chunks_created": chunks_created,
+                "message": "Document successfully processed and embedded"
+            }
                 
         except Exception as e:
             return {"error": f"Error processing document: {str(e)}"}
     
-    def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF file"""
+    def remove_document(self, content_id: int, course_id: Optional[int] = None) -> int:
+        """Remove a deactivated document's chunks from the vector store"""
         try:
-            import PyPDF2
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
+            return self.embedder.remove_document(f"doc_{content_id}", course_id)
         except Exception as e:
-            print(f"Error extracting PDF text: {e}")
-            return ""
+            print(f"Error removing document embeddings: {e}")
+            return 0
     
     def generate_course_content(self, 
                               course_id: int, 
@@ -254,12 +276,12 @@ class SimpleRAGService:
             relevant_docs = self._get_course_documents(course_id)
             
             # Build context from relevant documents
-            context = self._build_context_from_documents(relevant_docs, description)
+            packed_context = self._build_context_from_documents(relevant_docs, description, course_id)
             
             # Generate content using AI
-            if use_rag and context:
+            if use_rag and packed_context.text:
                 generated_content = self._generate_with_rag(
-                    content_type, title, description, context, additional_instructions
+                    content_type, title, description, packed_context.text, additional_instructions
                 )
             else:
                 generated_content = self._generate_without_rag(
@@ -267,24 +289,18 @@ class SimpleRAGService:
                 )
             
             # Save generated content to database
-            content_generation = ContentGeneration(
-                prompt=f"Generate {content_type} for course {course_id}",
-                generated_content=generated_content["content"],
-                model_used=generated_content.get("model", settings.ai_model),
-                content_type=content_type,
-                course_id=course_id,
-                is_approved=False
+            content_generation = self.save_generation(
+                course_id, content_type, generated_content["content"],
+                generated_content.get("model", settings.ai_model)
             )
             
-            self.db.add(content_generation)
-            self.db.commit()
-            
             return {
                 "status": "success",
                 "content": generated_content["content"],
                 "content_type": content_type,
                 "generation_id": content_generation.id,
                 "sources_used": len(relevant_docs),
+                "context": packed_context.summary(),
                 "model_used": generated_content.get("model", settings.ai_model)
             }
             
@@ -311,20 +327,86 @@ class SimpleRAGService:
             for doc in documents
         ]
     
-    def _build_context_from_documents(self, documents: List[Dict[str, Any]], query: str) -> str:
-        """Build context from relevant document chunks"""
+    def _build_context_from_documents(self, documents: List[Dict[str, Any]], query: str,
+                                      course_id: Optional[int] = None) -> PackedContext:
+        """Build a token-budgeted context from the most relevant document chunks"""
         if not documents:
-            return ""
+            return PackedContext(budget=settings.rag_context_tokens)
+        
+        # Search for relevant chunks in the course's own shard
+        relevant_chunks = self.embedder.search_similar_content(
+            query, top_k=settings.rag_context_candidates, course_id=course_id
+        )
+        
+        # Skip chunks of documents deactivated since they were embedded
+        active_ids = {f"doc_{doc['id']}" for doc in documents}
+        relevant_chunks = [chunk for chunk in relevant_chunks if chunk['document_id'] in active_ids]
+        
+        # Rank, de-duplicate and pack into the prompt's token budget
+        return build_context(relevant_chunks)
+    
+    def _generation_messages(self, content_type: str, title: str, description: str,
+                             context: str, additional_instructions: str) -> List[Dict[str, str]]:
+        """Chat messages for a generation, grounded in the context when there is one"""
+        if context:
+            system_prompt = RAG_SYSTEM_PROMPT
+            prompt = self._build_rag_prompt(content_type, title, description, context, additional_instructions)
+        else:
+            system_prompt = BASIC_SYSTEM_PROMPT
+            prompt = self._build_basic_prompt(content_type, title, description, additional_instructions)
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def prepare_course_content(self,
+                               course_id: int,
+                               instructor_id: int,
+                               content_type: str,
+                               title: str,
+                               description: str,
+                               additional_instructions: str = "",
+                               use_rag: bool = True) -> Dict[str, Any]:
+        """Retrieve context and build the messages for a generation without calling the model.
+
+        Used to stream a generation; save_generation stores the result.
+        """
+        course = self.db.query(Course).filter(
+            Course.id == course_id,
+            Course.instructor_id == instructor_id
+        ).first()
         
-        # Search for relevant chunks
-        relevant_chunks = self.embedder.search_similar_content(query, top_k=10)
+        if not course:
+            return {"error": "Course not found or access denied"}
         
-        # Build context string
-        context_parts = []
-        for chunk in relevant_chunks:
-            context_parts.append(f"Source: {chunk['metadata']['title']}\n{chunk['content']}\n")
+        relevant_docs = self._get_course_documents(course_id)
+        packed_context = self._build_context_from_documents(relevant_docs, description, course_id)
+        context = packed_context.text if use_rag else ""
         
-        return "\n".join(context_parts)
+        return {
+            "messages": self._generation_messages(content_type, title, description, context, additional_instructions),
+            # Same cache namespace as generate_course_content's completion
+            "namespace": "simple_rag.with_context" if context else "simple_rag.without_context",
+            "mock_content": None if self.openai_client.api_key else
+                self._generate_mock_content(content_type, title, description)["content"],
+            "sources_used": len(relevant_docs),
+            "context": packed_context.summary()
+        }
+    
+    def save_generation(self, course_id: int, content_type: str, content: str, model: str) -> ContentGeneration:
+        """Store generated content for instructor review"""
+        content_generation = ContentGeneration(
+            prompt=f"Generate {content_type} for course {course_id}",
+            generated_content=content,
+            model_used=model,
+            content_type=content_type,
+            course_id=course_id,
+            is_approved=False
+        )
+        
+        self.db.add(content_generation)
+        self.db.commit()
+        return content_generation
     
     def _generate_with_rag(self, content_type: str, title: str, description: str, 
                           context: str, additional_instructions: str) -> Dict[str, Any]:
@@ -333,26 +415,22 @@ class SimpleRAGService:
             if not self.openai_client.api_key:
                 return self._generate_mock_content(content_type, title, description)
             
-            prompt = self._build_rag_prompt(content_type, title, description, context, additional_instructions)
-            
-            response = self.openai_client.chat.completions.create(
-                model=settings.ai_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert educational content creator specialising in construction industry training. Create high-quality, practical educational materials based on the provided context documents. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=settings.ai_max_tokens,
-                temperature=settings.ai_temperature
+            messages = self._generation_messages(content_type, title, description, context, additional_instructions)
+            
+            # Regenerating the same content is answered from the response cache
+            content = cached_completion(
+                messages, settings.ai_model, settings.ai_temperature, content_type,
+                lambda: self.openai_client.chat.completions.create(
+                    model=settings.ai_model,
+                    messages=messages,
+                    max_tokens=settings.ai_max_tokens,
+                    temperature=settings.ai_temperature
+                ).choices[0].message.content,
+                params={"max_tokens": settings.ai_max_tokens}, namespace="simple_rag.with_context"
             )
             
             return {
-                "content": response.choices[0].message.content,
+                "content": content,
                 "model": settings.ai_model
             }
             
@@ -367,26 +445,22 @@ class SimpleRAGService:
             if not self.openai_client.api_key:
                 return self._generate_mock_content(content_type, title, description)
             
-            prompt = self._build_basic_prompt(content_type, title, description, additional_instructions)
-            
-            response = self.openai_client.chat.completions.create(
-                model=settings.ai_model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert educational content creator specialising in construction industry training. Create high-quality, practical educational materials. Use UK English spelling and terminology throughout. Ensure all content follows British construction standards and regulations."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=settings.ai_max_tokens,
-                temperature=settings.ai_temperature
+            messages = self._generation_messages(content_type, title, description, "", additional_instructions)
+            
+            # Regenerating the same content is answered from the response cache
+            content = cached_completion(
+                messages, settings.ai_model, settings.ai_temperature, content_type,
+                lambda: self.openai_client.chat.completions.create(
+                    model=settings.ai_model,
+                    messages=messages,
+                    max_tokens=settings.ai_max_tokens,
+                    temperature=settings.ai_temperature
+                ).choices[0].message.content,
+                params={"max_tokens": settings.ai_max_tokens}, namespace="simple_rag.without_context"
             )
             
             return {
-                "content": response.choices[0].message.content,
+                "content": content,
                 "model": settings.ai_model
             }
             
@@ -623,10 +697,10 @@ By the end of this lesson, students will be able to:
             if not documents:
                 return []
             
-            # Search for relevant chunks
-            relevant_chunks = self.embedder.search_similar_content(query, top_k)
+            # Search only this course's shard
+            relevant_chunks = self.embedder.search_similar_content(query, top_k, course_id=course_id)
             
-            # Filter results to only include chunks from this course
+            # Drop chunks of documents deactivated since they were embedded
             course_document_ids = {f"doc_{doc['id']}" for doc in documents}
             filtered_results = [
                 chunk for chunk in relevant_chunks
@@ -0,0 +1,134 @@
+"""
+Extracted Text Cache
+Keeps the per-page text of uploaded PDFs in a JSONL file next to the upload
+(``<upload>.pages.jsonl``) so every consumer parses a file at most once.
+The first line records the SHA-256 of the file contents the pages came from;
+the cache is rebuilt whenever the upload no longer matches it.
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .pdf_extraction import iter_pdf_pages
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = ".pages.jsonl"
+
+_HEADING = re.compile(r"^(?:\d+(?:\.\d+)*\.?\s+\S.*|[A-Z][A-Z0-9 ,&()'/-]{3,})$")
+
+
+def cache_path(file_path: str) -> Path:
+    """Location of the text cache for an upload"""
+    path = Path(file_path)
+    return path.with_name(path.name + CACHE_SUFFIX)
+
+
+def file_hash(file_path: str) -> str:
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _headings(text: str) -> List[str]:
+    """Short numbered or upper-case lines, which are section titles in the workbooks"""
+    headings = []
+    for line in text.splitlines():
+        line = line.strip()
+        if 3 < len(line) <= 80 and _HEADING.match(line):
+            headings.append(line)
+    return headings
+
+
+def _read_header(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(header, dict) or header.get("version") != CACHE_VERSION:
+        return None
+    return header
+
+
+def _write(path: Path, header: Dict[str, Any], records) -> Iterator[Dict[str, Any]]:
+    """Write header and records to a temporary file, then move it into place.
+
+    Yields each record once written, so a cache can be filled while its
+    pages are being consumed. Nothing is published if iteration stops early.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    complete = False
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                yield record
+        os.replace(tmp_path, path)
+        complete = True
+    finally:
+        if not complete:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+def _read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        f.readline()
+        for line in f:
+            yield json.loads(line)
+
+
+def iter_page_records(file_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield {page, text, words, headings} per page, from the cache when current"""
+    path = Path(file_path)
+    stat = path.stat()
+    cached = cache_path(file_path)
+    header = _read_header(cached)
+
+    # An unchanged size and mtime are trusted without reading the upload
+    if header is not None and header.get("size") == stat.st_size \
+            and header.get("mtime_ns") == stat.st_mtime_ns:
+        yield from _read_records(cached)
+        return
+
+    digest = file_hash(file_path)
+    if header is not None and header.get("sha256") == digest:
+        # Same contents under a new mtime (re-uploaded or touched): refresh the recorded stat
+        header.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        yield from _write(cached, header, _read_records(cached))
+        return
+
+    header = {
+        "version": CACHE_VERSION,
+        "sha256": digest,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    records = (
+        {"page": page, "text": text, "words": len(text.split()), "headings": _headings(text)}
+        for page, text in iter_pdf_pages(file_path)
+    )
+    yield from _write(cached, header, records)
+
+
+def iter_cached_pages(file_path: str) -> Iterator[Tuple[int, str]]:
+    """Drop-in replacement for iter_pdf_pages that parses each file once"""
+    for record in iter_page_records(file_path):
+        yield record["page"], record["text"]
+
+
+def cached_pdf_text(file_path: str) -> str:
+    """Full document text with one line break between pages"""
+    return "".join(text + "\n" for _, text in iter_cached_pages(file_path))
+
@@ -0,0 +1,945 @@
+"""
+Vector Store for RAG Services
+FAISS index with stable int64 chunk ids and a memory-mapped chunk store,
+sharded per course with an optional platform-wide global shard
+"""
+
+import os
+import json
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import faiss
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines: in-process locking only
+    fcntl = None
+
+from ..core.config import settings
+
+
+GLOBAL_SHARD = "global"
+
+# One fixed-size record per chunk id: where its text lives in the blob
+RECORD_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("document", "<i4"),
+    ("chunk_index", "<u4"),
+])
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write a file via write-then-rename so readers never see a partial file"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ChunkTable:
+    """Append-only, memory-mapped side table mapping FAISS ids to chunks.
+
+    Chunk ids double as row numbers in ``chunks.idx`` (fixed-size offset
+    records), so id -> chunk lookup is a direct index and chunk text is read
+    lazily from ``chunks.bin``. ``chunks.vec`` keeps each chunk's float32
+    embedding as given, so indexes can be rebuilt and documents copied
+    without reading vectors back out of a (possibly lossy) index.
+    ``chunks.json`` holds the per-document table and the committed row/blob
+    sizes; it is replaced atomically on every save, so bytes appended by a
+    save that never committed are ignored and truncated by the next one.
+    Opening costs one small manifest read no matter how many chunks are
+    stored.
+    """
+
+    MANIFEST_FILE = "chunks.json"
+    RECORDS_FILE = "chunks.idx"
+    TEXT_FILE = "chunks.bin"
+    VECTORS_FILE = "chunks.vec"
+
+    def __init__(self, path: Path, dimension: int):
+        self.path = Path(path)
+        self.dimension = dimension
+
+        # Document table, indexed by document slot. Re-embedding a document
+        # gives it a new slot; deleted slots stay as inactive entries.
+        self.documents: List[Dict[str, Any]] = []
+        self.document_slots: Dict[str, int] = {}
+
+        # Committed rows, mapped from disk
+        self._records = np.empty(0, dtype=RECORD_DTYPE)
+        self._text = b""
+        self._vectors = np.empty((0, dimension), dtype='float32')
+        self._committed = 0
+        self._blob_size = 0
+        self.generation = 0
+        # Stores written before chunk vectors were kept have none until backfilled
+        self.has_vectors = True
+
+        # Rows added since the last save
+        self._pending_documents = array('i')
+        self._pending_indexes = array('I')
+        self._pending_texts: List[str] = []
+        self._pending_vectors: List[np.ndarray] = []
+
+        self._open()
+
+    @classmethod
+    def exists(cls, path: Path) -> bool:
+        return (Path(path) / cls.MANIFEST_FILE).exists()
+
+    def _open(self):
+        """Read the manifest and map the committed rows"""
+        manifest_path = self.path / self.MANIFEST_FILE
+        if not manifest_path.exists():
+            return
+
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        self.documents = manifest["documents"]
+        self.document_slots = {
+            document["document_id"]: slot
+            for slot, document in enumerate(self.documents)
+            if document["active"]
+        }
+        self._committed = manifest["chunk_count"]
+        self._blob_size = manifest["blob_size"]
+        self.generation = manifest.get("generation", 0)
+        self.has_vectors = manifest["version"] >= 4
+        self._map_files()
+
+    def _map_files(self):
+        if self._committed:
+            self._records = np.memmap(
+                self.path / self.RECORDS_FILE, dtype=RECORD_DTYPE, mode='r', shape=(self._committed,)
+            )
+        else:
+            self._records = np.empty(0, dtype=RECORD_DTYPE)
+
+        if self._committed and self.has_vectors:
+            self._vectors = np.memmap(
+                self.path / self.VECTORS_FILE, dtype='float32', mode='r', shape=(self._committed, self.dimension)
+            )
+        else:
+            self._vectors = np.empty((0, self.dimension), dtype='float32')
+
+        if self._blob_size:
+            with open(self.path / self.TEXT_FILE, 'rb') as f:
+                self._text = mmap.mmap(f.fileno(), self._blob_size, access=mmap.ACCESS_READ)
+        else:
+            self._text = b""
+
+    def close(self):
+        """Release the memory maps"""
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._text = b""
+        self._records = np.empty(0, dtype=RECORD_DTYPE)
+        self._vectors = np.empty((0, self.dimension), dtype='float32')
+
+    def __len__(self) -> int:
+        return self._committed + len(self._pending_texts)
+
+    def add_document(self, document_id: str, metadata: Dict[str, Any], chunk_count: int,
+                     active: bool = True) -> int:
+        """Register a new version of a document and return its slot"""
+        slot = len(self.documents)
+        self.documents.append({
+            "document_id": document_id,
+            "metadata": metadata,
+            "chunk_count": chunk_count,
+            "created_at": datetime.now().isoformat(),
+            "active": active
+        })
+        if active:
+            self.document_slots[document_id] = slot
+        return slot
+
+    def append_chunks(self, slot: int, chunks: List[str], vectors: np.ndarray) -> np.ndarray:
+        """Append chunk rows and their vectors for a document and return their ids"""
+        first_id = len(self)
+        self._pending_documents.extend([slot] * len(chunks))
+        self._pending_indexes.extend(range(len(chunks)))
+        self._pending_texts.extend(chunks)
+        self._pending_vectors.append(np.asarray(vectors, dtype='float32').reshape(len(chunks), self.dimension))
+        return np.arange(first_id, first_id + len(chunks), dtype='int64')
+
+    def append_row(self, slot: int, chunk_index: int, text: str, vector: np.ndarray) -> int:
+        """Append a single chunk row and return its id"""
+        chunk_id = len(self)
+        self._pending_documents.append(slot)
+        self._pending_indexes.append(chunk_index)
+        self._pending_texts.append(text)
+        self._pending_vectors.append(np.asarray(vector, dtype='float32').reshape(1, self.dimension))
+        return chunk_id
+
+    def vectors(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """Stored vectors of the given chunk ids, in order"""
+        if not self.has_vectors:
+            raise ValueError(f"{self.path} has no chunk vectors yet; open it in a transaction to backfill them")
+        chunk_ids = np.asarray(chunk_ids, dtype='int64')
+        committed = chunk_ids < self._committed
+        result = np.empty((len(chunk_ids), self.dimension), dtype='float32')
+        result[committed] = self._vectors[chunk_ids[committed]]
+        if not committed.all():
+            pending = np.concatenate(self._pending_vectors)
+            result[~committed] = pending[chunk_ids[~committed] - self._committed]
+        return result
+
+    def backfill_vectors(self, vectors: np.ndarray):
+        """Store vectors for every committed row of a table that has none; committed by the next save"""
+        if self._pending_texts:
+            raise ValueError("Backfill chunk vectors before appending rows")
+        _atomic_write(self.path / self.VECTORS_FILE,
+                      np.ascontiguousarray(vectors[:self._committed], dtype='float32').tobytes())
+        self.has_vectors = True
+        self._map_files()
+
+    def document_chunk_ids(self, document_id: str) -> np.ndarray:
+        """Return the ids of every live chunk belonging to a document"""
+        slot = self.document_slots.get(document_id)
+        if slot is None:
+            return np.empty(0, dtype='int64')
+
+        committed = np.flatnonzero(self._records["document"] == slot)
+        pending = np.flatnonzero(np.frombuffer(self._pending_documents, dtype='int32') == slot) + self._committed
+        return np.concatenate([committed, pending]).astype('int64')
+
+    def live_mask(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """Boolean mask of which chunk ids belong to active documents"""
+        documents = np.concatenate([
+            np.asarray(self._records["document"], dtype='int32'),
+            np.frombuffer(self._pending_documents, dtype='int32')
+        ])
+        active = np.array([document["active"] for document in self.documents] + [False], dtype=bool)
+        # Slot -1 (never written) maps onto the trailing False
+        return active[documents[chunk_ids]]
+
+    def delete_document(self, document_id: str):
+        """Mark a document's current slot inactive so its chunk ids never resolve"""
+        slot = self.document_slots.pop(document_id, None)
+        if slot is not None:
+            self.documents[slot]["active"] = False
+
+    def get(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        """O(1) lookup of a chunk record by id"""
+        if chunk_id < 0 or chunk_id >= len(self):
+            return None
+
+        if chunk_id < self._committed:
+            record = self._records[chunk_id]
+            slot = int(record["document"])
+            chunk_index = int(record["chunk_index"])
+            content = None
+        else:
+            pending_row = chunk_id - self._committed
+            slot = self._pending_documents[pending_row]
+            chunk_index = self._pending_indexes[pending_row]
+            content = self._pending_texts[pending_row]
+
+        document = self.documents[slot]
+        if not document["active"]:
+            return None
+
+        if content is None:
+            offset = int(record["offset"])
+            content = bytes(self._text[offset:offset + int(record["length"])]).decode('utf-8')
+
+        return {
+            "document_id": document["document_id"],
+            "chunk_index": chunk_index,
+            "content": content,
+            "metadata": document["metadata"],
+            "created_at": document["created_at"]
+        }
+
+    def live_count(self) -> int:
+        """Number of chunks belonging to active documents"""
+        return sum(document["chunk_count"] for document in self.documents if document["active"])
+
+    def save(self):
+        """Append pending rows, then commit them by replacing the manifest"""
+        record_size = RECORD_DTYPE.itemsize
+        if self._pending_texts:
+            encoded = [text.encode('utf-8') for text in self._pending_texts]
+            lengths = np.fromiter((len(blob) for blob in encoded), dtype='<u4', count=len(encoded))
+
+            records = np.empty(len(encoded), dtype=RECORD_DTYPE)
+            records["length"] = lengths
+            records["offset"] = self._blob_size + np.concatenate([[0], np.cumsum(lengths[:-1], dtype='<u8')])
+            records["document"] = np.frombuffer(self._pending_documents, dtype='int32')
+            records["chunk_index"] = np.frombuffer(self._pending_indexes, dtype='uint32')
+
+            # Drop anything a crashed save left past the committed end, then append
+            with open(self.path / self.TEXT_FILE, 'ab') as f:
+                f.truncate(self._blob_size)
+                f.write(b"".join(encoded))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.path / self.RECORDS_FILE, 'ab') as f:
+                f.truncate(self._committed * record_size)
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.path / self.VECTORS_FILE, 'ab') as f:
+                f.truncate(self._committed * self.dimension * 4)
+                f.write(np.concatenate(self._pending_vectors).astype('float32').tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._blob_size += int(lengths.sum())
+            self._committed += len(encoded)
+
+        self.generation += 1
+        manifest = {
+            "version": 4 if self.has_vectors else 3,
+            "generation": self.generation,
+            "chunk_count": self._committed,
+            "blob_size": self._blob_size,
+            "documents": self.documents
+        }
+        _atomic_write(self.path / self.MANIFEST_FILE, json.dumps(manifest).encode('utf-8'))
+
+        self._pending_documents = array('i')
+        self._pending_indexes = array('I')
+        self._pending_texts = []
+        self._pending_vectors = []
+        self.close()
+        self._map_files()
+
+
+INDEX_FLAT = "flat"
+INDEX_HNSW = "hnsw"
+INDEX_IVFPQ = "ivfpq"
+
+
+def configured_index_type() -> str:
+    """Index type shards are promoted to; "faiss" is the original name for flat"""
+    kind = settings.vector_index_type.lower()
+    return INDEX_FLAT if kind == "faiss" else kind
+
+
+def index_kind(index) -> str:
+    """Type of the index inside an ID map"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return INDEX_HNSW
+    if isinstance(inner, faiss.IndexIVF):
+        return INDEX_IVFPQ
+    return INDEX_FLAT
+
+
+def supports_remove(index) -> bool:
+    """HNSW graphs cannot delete vectors; their dead ids are filtered at lookup"""
+    return index_kind(index) != INDEX_HNSW
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest divisor of the dimension not above the configured PQ size"""
+    m = min(settings.vector_pq_m, dimension)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def build_index(kind: str, vectors: np.ndarray, ids: np.ndarray, dimension: int):
+    """Build an ID-mapped index of the given type over existing vectors (may be slow)"""
+    if kind == INDEX_HNSW:
+        inner = faiss.IndexHNSWFlat(dimension, settings.vector_hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    elif kind == INDEX_IVFPQ:
+        nlist = max(1, min(int(4 * np.sqrt(len(vectors))), len(vectors) // 39))
+        quantizer = faiss.IndexFlatIP(dimension)
+        inner = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), 8,
+                                 faiss.METRIC_INNER_PRODUCT)
+        # Train on a bounded sample; coarse centroids and PQ codebooks need far fewer points
+        sample = vectors
+        if len(vectors) > 256 * nlist:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), 256 * nlist, replace=False)]
+        inner.train(sample)
+    else:
+        inner = faiss.IndexFlatIP(dimension)
+
+    index = faiss.IndexIDMap2(inner)
+    if len(vectors):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), ids)
+    tune_index(index)
+    return index
+
+
+def tune_index(index):
+    """Apply query-time search parameters, which are not persisted with the index"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = settings.vector_hnsw_ef_search
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = settings.vector_ivf_nprobe
+
+
+class ReadWriteLock:
+    """Allows many concurrent readers or a single writer.
+
+    Waiting writers block new readers so ingestion is not starved by a
+    steady stream of searches.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writer or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+
+class VectorStore:
+    """ID-mapped FAISS index plus chunk table, persisted under one directory.
+
+    Use ``get_vector_store`` rather than constructing this directly so each
+    worker process shares one loaded copy. Searches take the read lock and
+    run in parallel; changes go through ``transaction()``, which serialises
+    writers across threads and (via ``flock`` on ``.lock``) across worker
+    processes. Each commit bumps the manifest generation and other workers
+    reload on their next search.
+    """
+
+    INDEX_FILE = "faiss_index.bin"
+    LEGACY_METADATA_FILE = "metadata.json"
+    LOCK_FILE = ".lock"
+
+    def __init__(self, path: str, dimension: int):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dimension = dimension
+        self.index = None
+        self.chunks = None
+        self.lock = ReadWriteLock()
+        self._signature = None
+        self._dirty = False
+        self._rebuilding = False
+        with self._file_lock():
+            self._load()
+            if self._backfill_vectors():
+                self._save()
+
+    @property
+    def generation(self) -> int:
+        return self.chunks.generation
+
+    def _manifest_signature(self):
+        """Cheap fingerprint of the committed manifest (changes on every rename)"""
+        try:
+            stat = os.stat(self.path / ChunkTable.MANIFEST_FILE)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared by every worker process using this directory"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path / self.LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _load(self):
+        """Load existing vector store if available"""
+        if self.chunks is not None:
+            self.chunks.close()
+
+        index_path = self.path / self.INDEX_FILE
+        try:
+            if not ChunkTable.exists(self.path) and (self.path / self.LEGACY_METADATA_FILE).exists():
+                migrate_json_metadata(self.path, self.dimension)
+
+            self._signature = self._manifest_signature()
+            self.chunks = ChunkTable(self.path, self.dimension)
+            if index_path.exists():
+                self.index = faiss.read_index(str(index_path))
+                self._drop_uncommitted()
+                tune_index(self.index)
+            else:
+                self.index = self._new_index()
+        except Exception as e:
+            print(f"Error loading vector store: {e}")
+            self._reset()
+
+    def _drop_uncommitted(self):
+        """Remove vectors whose chunk rows were never committed.
+
+        The index is saved before the manifest, so a crash between the two
+        leaves ids at or past the committed row count in the index. The next
+        append hands those ids out again, so they must go before they can
+        resolve to someone else's chunks.
+        """
+        committed = len(self.chunks)
+        ids = faiss.vector_to_array(self.index.id_map)
+        if not len(ids) or ids.max() < committed:
+            return
+        print(f"Dropping {int((ids >= committed).sum())} uncommitted vectors from {self.path}")
+        if supports_remove(self.index):
+            self.index.remove_ids(faiss.IDSelectorRange(committed, int(ids.max()) + 1))
+        else:
+            keep = ids < committed
+            vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+            self.index = build_index(index_kind(self.index), vectors[keep], ids[keep].astype('int64'), self.dimension)
+
+    def _backfill_vectors(self) -> bool:
+        """Give a store written before chunk vectors were kept a copy of them.
+
+        The vectors are read back out of the index once (approximately for
+        IVF-PQ, whose codes are lossy); rows whose vectors were already
+        removed get zeros, as they never resolve again. Returns whether
+        anything needs saving; call with the file lock held.
+        """
+        if self.chunks.has_vectors:
+            return False
+        vectors = np.zeros((len(self.chunks), self.dimension), dtype='float32')
+        if self.index.ntotal:
+            inner = faiss.downcast_index(self.index.index)
+            if isinstance(inner, faiss.IndexIVF):
+                inner.make_direct_map()
+            ids = faiss.vector_to_array(self.index.id_map)
+            vectors[ids] = inner.reconstruct_n(0, self.index.ntotal)
+        self.chunks.backfill_vectors(vectors)
+        return True
+
+    def _new_index(self):
+        """Create a new ID-mapped FAISS index"""
+        # Inner product for cosine similarity; IDMap2 keeps ids stable across removals
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+
+    def _reset(self):
+        """Start an empty store, discarding unreadable files"""
+        for name in (ChunkTable.MANIFEST_FILE, ChunkTable.RECORDS_FILE, ChunkTable.TEXT_FILE, ChunkTable.VECTORS_FILE):
+            (self.path / name).unlink(missing_ok=True)
+        self._signature = None
+        self.chunks = ChunkTable(self.path, self.dimension)
+        self.index = self._new_index()
+
+    def refresh(self):
+        """Reload if another worker has committed a newer generation"""
+        if self._manifest_signature() == self._signature:
+            return
+        with self.lock.write():
+            if self._manifest_signature() != self._signature:
+                self._load()
+
+    @contextmanager
+    def transaction(self):
+        """Apply a batch of changes under the write locks and commit it once.
+
+        The store is brought up to date with other workers first. If the
+        block raises, uncommitted changes are discarded by reloading.
+        """
+        with self.lock.write(), self._file_lock():
+            if self._manifest_signature() != self._signature:
+                self._load()
+            self._dirty = self._backfill_vectors()
+            try:
+                yield self
+            except Exception:
+                self._load()
+                raise
+            if self._dirty:
+                self._save()
+        self._schedule_rebuild()
+
+    def _rebuild_target(self) -> Optional[str]:
+        """Index type this shard should be rebuilt as, if any"""
+        kind = index_kind(self.index)
+        target = configured_index_type()
+        if kind == INDEX_FLAT:
+            if target != INDEX_FLAT and self.index.ntotal >= settings.vector_promote_threshold:
+                return target
+        elif not supports_remove(self.index):
+            # Compact once dead vectors make up a large share of the graph
+            live = self.chunks.live_count()
+            if self.index.ntotal and (self.index.ntotal - live) / self.index.ntotal > 0.2:
+                return kind
+        return None
+
+    def _schedule_rebuild(self):
+        """Start a background promotion/compaction if the shard needs one"""
+        target = self._rebuild_target()
+        if target is None or self._rebuilding:
+            return
+        self._rebuilding = True
+        threading.Thread(target=self._rebuild, args=(target,), daemon=True,
+                         name=f"vector-index-{self.path.name}").start()
+
+    def _snapshot(self):
+        """Ids and stored vectors of every live chunk in the current index"""
+        ids = faiss.vector_to_array(self.index.id_map).astype('int64')
+        ids = ids[self.chunks.live_mask(ids)]
+        return ids, self.chunks.vectors(ids)
+
+    def _rebuild(self, kind: str):
+        """Train a new index from the existing vectors and swap it in.
+
+        Training runs without locks so searches and ingestion continue.
+        Changes committed meanwhile are replayed onto the new index before
+        it replaces the old one under the write locks.
+        """
+        try:
+            with self.lock.read():
+                ids, vectors = self._snapshot()
+            print(f"Building {kind} index for {self.path} ({len(ids)} vectors)")
+            index = build_index(kind, vectors, ids, self.dimension)
+
+            with self.transaction():
+                # The index object changes on every reload, so ask again whether
+                # this rebuild is still wanted (another worker may have done it)
+                if self._rebuild_target() != kind:
+                    return
+                current_ids, current_vectors = self._snapshot()
+                added = ~np.isin(current_ids, ids)
+                if added.any():
+                    index.add_with_ids(current_vectors[added], current_ids[added])
+                removed = ids[~np.isin(ids, current_ids)]
+                if len(removed) and supports_remove(index):
+                    index.remove_ids(removed)
+                self.index = index
+                self._dirty = True
+        except Exception as e:
+            print(f"Error rebuilding vector index: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _save(self):
+        """Save vector store to disk"""
+        # Index first; if the manifest write never lands, _load drops the extra ids
+        index_path = self.path / self.INDEX_FILE
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        faiss.write_index(self.index, str(tmp_path))
+        os.replace(tmp_path, index_path)
+        self.chunks.save()
+        self._signature = self._manifest_signature()
+
+    def add_document(self, document_id: str, metadata: Dict[str, Any],
+                     chunks: List[str], embeddings: np.ndarray) -> int:
+        """Add (or replace) a document's chunks inside ``transaction()``.
+
+        Embeddings must be L2-normalized float32.
+        """
+        self.remove_document(document_id)
+        if not chunks:
+            return 0
+
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        slot = self.chunks.add_document(document_id, metadata, len(chunks))
+        ids = self.chunks.append_chunks(slot, chunks, embeddings)
+        self.index.add_with_ids(embeddings, ids)
+        self._dirty = True
+        return len(ids)
+
+    def remove_document(self, document_id: str) -> int:
+        """Delete a document's vectors and chunks inside ``transaction()``; returns chunks removed"""
+        ids = self.chunks.document_chunk_ids(document_id)
+        if len(ids) == 0:
+            return 0
+
+        if supports_remove(self.index):
+            self.index.remove_ids(ids)
+        self.chunks.delete_document(document_id)
+        self._dirty = True
+        return len(ids)
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size of the loaded index (vectors plus ids)"""
+        kind = index_kind(self.index)
+        if kind == INDEX_IVFPQ:
+            per_vector = _pq_subquantizers(self.dimension) + 16
+        elif kind == INDEX_HNSW:
+            per_vector = self.dimension * 4 + settings.vector_hnsw_m * 2 * 4 + 8
+        else:
+            per_vector = self.dimension * 4 + 8
+        return self.index.ntotal * per_vector
+
+    def export_document(self, document_id: str):
+        """Return a live document's chunk texts and stored vectors"""
+        ids = self.chunks.document_chunk_ids(document_id)
+        chunks = [self.chunks.get(int(chunk_id))["content"] for chunk_id in ids]
+        return chunks, self.chunks.vectors(ids)
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Return the top_k chunk records closest to a normalized query vector"""
+        self.refresh()
+        with self.lock.read():
+            if self.index.ntotal == 0:
+                return []
+
+            # Over-fetch when deleted vectors are still in the graph, as they are skipped below
+            fetch = top_k if supports_remove(self.index) else min(self.index.ntotal, top_k * 2)
+            scores, ids = self.index.search(query_embedding.reshape(1, -1).astype('float32'), fetch)
+
+            results = []
+            for score, chunk_id in zip(scores[0], ids[0]):
+                if len(results) == top_k:
+                    break
+                chunk_data = self.chunks.get(int(chunk_id))
+                if chunk_data is None:
+                    continue
+                results.append({
+                    "score": float(score),
+                    "content": chunk_data["content"],
+                    "document_id": chunk_data["document_id"],
+                    "chunk_index": chunk_data["chunk_index"],
+                    "metadata": chunk_data["metadata"]
+                })
+            return results
+
+
+class ShardCache:
+    """Process-wide LRU of loaded stores, bounded by an approximate memory budget.
+
+    Evicted stores are simply dropped from the cache; anything still
+    holding a reference keeps working and the next lookup reloads from disk.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._stores: "OrderedDict[Path, VectorStore]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, dimension: int) -> VectorStore:
+        key = Path(path).resolve()
+        with self._lock:
+            store = self._stores.get(key)
+            if store is not None:
+                self._stores.move_to_end(key)
+                return store
+
+        # Load outside the cache lock so one cold shard doesn't stall the rest
+        loaded = VectorStore(key, dimension)
+        with self._lock:
+            store = self._stores.setdefault(key, loaded)
+            self._stores.move_to_end(key)
+            self._evict(keep=key)
+            return store
+
+    def _evict(self, keep: Path):
+        """Drop least recently used stores until the cache fits the budget"""
+        total = sum(store.memory_bytes() for store in self._stores.values())
+        for key in list(self._stores):
+            if total <= self.budget_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._stores.pop(key).memory_bytes()
+
+    def loaded(self) -> Dict[str, int]:
+        """Loaded store paths and their approximate sizes, oldest first"""
+        with self._lock:
+            return {str(key): store.memory_bytes() for key, store in self._stores.items()}
+
+
+_shard_cache = ShardCache(settings.vector_shard_memory_mb * 1024 * 1024)
+
+
+def get_vector_store(path: str, dimension: int) -> VectorStore:
+    """Return this process's shared store for a directory, loading it on first use"""
+    return _shard_cache.get(Path(path), dimension)
+
+
+def course_shard(course_id: Any) -> str:
+    return f"course_{course_id}"
+
+
+def shard_path(shard: str) -> Path:
+    """Directory for a shard; the global shard lives at the vector store root"""
+    root = Path(settings.vector_store_path)
+    if shard == GLOBAL_SHARD:
+        return root
+    return root / "shards" / shard
+
+
+def shard_exists(shard: str) -> bool:
+    """Whether anything has been indexed in a shard (including a not yet migrated store)"""
+    path = shard_path(shard)
+    return ChunkTable.exists(path) or (path / VectorStore.LEGACY_METADATA_FILE).exists()
+
+
+def get_shard(shard: str, dimension: int) -> VectorStore:
+    """Return a shard's store, loading it on demand"""
+    return get_vector_store(shard_path(shard), dimension)
+
+
+def document_shards(metadata: Dict[str, Any]) -> List[str]:
+    """Shards a document is indexed in: its course, plus the global shard if enabled"""
+    shards = []
+    if metadata.get("course_id") is not None:
+        shards.append(course_shard(metadata["course_id"]))
+    if settings.vector_global_shard or not shards:
+        shards.append(GLOBAL_SHARD)
+    return shards
+
+
+def index_documents(documents: List[Tuple[str, Dict[str, Any], List[str], np.ndarray]], dimension: int):
+    """Write (document_id, metadata, chunks, embeddings) into each document's shards.
+
+    Each shard touched by the batch is committed once.
+    """
+    by_shard: Dict[str, list] = {}
+    for document in documents:
+        for shard in document_shards(document[1]):
+            by_shard.setdefault(shard, []).append(document)
+
+    for shard, shard_documents in by_shard.items():
+        with get_shard(shard, dimension).transaction() as store:
+            for document_id, metadata, chunks, embeddings in shard_documents:
+                store.add_document(document_id, metadata, chunks, embeddings)
+
+
+def remove_from_shards(document_id: str, course_id: Optional[int], dimension: int) -> int:
+    """Remove a document from its course shard and the global shard; returns chunks removed"""
+    shards = [GLOBAL_SHARD] if course_id is None else [course_shard(course_id), GLOBAL_SHARD]
+    removed = 0
+    for shard in shards:
+        if not shard_exists(shard):
+            continue
+        with get_shard(shard, dimension).transaction() as store:
+            removed = max(removed, store.remove_document(document_id))
+    return removed
+
+
+def search_shard(shard: str, query_embedding: np.ndarray, top_k: int, dimension: int) -> List[Dict[str, Any]]:
+    """Search one shard, without creating it if nothing has been indexed there"""
+    if not shard_exists(shard):
+        return []
+    return get_shard(shard, dimension).search(query_embedding, top_k)
+
+
+def build_course_shards(dimension: int) -> Dict[str, int]:
+    """Copy every active document in the global shard into its course shard.
+
+    Used once to split a store that predates per-course shards. Vectors are
+    copied from the global shard's chunk table so nothing is re-embedded.
+    Returns chunks copied per shard.
+    """
+    source = get_shard(GLOBAL_SHARD, dimension)
+    source.refresh()
+    copied: Dict[str, int] = {}
+    with source.lock.read():
+        exports = [
+            (document, source.export_document(document["document_id"]))
+            for document in source.chunks.documents
+            if document["active"] and document["metadata"].get("course_id") is not None
+        ]
+
+    for document, (chunks, vectors) in exports:
+        shard = course_shard(document["metadata"]["course_id"])
+        with get_shard(shard, dimension).transaction() as store:
+            store.add_document(document["document_id"], document["metadata"], chunks, vectors)
+        copied[shard] = copied.get(shard, 0) + len(chunks)
+    return copied
+
+
+def migrate_json_metadata(path: str, dimension: int) -> int:
+    """Convert a vector store's metadata.json into the memory-mapped chunk store.
+
+    Handles the original ``{"<doc>_chunk_<i>": {...}}`` layout (positional
+    flat index, re-keyed by position) and the columnar layout written by
+    the first id-mapped store. The JSON file is kept as ``metadata.json.bak``.
+    Returns the number of chunks migrated.
+    """
+    path = Path(path)
+    metadata_path = path / VectorStore.LEGACY_METADATA_FILE
+    index_path = path / VectorStore.INDEX_FILE
+
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+
+    if metadata.get("version") == 2:
+        columns = metadata["chunks"]
+        documents = metadata["documents"]
+        rows = [
+            (documents["document_id"][slot], documents["metadata"][slot], chunk_index, content)
+            for slot, chunk_index, content in zip(columns["document"], columns["chunk_index"], columns["content"])
+        ]
+    else:
+        rows = [
+            (record["document_id"], record.get("metadata", {}), record.get("chunk_index", 0), record.get("content", ""))
+            for record in metadata.values()
+        ]
+
+    # Both layouts used flat indexes, so stored vectors are exact; deleted rows get zeros
+    vectors = np.zeros((len(rows), dimension), dtype='float32')
+    index = faiss.read_index(str(index_path)) if index_path.exists() else None
+    if index is not None and not isinstance(index, faiss.IndexIDMap2):
+        if index.ntotal != len(rows):
+            raise ValueError(f"Vector store mismatch: {index.ntotal} vectors, {len(rows)} chunks")
+        # Positional flat index: wrap it in an id map keyed by chunk position
+        if index.ntotal:
+            vectors = index.reconstruct_n(0, index.ntotal)
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+    elif index is not None and index.ntotal:
+        vectors[faiss.vector_to_array(index.id_map)] = index.index.reconstruct_n(0, index.ntotal)
+
+    # Rows keep their positions as chunk ids
+    table = ChunkTable(path, dimension)
+    deleted_slot = None
+    for document_id, document_metadata, chunk_index, content in rows:
+        if content is None:
+            # Deleted row: keep its id reserved under an inactive slot
+            if deleted_slot is None:
+                deleted_slot = table.add_document(None, {}, 0, active=False)
+            slot = deleted_slot
+            content = ""
+        else:
+            slot = table.document_slots.get(document_id)
+            if slot is None:
+                slot = table.add_document(document_id, document_metadata, 0)
+        table.documents[slot]["chunk_count"] += 1
+        table.append_row(slot, chunk_index, content, vectors[len(table)])
+
+    if index is not None:
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, index_path)
+    table.save()
+    table.close()
+    os.replace(metadata_path, metadata_path.with_name(metadata_path.name + ".bak"))
+    return len(rows)
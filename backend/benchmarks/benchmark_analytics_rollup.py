@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Analytics Rollup Benchmark
+Seeds growing amounts of activity history and times the admin dashboard
+endpoints (overview, courses, timeseries) computing everything from the raw
+tables, then again after the rollup job has aggregated the history into
+daily rows. With rollups the latency should stay flat as history grows;
+the time of an incremental rollup (one new day) is reported too, and so
+are the database round trips each endpoint makes.
+
+Both runs must return the same figures; the script exits 1 if they differ.
+
+Usage:
+    python benchmarks/benchmark_analytics_rollup.py --history-days 90 365 1095 --period-days 30 365
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.api.analytics import get_course_analytics, get_platform_overview, get_timeseries_data
+from app.models.analytics import AnalyticsEvent
+from app.models.course import Course
+from app.models.learning import Assessment, AssessmentAttempt, Enrollment, LearningSession
+from app.models.messaging import Notification
+from app.models.user import User
+from app.services import analytics_rollup
+from app.services.analytics_rollup import run_rollup, utc_today
+
+COURSES = 20
+
+
+def seed(db, history_days: int, users_per_day: int = 5):
+    """Activity spread evenly over the history, a little of it today"""
+    now = datetime.utcnow()
+    first = now - timedelta(days=history_days)
+    at = lambda day: min(first + timedelta(days=day, seconds=random.randint(0, 86399)), now)
+    users = users_per_day * (history_days + 1)
+
+    db.execute(insert(User), [
+        {"email": f"user{i}@example.com", "hashed_password": "x", "role": "student",
+         "is_active": True, "created_at": at(i // users_per_day), "updated_at": at(i // users_per_day)}
+        for i in range(users)
+    ])
+    db.execute(insert(Course), [
+        {"title": f"Course {i}", "instructor_id": 1, "is_active": True, "status": "published", "created_at": first}
+        for i in range(COURSES)
+    ])
+    db.execute(insert(Assessment), [
+        {"course_id": i + 1, "title": f"Assessment {i}", "passing_score": 70, "total_questions": 10, "created_at": first}
+        for i in range(COURSES)
+    ])
+
+    enrollments, sessions, attempts, events, notifications = [], [], [], [], []
+    for day in range(history_days + 1):
+        for _ in range(users_per_day * 4):
+            created = at(day)
+            completed = random.random() < 0.3
+            enrollments.append({
+                "user_id": random.randint(1, users), "course_id": random.randint(1, COURSES),
+                "status": "completed" if completed else "active", "created_at": created,
+                "updated_at": created + timedelta(days=random.randint(0, 20)) if completed else None
+            })
+        for _ in range(users_per_day * 20):
+            sessions.append({"user_id": random.randint(1, users), "course_id": random.randint(1, COURSES),
+                             "duration_minutes": random.randint(5, 90), "started_at": at(day)})
+        for _ in range(users_per_day * 6):
+            score = random.randint(0, 100)
+            attempts.append({"user_id": random.randint(1, users), "assessment_id": random.randint(1, COURSES),
+                             "score": score, "total_score": 100, "percentage": score, "passed": score >= 70,
+                             "started_at": at(day)})
+        for _ in range(users_per_day * 10):
+            events.append({"user_id": random.randint(1, users), "event_category": "user",
+                           "event_type": random.choice(["login", "message_sent", "qa_post_created"]),
+                           "created_at": at(day)})
+        for _ in range(users_per_day * 4):
+            notifications.append({"user_id": random.randint(1, users), "title": "Note", "content": "c",
+                                  "notification_type": "system", "created_at": at(day)})
+    # Completions dated after now would be in the future
+    for row in enrollments:
+        if row["updated_at"] is not None and row["updated_at"] > now:
+            row["updated_at"] = now
+    for model, rows in ((Enrollment, enrollments), (LearningSession, sessions), (AssessmentAttempt, attempts),
+                        (AnalyticsEvent, events), (Notification, notifications)):
+        db.execute(insert(model), rows)
+    db.commit()
+
+
+# Dashboard calls as the admin frontend makes them
+ENDPOINTS = {
+    "overview": lambda db, admin, days: get_platform_overview(days=days, current_user=admin, db=db),
+    "courses": lambda db, admin, days: get_course_analytics(course_id=None, days=days, current_user=admin, db=db),
+    "timeseries": lambda db, admin, days: get_timeseries_data(metric="learning_hours", days=days,
+                                                              granularity="weekly", current_user=admin, db=db),
+}
+
+
+def timed(db, admin, period_days: int, repeat: int = 5):
+    """(results, median milliseconds, queries) per endpoint"""
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+    results, samples, queries = {}, {}, {}
+    for _ in range(repeat):
+        for name, call in ENDPOINTS.items():
+            statements.clear()
+            started = time.perf_counter()
+            results[name] = asyncio.run(call(db, admin, period_days))
+            samples.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+            queries[name] = len(statements)
+            db.expire_all()
+    event.remove(db.get_bind(), "before_cursor_execute", listener)
+    return results, {name: sorted(ms)[len(ms) // 2] for name, ms in samples.items()}, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history-days", type=int, nargs="+", default=[90, 365, 1095])
+    parser.add_argument("--period-days", type=int, nargs="+", default=[30, 365])
+    args = parser.parse_args()
+
+    random.seed(0)
+    admin = mock.Mock(role="admin", id=1)
+    failed = False
+    print(f"{'history':>8}{'period':>8}  {'endpoint':<12}{'raw ms':>9}{'rollup ms':>11}{'queries':>9}  result")
+    for history_days in args.history_days:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        seed(db, history_days)
+
+        raw = {period: timed(db, admin, period) for period in args.period_days}
+        started = time.perf_counter()
+        run_rollup(db)
+        full_rollup = time.perf_counter() - started
+
+        for period in args.period_days:
+            results, rolled_ms, queries = timed(db, admin, period)
+            raw_results, raw_ms, _ = raw[period]
+            for name in results:
+                result = "ok" if results[name] == raw_results[name] else "FAIL: results differ"
+                failed = failed or result != "ok"
+                print(f"{history_days:>8}{period:>8}  {name:<12}{raw_ms[name]:>9.1f}{rolled_ms[name]:>11.1f}"
+                      f"{queries[name]:>9}  {result}")
+
+        # The next scheduled run only has the new day to aggregate
+        with mock.patch.object(analytics_rollup, "utc_today", lambda: utc_today() + timedelta(days=1)):
+            started = time.perf_counter()
+            run_rollup(db)
+            incremental = time.perf_counter() - started
+        print(f"{history_days:>8}  full rollup {full_rollup * 1000:.0f} ms, incremental rollup {incremental * 1000:.0f} ms")
+        db.close()
+        engine.dispose()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+ANN Index Benchmark
+Measures build time, query latency and recall@k of the flat, HNSW and
+IVF-PQ indexes the vector store can promote shards to, on clustered
+synthetic vectors.
+
+Usage:
+    python benchmarks/benchmark_ann_index.py --sizes 50000 200000
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.vector_store import INDEX_FLAT, INDEX_HNSW, INDEX_IVFPQ, build_index
+
+
+def build_vectors(count: int, dimension: int, seed: int = 42):
+    """Unit vectors scattered around topic centroids, like chunk embeddings"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((max(1, count // 500), dimension)).astype('float32')
+    vectors = centroids[rng.integers(0, len(centroids), count)]
+    vectors += 0.5 * rng.standard_normal((count, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def measure(index, queries, truth, top_k):
+    """Per-query latency (ms) and recall@k against exact results"""
+    started = time.perf_counter()
+    for query in queries:
+        _, ids = index.search(query.reshape(1, -1), top_k)
+    latency = (time.perf_counter() - started) * 1000 / len(queries)
+    _, ids = index.search(queries, top_k)
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(ids, truth))
+    return latency, hits / truth.size
+
+
+def report(label, build_seconds, latency, recall):
+    print(f"  {label:<24} build {build_seconds:8.2f}s  {latency:8.3f} ms/query  recall {recall:.3f}")
+
+
+def run(count: int, dimension: int, queries: int, top_k: int):
+    vectors = build_vectors(count + queries, dimension)
+    corpus, query_vectors = vectors[:count], vectors[count:]
+    ids = np.arange(count, dtype='int64')
+    print(f"📐 {count} vectors, dim={dimension}")
+
+    started = time.perf_counter()
+    flat = build_index(INDEX_FLAT, corpus, ids, dimension)
+    flat_build = time.perf_counter() - started
+    _, truth = flat.search(query_vectors, top_k)
+    latency, recall = measure(flat, query_vectors, truth, top_k)
+    report("flat", flat_build, latency, recall)
+
+    started = time.perf_counter()
+    hnsw = build_index(INDEX_HNSW, corpus, ids, dimension)
+    hnsw_build = time.perf_counter() - started
+    for ef_search in (16, 32, 64, 128, 256):
+        faiss.downcast_index(hnsw.index).hnsw.efSearch = ef_search
+        latency, recall = measure(hnsw, query_vectors, truth, top_k)
+        report(f"hnsw efSearch={ef_search}", hnsw_build, latency, recall)
+
+    started = time.perf_counter()
+    ivfpq = build_index(INDEX_IVFPQ, corpus, ids, dimension)
+    ivfpq_build = time.perf_counter() - started
+    for nprobe in (1, 4, 16, 64):
+        faiss.downcast_index(ivfpq.index).nprobe = nprobe
+        latency, recall = measure(ivfpq, query_vectors, truth, top_k)
+        report(f"ivfpq nprobe={nprobe}", ivfpq_build, latency, recall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000], help="index sizes to benchmark")
+    parser.add_argument("--dimension", type=int, default=settings.vector_dimension, help="vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="number of queries per configuration")
+    parser.add_argument("--top-k", type=int, default=10, help="neighbours per query (recall@k)")
+    args = parser.parse_args()
+
+    print(f"📚 faiss {faiss.__version__}, HNSW M={settings.vector_hnsw_m}, PQ m={settings.vector_pq_m}")
+    for count in args.sizes:
+        run(count, args.dimension, args.queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
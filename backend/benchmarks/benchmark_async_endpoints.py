@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Async Endpoint Load Test
+Holds open notification streams (Server-Sent Events) while concurrent
+clients call the messaging and time-tracking APIs of a running server, and
+reports API throughput and latency at each concurrency level together with
+how many stream events arrived and how many streams failed.
+
+Open streams cost an event-loop task each rather than a worker thread, so
+with the async endpoints API latency should stay flat as streams are added;
+run the same load against an earlier revision to compare.
+
+The tokens are signed with this process's SECRET_KEY, so run it with the
+server's environment, for users that exist in the server's database.
+
+Usage:
+    uvicorn app.main:app --port 8000 &
+    python benchmarks/benchmark_async_endpoints.py --email student@example.com \\
+        --streams 0 100 500 --concurrency 10 50 --requests 1000
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app.core.auth import create_access_token
+
+# Read-mostly request mix of a dashboard page
+API_PATHS = [
+    "/api/messaging/notifications?limit=20",
+    "/api/messaging/dashboard/summary",
+    "/api/messaging/messages?limit=20",
+    "/api/time-tracking/active",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+async def hold_stream(client: httpx.AsyncClient, token: str, counters: dict):
+    """Keep one notification stream open until cancelled, counting the events it receives"""
+    try:
+        async with client.stream("GET", "/api/messaging/notifications/stream", params={"token": token}) as response:
+            if response.status_code != 200:
+                counters["stream_errors"] += 1
+                return
+            counters["streams_open"] += 1
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    counters["events"] += 1
+        # The server ended the stream
+        counters["stream_errors"] += 1
+    except httpx.HTTPError:
+        counters["stream_errors"] += 1
+
+
+async def run_level(base_url: str, tokens, streams: int, concurrency: int, requests: int):
+    limits = httpx.Limits(max_connections=streams + concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        counters = {"streams_open": 0, "stream_errors": 0, "events": 0}
+        stream_tasks = [
+            asyncio.create_task(hold_stream(client, tokens[i % len(tokens)], counters))
+            for i in range(streams)
+        ]
+        # Let the streams connect before the API load starts
+        deadline = time.perf_counter() + 30
+        while counters["streams_open"] + counters["stream_errors"] < streams and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        latencies = []
+        failures = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(number: int):
+            nonlocal failures
+            headers = {"Authorization": f"Bearer {tokens[number % len(tokens)]}"}
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(random.choice(API_PATHS), headers=headers)
+                    if response.status_code >= 400:
+                        failures += 1
+                except httpx.HTTPError:
+                    failures += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(requests)))
+        elapsed = time.perf_counter() - started
+
+        for task in stream_tasks:
+            task.cancel()
+        await asyncio.gather(*stream_tasks, return_exceptions=True)
+
+    print(f"{streams:>8}{concurrency:>6}{requests / elapsed:>10.0f}"
+          f"{percentile(latencies, 0.5) * 1000:>9.1f}{percentile(latencies, 0.95) * 1000:>9.1f}"
+          f"{failures:>8}{counters['streams_open']:>8}{counters['stream_errors']:>9}{counters['events']:>8}")
+
+
+async def main_async(args):
+    tokens = [create_access_token({"sub": email}) for email in args.email]
+    print(f"{'streams':>8}{'conc':>6}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'errors':>8}{'open':>8}{'dropped':>9}{'events':>8}")
+    for streams in args.streams:
+        for concurrency in args.concurrency:
+            await run_level(args.base_url, tokens, streams, concurrency, args.requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", nargs="+", required=True, help="users to sign tokens for")
+    parser.add_argument("--streams", type=int, nargs="+", default=[0, 100, 500], help="open notification streams")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50], help="concurrent API clients")
+    parser.add_argument("--requests", type=int, default=1000, help="API requests per level")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Embedding Ingestion Benchmark
+Compares the legacy per-chunk ingestion loop with the batched
+SimpleDocumentEmbedder.embed_documents path on a synthetic corpus.
+
+Usage:
+    python benchmarks/benchmark_embedding.py --chunks 10000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import faiss
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services.simple_rag_service import SimpleDocumentEmbedder
+
+CHUNK_WORDS = 500
+CHUNK_OVERLAP = 50
+VOCABULARY = [
+    "excavator", "dumper", "operator", "hazard", "inspection", "ppe", "site", "load",
+    "reversing", "banksman", "gradient", "trench", "slew", "bucket", "tipping", "skip",
+    "emergency", "isolation", "permit", "exclusion", "zone", "visibility", "mirror",
+    "seatbelt", "rollover", "compaction", "utility", "cable", "survey", "supervisor",
+]
+
+
+def build_corpus(total_chunks: int, chunks_per_document: int, seed: int = 42):
+    """Build synthetic documents that split into roughly total_chunks chunks"""
+    rng = random.Random(seed)
+    words_per_document = (CHUNK_WORDS - CHUNK_OVERLAP) * chunks_per_document
+    documents = []
+    for doc_number in range(max(1, total_chunks // chunks_per_document)):
+        words = [rng.choice(VOCABULARY) + str(rng.randint(0, 400)) for _ in range(words_per_document)]
+        documents.append((" ".join(words), f"doc_{doc_number}", {"title": f"Workbook {doc_number}"}))
+    return documents
+
+
+def legacy_ingest(embedder: SimpleDocumentEmbedder, documents):
+    """Reproduce the original per-chunk loop: dict hashing, one add per chunk, save per document"""
+    dim = embedder.embedding_dim
+    store_path = Path(settings.vector_store_path)
+    index = faiss.IndexFlatIP(dim)
+    document_metadata = {}
+    total = 0
+    for content, document_id, metadata in documents:
+        for i, chunk in enumerate(embedder._chunk_text(content, CHUNK_WORDS, CHUNK_OVERLAP)):
+            word_counts = {}
+            for word in chunk.lower().split():
+                word_counts[word] = word_counts.get(word, 0) + 1
+            embedding = np.zeros(dim)
+            for word, count in word_counts.items():
+                embedding[hash(word) % dim] += count
+            norm = np.linalg.norm(embedding)
+            if norm > 0:
+                embedding = embedding / norm
+            index.add(embedding.astype('float32').reshape(1, -1))
+            document_metadata[f"{document_id}_chunk_{i}"] = {
+                "document_id": document_id,
+                "chunk_index": i,
+                "content": chunk,
+                "metadata": metadata,
+                "created_at": datetime.now().isoformat()
+            }
+            total += 1
+        faiss.write_index(index, str(store_path / "faiss_index.bin"))
+        with open(store_path / "metadata.json", 'w') as f:
+            json.dump(document_metadata, f, indent=2)
+    return total
+
+
+def batched_ingest(embedder: SimpleDocumentEmbedder, documents, batch_size: int):
+    """Ingest through embed_documents with one commit per batch"""
+    total = 0
+    for start in range(0, len(documents), batch_size):
+        total += embedder.embed_documents(documents[start:start + batch_size])
+    return total
+
+
+def run(label: str, ingest, documents, **kwargs):
+    with tempfile.TemporaryDirectory() as store_dir:
+        settings.vector_store_path = store_dir
+        embedder = SimpleDocumentEmbedder()
+        started = time.perf_counter()
+        chunks = ingest(embedder, documents, **kwargs)
+        elapsed = time.perf_counter() - started
+    rate = chunks / elapsed if elapsed else float("inf")
+    print(f"{label:<10} {chunks:>7} chunks  {elapsed:8.2f}s  {rate:10.1f} chunks/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="approximate number of chunks to ingest")
+    parser.add_argument("--chunks-per-document", type=int, default=50, help="chunks per synthetic document (~300 pages at 50)")
+    parser.add_argument("--batch-size", type=int, default=20, help="documents per embed_documents call")
+    parser.add_argument("--skip-legacy", action="store_true", help="only run the batched path")
+    args = parser.parse_args()
+
+    documents = build_corpus(args.chunks, args.chunks_per_document)
+    print(f"📚 Synthetic corpus: {len(documents)} documents, dim={settings.vector_dimension}, faiss {faiss.__version__}")
+
+    before = None if args.skip_legacy else run("before", legacy_ingest, documents)
+    after = run("after", batched_ingest, documents, batch_size=args.batch_size)
+    if before:
+        print(f"⚡ Speed-up: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+LLM Client Load Test
+Runs concurrent content generations through SimpleAIContentGenerator against
+a local stub chat-completions server, and reports throughput, latency,
+retries, coalesced requests and event-loop lag at each concurrency level.
+
+Usage:
+    python benchmarks/benchmark_llm_client.py --concurrency 1 10 50 200 --latency 0.5
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services import llm_client
+from app.services.simple_ai_generator import SimpleAIContentGenerator
+
+
+def start_stub_server(latency: float, error_rate: float) -> ThreadingHTTPServer:
+    """Chat-completions stub: sleeps for the given latency, fails a fraction with 503"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            if random.random() < error_rate:
+                payload, status = b'{"error": "overloaded"}', 503
+            else:
+                payload = json.dumps({
+                    "model": body["model"],
+                    "choices": [{"message": {"role": "assistant", "content": "# Stub content\n" + body["messages"][-1]["content"][:200]}}]
+                }).encode()
+                status = 200
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def measure_loop_lag(stop: asyncio.Event, samples: list):
+    """Record how late a 10ms timer fires; a blocked loop shows up here"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - started - 0.01)
+
+
+async def run_level(concurrency: int, requests: int, duplicate_rate: float):
+    generator = SimpleAIContentGenerator()
+    client = llm_client.get_llm_client()
+    client.stats = dict.fromkeys(client.stats, 0)
+    latencies, lag = [], []
+    failures = 0
+
+    async def one(number: int):
+        nonlocal failures
+        # A share of requests repeat an earlier prompt, as when instructors retry a generation
+        topic = random.randrange(max(1, number)) if random.random() < duplicate_rate else number
+        started = time.perf_counter()
+        result = await generator.generate_learning_material(f"Workbook section {topic}", f"Topic {topic}", "Load test")
+        latencies.append(time.perf_counter() - started)
+        if result.get("ai_model") == "mock_generator":
+            failures += 1
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(number: int):
+        async with semaphore:
+            await one(number)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(bounded(n) for n in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{concurrency:>6} {requests / elapsed:10.1f} {p50 * 1000:9.0f} {p95 * 1000:9.0f} "
+          f"{client.stats['requests']:>9} {client.stats['coalesced']:>9} {client.stats['retries']:>8} "
+          f"{failures:>8} {max(lag) * 1000:9.1f}")
+
+
+async def main_async(args):
+    print(f"{'conc':>6} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'upstream':>9} {'coalesced':>9} "
+          f"{'retries':>8} {'failed':>8} {'lag ms':>9}")
+    for concurrency in args.concurrency:
+        await run_level(concurrency, max(args.requests, concurrency * 2), args.duplicate_rate)
+    await llm_client.close_llm_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100], help="concurrent generations")
+    parser.add_argument("--requests", type=int, default=100, help="generations per level (at least 2x concurrency)")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub completion latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="fraction of stub responses that are 503s")
+    parser.add_argument("--duplicate-rate", type=float, default=0.1, help="fraction of requests repeating a prompt")
+    parser.add_argument("--max-concurrency", type=int, default=settings.ai_max_concurrency, help="client concurrency limit")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.latency, args.error_rate)
+    settings.ai_api_base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    settings.openai_api_key = "stub"
+    settings.ai_max_concurrency = args.max_concurrency
+    settings.ai_retry_backoff = 0.05
+    print(f"🧪 Stub server on port {server.server_port}: latency {args.latency}s, "
+          f"{args.error_rate:.0%} errors, client limit {args.max_concurrency}")
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
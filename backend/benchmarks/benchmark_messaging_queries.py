@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Messaging Query Count Check
+Seeds an in-memory SQLite database with users, courses, messages, Q&A posts,
+replies and votes, then counts the SQL statements the messaging and Q&A
+formatters issue for pages of increasing size. The count must not grow with
+the page size; the script exits non-zero if it does, or if it exceeds the
+pinned maximum, so it can run as a regression check. The formatters run on
+an AsyncSession over aiosqlite, as the endpoints do.
+
+Usage:
+    python benchmarks/benchmark_messaging_queries.py --pages 1 10 50
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.database import Base
+from app.models.user import User
+from app.models.course import Course
+from app.models.messaging import Message, QAPost, QAVote, Notification
+from app.api.messaging import (
+    _format_message_responses, _format_qa_post_responses, _format_notification_responses
+)
+
+# Pinned statement counts per page, independent of the page size
+EXPECTED_QUERIES = {
+    "messages": 3,  # users, courses, reply counts
+    "qa_posts": 3,  # authors, courses, the user's votes
+    "notifications": 1,  # courses
+}
+
+
+def seed(db, posts: int, users: int = 40):
+    """Create enough rows that every page has distinct related data"""
+    db.add_all([User(email=f"user{i}@example.com", hashed_password="x", role="student") for i in range(users)])
+    db.flush()
+    db.add_all([Course(title=f"Course {i}", instructor_id=1) for i in range(5)])
+    db.flush()
+
+    for i in range(posts):
+        course_id = i % 5 + 1
+        sender, recipient = random.sample(range(1, users + 1), 2)
+        message = Message(sender_id=sender, recipient_id=recipient, subject=f"Subject {i}",
+                          content="Hello", course_id=course_id)
+        post = QAPost(course_id=course_id, author_id=sender, title=f"Question {i}",
+                      content="How?", post_type="question")
+        db.add_all([message, post, Notification(user_id=1, title=f"Note {i}", content="c",
+                                                notification_type="qa_reply", course_id=course_id)])
+        db.flush()
+        db.add_all([Message(sender_id=recipient, recipient_id=sender, subject="Re", content="Hi",
+                            parent_message_id=message.id)])
+        db.add_all([QAPost(course_id=course_id, author_id=recipient, title="Answer", content="Like this",
+                           post_type="answer", parent_post_id=post.id)])
+        votes = [QAVote(post_id=post.id, user_id=voter, vote_type=random.choice(["up", "down"]))
+                 for voter in random.sample(range(1, users + 1), 5)]
+        db.add_all(votes)
+        post.upvotes = sum(vote.vote_type == "up" for vote in votes)
+        post.downvotes = len(votes) - post.upvotes
+        post.reply_count = 1
+    db.commit()
+
+
+async def run(pages) -> bool:
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    db = async_sessionmaker(engine, expire_on_commit=False)()
+    await db.run_sync(seed, max(pages))
+
+    statements = []
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    async def page_of(query):
+        return (await db.scalars(query)).all()
+
+    loaders = {
+        "messages": lambda n: page_of(select(Message).where(Message.parent_message_id.is_(None)).limit(n)),
+        "qa_posts": lambda n: page_of(select(QAPost).where(QAPost.parent_post_id.is_(None)).limit(n)),
+        "notifications": lambda n: page_of(select(Notification).limit(n)),
+    }
+    format_page = {
+        "messages": lambda rows: _format_message_responses(rows, db),
+        "qa_posts": lambda rows: _format_qa_post_responses(rows, 1, db),
+        "notifications": lambda rows: _format_notification_responses(rows, db),
+    }
+
+    failed = False
+    print(f"{'formatter':<15}{'page':>6}{'queries':>9}{'ms':>9}")
+    for name, load in loaders.items():
+        counts = set()
+        for page in pages:
+            db.expire_all()
+            rows = await load(page)
+            del statements[:]
+            started = time.perf_counter()
+            responses = await format_page[name](rows)
+            elapsed = (time.perf_counter() - started) * 1000
+            queries = len(statements)
+            counts.add(queries)
+            print(f"{name:<15}{len(responses):>6}{queries:>9}{elapsed:>9.1f}")
+            if queries > EXPECTED_QUERIES[name]:
+                print(f"  expected at most {EXPECTED_QUERIES[name]} queries")
+                failed = True
+        if len(counts) > 1:
+            print(f"  query count of {name} grows with the page size")
+            failed = True
+
+    await db.close()
+    await engine.dispose()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    sys.exit(1 if asyncio.run(run(args.pages)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Analytics Rollup Checks
+Regression checks for the cumulative per-course figures: an enrollment
+created before the computed days and completed during them must count
+as a completion from its completion day only, whether the days are
+computed live or read back from an incremental rollup.
+
+Exits 1 if any check fails.
+
+Usage:
+    python benchmarks/check_analytics_rollup.py
+"""
+
+import os
+import sys
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.models.course import Course
+from app.models.learning import Enrollment
+from app.models.user import User
+from app.services import analytics_rollup
+from app.services.analytics_rollup import compute_course_days, course_days, run_rollup, utc_today
+
+DAY = utc_today() - timedelta(days=3)  # day 0; day +1 is still a complete day
+
+
+def at(offset: int) -> datetime:
+    return datetime.combine(DAY + timedelta(days=offset), time(12))
+
+
+def seed(db):
+    """One enrollment created on day -1 and completed on day +1, another created on day 0"""
+    db.execute(insert(User), [
+        {"email": f"user{i}@example.com", "hashed_password": "x", "role": "student",
+         "is_active": True, "created_at": at(-2)}
+        for i in range(2)
+    ])
+    db.execute(insert(Course), [{"title": "Course", "instructor_id": 1, "is_active": True,
+                                 "status": "published", "created_at": at(-2)}])
+    db.execute(insert(Enrollment), [
+        {"user_id": 1, "course_id": 1, "status": "completed", "created_at": at(-1), "updated_at": at(1)},
+        {"user_id": 2, "course_id": 1, "status": "active", "created_at": at(0), "updated_at": None},
+    ])
+    db.commit()
+
+
+# (label, day offset, field, expected value)
+CASES = [
+    ("day 0 completions", 0, "completions", 0),
+    ("day 0 total enrollments", 0, "total_enrollments", 2),
+    ("day +1 completions", 1, "completions", 1),
+    ("day +1 completion rate", 1, "completion_rate", 50.0),
+]
+
+
+def main():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    seed(db)
+
+    failed = False
+    live = compute_course_days(db, DAY, DAY + timedelta(days=2))
+    # Roll up to day 0 first, so the next run starts after the enrollment was created
+    with mock.patch.object(analytics_rollup, "utc_today", lambda: DAY + timedelta(days=1)):
+        run_rollup(db)
+    run_rollup(db)
+    rolled_up = course_days(db, DAY, DAY + timedelta(days=2))
+    for source, days in (("live", live), ("rollup", rolled_up)):
+        for label, offset, field, expected in CASES:
+            actual = days.get((1, DAY + timedelta(days=offset)), {}).get(field)
+            ok = actual == expected
+            failed = failed or not ok
+            print(f"  {source:<7} {label:<28} expected {expected!s:<5} got {actual!s:<5} {'ok' if ok else 'FAIL'}")
+    db.close()
+    engine.dispose()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
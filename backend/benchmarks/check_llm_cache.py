@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+LLM Response Cache Checks
+Regression checks for the semantic tier of the response cache: a prompt
+that differs from a cached one by a word must be served from the cache
+within the same scope, and never across scopes, i.e. when the system
+prompt, generation params (max_tokens), namespace or content type differ.
+The same scoping holds for LLMClient's streaming and non-streaming calls:
+they share an entry only when the whole scope matches.
+
+Exits 1 if any check fails.
+
+Usage:
+    python benchmarks/check_llm_cache.py
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+from unittest import mock
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services import llm_cache
+from app.services.llm_cache import ResponseCache
+from app.services.llm_client import LLMClient
+
+MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "You are an expert construction training assessment creator."
+PROMPT = ("Create a knowledge test for the course Working at Height covering ladders, scaffolds, "
+          "harness inspection, rescue plans and exclusion zones for operatives on site.")
+# Same request with a word added; close enough for the semantic tier
+NEAR_PROMPT = PROMPT + " Thanks."
+
+
+def messages(prompt: str, system_prompt: str = SYSTEM_PROMPT):
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+
+
+# (label, lookup arguments, whether the cached response may be served)
+CASES = [
+    ("near-identical prompt, same scope",
+     dict(messages=messages(NEAR_PROMPT)), True),
+    ("different system prompt",
+     dict(messages=messages(NEAR_PROMPT, "You are a strict examiner. Answer in French.")), False),
+    ("different max_tokens",
+     dict(messages=messages(NEAR_PROMPT), params={"max_tokens": 500}), False),
+    ("different namespace",
+     dict(messages=messages(NEAR_PROMPT), namespace="course:2"), False),
+    ("different content type",
+     dict(messages=messages(NEAR_PROMPT), content_type="lesson_plan"), False),
+]
+
+
+# (label, streamed call arguments, whether the completion's response may be served);
+# the stream asks with NEAR_PROMPT, so only a matching scope can serve it
+CLIENT_CASES = [
+    ("stream, same scope as completion",
+     dict(), True),
+    ("stream, different max_tokens",
+     dict(max_tokens=500), False),
+    ("stream, different namespace",
+     dict(namespace="simple_ai_generator"), False),
+]
+
+
+async def client_calls(overrides):
+    """Complete a request, then stream a near-identical one with overrides; the streamed text"""
+    client = LLMClient(api_key="")
+
+    async def chat(*args, **kwargs):
+        return {"choices": [{"message": {"content": "completed"}}]}
+
+    async def stream_chat(*args, **kwargs):
+        yield "streamed"
+
+    request = dict(content_type="knowledge_test", model=MODEL, max_tokens=3000, temperature=0.7,
+                   namespace="ai_content_generator")
+    with mock.patch.object(client, "chat", chat), mock.patch.object(client, "stream_chat", stream_chat):
+        await client.complete(PROMPT, SYSTEM_PROMPT, **request)
+        request.update(overrides)
+        streamed = "".join([delta async for delta in client.stream_complete(NEAR_PROMPT, SYSTEM_PROMPT, **request)])
+    await client.aclose()
+    return streamed
+
+
+def report(label, should_hit, hit):
+    ok = hit == should_hit
+    expected = "hit" if should_hit else "miss"
+    actual = "hit" if hit else "miss"
+    print(f"  {label:<36} expected {expected:<5} got {actual:<5} {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    settings.llm_cache_semantic = True
+    failed = False
+    with tempfile.TemporaryDirectory() as path:
+        cache = ResponseCache(os.path.join(path, "llm_cache.sqlite3"))
+        cache.store(MODEL, 0.7, messages(PROMPT), "knowledge_test", "cached test", 1000.0,
+                    params={"max_tokens": 3000}, namespace="course:1")
+
+        for label, overrides, should_hit in CASES:
+            request = dict(messages=messages(PROMPT), content_type="knowledge_test",
+                           params={"max_tokens": 3000}, namespace="course:1")
+            request.update(overrides)
+            served = cache.lookup(MODEL, 0.7, request["messages"], request["content_type"],
+                                  request["params"], request["namespace"])
+            failed = not report(label, should_hit, served is not None) or failed
+
+        for n, (label, overrides, should_hit) in enumerate(CLIENT_CASES):
+            client_cache = ResponseCache(os.path.join(path, f"client_cache{n}.sqlite3"))
+            with mock.patch.object(llm_cache, "get_response_cache", lambda: client_cache), \
+                    mock.patch("app.services.llm_client.get_response_cache", lambda: client_cache):
+                streamed = asyncio.run(client_calls(overrides))
+            failed = not report(label, should_hit, streamed == "completed") or failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Vector Store Consistency Checks
+Regression checks for the on-disk vector store that need real FAISS
+indexes rather than a benchmark run:
+
+  crash    a save that dies after writing the index but before committing
+           the chunk table must not let the orphaned vectors resolve to the
+           chunks that reuse their ids after a restart
+  export   exported documents carry the exact vectors they were added
+           with, whatever the index type (IVF-PQ only keeps lossy codes)
+  rebuild  a promotion (flat -> hnsw/ivfpq) or compaction (hnsw) still
+           completes when another worker commits while the new index is
+           being trained
+  upgrade  a store written before chunk vectors were kept gets them
+           backfilled from its index on first open
+
+Exits 1 if any check fails.
+
+Usage:
+    python benchmarks/check_vector_store.py --kinds flat hnsw ivfpq
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+from unittest import mock
+
+import numpy as np
+import faiss
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.services import vector_store
+from app.services.vector_store import (
+    INDEX_FLAT, INDEX_HNSW, INDEX_IVFPQ, ChunkTable, VectorStore, build_index, index_kind
+)
+
+DIMENSION = 32
+BASE_DOCUMENTS = 8
+BASE_CHUNKS = 1250
+
+
+def unit_vectors(count: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def chunks(document_id: str, count: int):
+    return [f"{document_id} chunk {i}" for i in range(count)]
+
+
+def new_store(path: str, kind: str) -> VectorStore:
+    """Store at path whose index is of the given kind, with some committed documents"""
+    store = VectorStore(path, DIMENSION)
+    with store.transaction():
+        for n in range(BASE_DOCUMENTS):
+            store.add_document(f"base{n}", {}, chunks(f"base{n}", BASE_CHUNKS), unit_vectors(BASE_CHUNKS, seed=n))
+        if kind != INDEX_FLAT:
+            ids = np.arange(len(store.chunks), dtype='int64')
+            store.index = build_index(kind, store.chunks.vectors(ids), ids, DIMENSION)
+    return store
+
+
+def check_crash(path: str, kind: str):
+    """Orphaned vectors from an interrupted save are dropped on the next load"""
+    store = new_store(path, kind)
+    committed = len(store.chunks)
+    lost = unit_vectors(5, seed=100)
+
+    # Die between the index write and the manifest commit
+    with mock.patch.object(ChunkTable, "save", side_effect=OSError("simulated crash")):
+        try:
+            with store.transaction():
+                store.add_document("lost", {}, chunks("lost", 5), lost)
+        except OSError:
+            pass
+    store.chunks.close()
+
+    restarted = VectorStore(path, DIMENSION)
+    with restarted.transaction():
+        restarted.add_document("fresh", {}, chunks("fresh", 5), unit_vectors(5, seed=200))
+
+    failures = []
+    if restarted.chunks.document_chunk_ids("fresh")[0] != committed:
+        failures.append("fresh chunks did not reuse the orphaned ids")
+    for vector in lost:
+        for result in restarted.search(vector, top_k=3):
+            if result["document_id"] == "fresh" and result["score"] > 0.9:
+                failures.append(f"orphaned vector resolved to {result['content']!r}")
+    ids = faiss.vector_to_array(restarted.index.id_map)
+    if len(ids) != committed + 5:
+        failures.append(f"index holds {len(ids)} vectors, expected {committed + 5}")
+    restarted.chunks.close()
+    return failures
+
+
+def check_export(path: str, kind: str):
+    """Exported vectors are the ones added, not read back from the index"""
+    store = new_store(path, kind)
+    exported = {}
+    for document_id in ("base0", "base3"):
+        exported[document_id] = store.export_document(document_id)
+    store.chunks.close()
+
+    # Also after a reload from disk
+    reopened = VectorStore(path, DIMENSION)
+    failures = []
+    for n in (0, 3):
+        document_id = f"base{n}"
+        for label, (texts, vectors) in (("in memory", exported[document_id]),
+                                        ("reloaded", reopened.export_document(document_id))):
+            if texts != chunks(document_id, BASE_CHUNKS):
+                failures.append(f"{document_id} {label}: chunk texts differ")
+            if not np.array_equal(vectors, unit_vectors(BASE_CHUNKS, seed=n)):
+                failures.append(f"{document_id} {label}: vectors differ from the ones added")
+    reopened.chunks.close()
+    return failures
+
+
+def check_rebuild(path: str, kind: str):
+    """A rebuild still swaps in its index when the store was reloaded mid-build"""
+    if kind == INDEX_FLAT:
+        return []  # Flat shards are only ever the source of a promotion
+
+    source_kind = INDEX_HNSW if kind == INDEX_HNSW else INDEX_FLAT
+    store = new_store(path, source_kind)
+    if kind == INDEX_HNSW:
+        # Compaction: leave more than a fifth of the graph dead
+        with store.transaction():
+            for n in range(BASE_DOCUMENTS // 4 + 1):
+                store.remove_document(f"base{n}")
+    if store._rebuild_target() != kind:
+        return [f"store does not want a {kind} rebuild (wants {store._rebuild_target()})"]
+
+    other_worker = VectorStore(path, DIMENSION)
+    late = unit_vectors(5, seed=300)
+
+    def build_while_another_worker_commits(*args):
+        with other_worker.transaction():
+            other_worker.add_document("late", {}, chunks("late", 5), late)
+        return build_index(*args)
+
+    with mock.patch.object(vector_store, "build_index", build_while_another_worker_commits):
+        store._rebuild(kind)
+
+    failures = []
+    if index_kind(store.index) != kind:
+        failures.append(f"index is still {index_kind(store.index)}")
+    live = store.chunks.live_count()
+    if store.index.ntotal != live:
+        failures.append(f"index holds {store.index.ntotal} vectors for {live} live chunks")
+    results = store.search(late[0], top_k=1)
+    if not results or results[0]["document_id"] != "late":
+        failures.append("chunk committed during the build is not searchable")
+    store.chunks.close()
+    other_worker.chunks.close()
+    return failures
+
+
+def check_upgrade(path: str, kind: str):
+    """Chunk vectors are backfilled from the index of a store that predates them"""
+    store = new_store(path, kind)
+    store.chunks.close()
+    manifest_path = os.path.join(path, ChunkTable.MANIFEST_FILE)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest["version"] = 3
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    os.remove(os.path.join(path, ChunkTable.VECTORS_FILE))
+
+    upgraded = VectorStore(path, DIMENSION)
+    failures = []
+    if not upgraded.chunks.has_vectors:
+        failures.append("chunk vectors were not backfilled")
+    else:
+        ids = upgraded.chunks.document_chunk_ids("base1")
+        vectors = upgraded.chunks.vectors(ids)
+        expected = unit_vectors(BASE_CHUNKS, seed=1)
+        # IVF-PQ keeps only approximate codes, so its backfill can only be close
+        tolerance = 0.5 if kind == INDEX_IVFPQ else 1e-6
+        error = float(np.abs(vectors - expected).max())
+        if error > tolerance:
+            failures.append(f"backfilled vectors are off by up to {error:.3f}")
+        with upgraded.transaction():
+            upgraded.add_document("after", {}, chunks("after", 5), unit_vectors(5, seed=400))
+        texts, vectors = upgraded.export_document("after")
+        if not np.array_equal(vectors, unit_vectors(5, seed=400)):
+            failures.append("vectors added after the upgrade differ")
+    upgraded.chunks.close()
+    return failures
+
+
+CHECKS = {"crash": check_crash, "export": check_export, "rebuild": check_rebuild, "upgrade": check_upgrade}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", nargs="+", default=[INDEX_FLAT, INDEX_HNSW, INDEX_IVFPQ])
+    parser.add_argument("--checks", nargs="+", default=list(CHECKS))
+    args = parser.parse_args()
+
+    failed = False
+    for kind in args.kinds:
+        for name in args.checks:
+            settings.vector_index_type = kind
+            settings.vector_promote_threshold = 0
+            # Rebuilds are run explicitly, not in background threads
+            with tempfile.TemporaryDirectory() as path, \
+                    mock.patch.object(VectorStore, "_schedule_rebuild", lambda self: None):
+                failures = CHECKS[name](path, kind)
+            for failure in failures:
+                print(f"  {kind:<6} {name:<8} FAIL: {failure}")
+            if not failures:
+                print(f"  {kind:<6} {name:<8} ok")
+            failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ Initializes vector stores, tests AI services, and sets up sample data
 
 import os
 import sys
+import asyncio
 from pathlib import Path
 from sqlalchemy.orm import Session
 
@@ -16,6 +17,7 @@ from app.core.database import get_db
 from app.services.rag_service import RAGService, DocumentEmbedder
 from app.services.ai_content_generator import AIContentGenerator
 from app.services.knowledge_tests import KnowledgeTestGenerator
+from app.services.llm_client import close_llm_client
 from app.core.config import settings
 
 def initialize_vector_store():
@@ -39,7 +41,9 @@ def initialize_vector_store():
 def test_ai_content_generation():
     """Test AI content generation with sample data"""
     print("\n🧪 Testing AI content generation...")
-    
+    return asyncio.run(_test_ai_content_generation())
+
+async def _test_ai_content_generation():
     try:
         generator = AIContentGenerator()
         
@@ -60,7 +64,7 @@ def test_ai_content_generation():
         Working at height requires special safety measures.
         """
         
-        result = generator.generate_learning_material(
+        result = await generator.generate_learning_material(
             original_content=sample_content,
             title="Construction Safety Fundamentals",
             description="Basic safety principles for construction workers",
@@ -73,7 +77,7 @@ def test_ai_content_generation():
             print("⚠️  Learning material generation using mock data")
         
         # Test knowledge test generation
-        test_result = generator.generate_knowledge_test(
+        test_result = await generator.generate_knowledge_test(
             original_content=sample_content,
             title="Construction Safety Test",
             description="Test knowledge of construction safety principles",
@@ -91,6 +95,9 @@ def test_ai_content_generation():
     except Exception as e:
         print(f"❌ Error testing AI content generation: {e}")
         return False
+    finally:
+        # The pooled client belongs to this event loop, which asyncio.run closes
+        await close_llm_client()
 
 def test_rag_service():
     """Test RAG service functionality"""
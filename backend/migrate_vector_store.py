@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Vector Store Migration Script
+Converts data/vector_store/metadata.json into the memory-mapped chunk store
+and optionally splits it into per-course shards
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+
+# Add the app directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.services.vector_store import VectorStore, ChunkTable, migrate_json_metadata, build_course_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert metadata.json to the memory-mapped chunk store")
+    parser.add_argument("path", nargs="?", default=settings.vector_store_path, help="vector store directory")
+    parser.add_argument("--split-shards", action="store_true",
+                        help="also copy every document into its per-course shard")
+    args = parser.parse_args()
+
+    store_path = Path(args.path)
+    settings.vector_store_path = str(store_path)
+    print(f"🔧 Migrating vector store in {store_path}")
+
+    if ChunkTable.exists(store_path):
+        print("✅ Already migrated - chunk store present")
+    elif not (store_path / VectorStore.LEGACY_METADATA_FILE).exists():
+        print("❌ No metadata.json found")
+        return False
+    else:
+        try:
+            migrated = migrate_json_metadata(store_path, settings.vector_dimension)
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            return False
+        print(f"✅ Migrated {migrated} chunks (original kept as metadata.json.bak)")
+
+    if args.split_shards:
+        print("🔧 Splitting global shard into course shards...")
+        for shard, chunks in build_course_shards(settings.vector_dimension).items():
+            print(f"   {shard}: {chunks} chunks")
+        print("✅ Course shards built")
+
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
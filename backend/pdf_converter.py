@@ -5,12 +5,16 @@ Converts PDF files to web-friendly HTML content for the learning platform.
 """
 
 import os
+import sys
 import json
-import pdfplumber
 from pathlib import Path
 from typing import List, Dict, Any
 import re
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.pdf_extraction import iter_pdf_pages
+
 class PDFToWebConverter:
     def __init__(self, pdf_path: str, output_dir: str = "converted_content"):
         self.pdf_path = pdf_path
@@ -22,35 +26,30 @@ class PDFToWebConverter:
         content_sections = []
         
         try:
-            with pdfplumber.open(self.pdf_path) as pdf:
-                print(f"Processing PDF with {len(pdf.pages)} pages...")
+            for page_num, text in iter_pdf_pages(self.pdf_path):
+                print(f"Processing page {page_num}...")
+                
+                if not text:
+                    continue
+                
+                # Clean and structure the text
+                cleaned_text = self._clean_text(text)
                 
-                for page_num, page in enumerate(pdf.pages, 1):
-                    print(f"Processing page {page_num}...")
-                    
-                    # Extract text
-                    text = page.extract_text()
-                    if not text:
-                        continue
-                    
-                    # Clean and structure the text
-                    cleaned_text = self._clean_text(text)
-                    
-                    # Split into sections (you can customize this logic)
-                    sections = self._split_into_sections(cleaned_text)
-                    
-                    for section in sections:
-                        if section.strip():
-                            content_sections.append({
-                                "page": page_num,
-                                "title": self._extract_title(section),
-                                "content": section,
-                                "type": "text",
-                                "order": len(content_sections) + 1
-                            })
+                # Split into sections (you can customize this logic)
+                sections = self._split_into_sections(cleaned_text)
                 
-                print(f"Extracted {len(content_sections)} content sections")
-                return content_sections
+                for section in sections:
+                    if section.strip():
+                        content_sections.append({
+                            "page": page_num,
+                            "title": self._extract_title(section),
+                            "content": section,
+                            "type": "text",
+                            "order": len(content_sections) + 1
+                        })
+            
+            print(f"Extracted {len(content_sections)} content sections")
+            return content_sections
                 
         except Exception as e:
             print(f"Error processing PDF: {e}")
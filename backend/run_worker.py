@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Background job worker runner
+Processes queued document, content generation and test jobs
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+from pathlib import Path
+
+# Add the current directory to Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+
+def run_worker():
+    """Run one worker until interrupted"""
+    from app.services.job_queue import JobWorker
+
+    worker = JobWorker()
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+def main():
+    """Main function to start the workers"""
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--backend", choices=["database", "redis"], help="Override JOB_QUEUE_BACKEND")
+    args = parser.parse_args()
+
+    if args.backend:
+        os.environ["JOB_QUEUE_BACKEND"] = args.backend
+
+    print(f"🚀 Starting {args.processes} job worker(s)")
+
+    if args.processes == 1:
+        run_worker()
+        return
+
+    processes = [multiprocessing.Process(target=run_worker) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()